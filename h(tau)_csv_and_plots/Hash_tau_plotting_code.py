@@ -9,18 +9,23 @@ Created on Tue Oct 11 17:11:18 2022
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import interpolate
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "simulation_cods"))
+from hash_tau import hash_of_tau, TABLE_FILE
 
-opened_data = pd.read_csv("tau_hash.csv", header=None)
-tau = opened_data[0]
-hash_d = opened_data[1]
 new_tau = np.linspace(0.0000000999999999999999,1000,100000)
 fig, ax = plt.subplots()
-fit = interpolate.interp1d(tau, hash_d, kind = 'cubic')
 plt.title("Hash function vs Linguistic Temperature (Fitted)")
 plt.xlabel("Hash Function H(\u03C4)")
 plt.ylabel("Linguistic Temperature \u03C4")
-plt.plot(tau,hash_d, "o", new_tau, fit(new_tau), "-")
+#H(tau) is evaluated directly, the tabulated points are only drawn over it
+#when a table was written with hash_tau.generate_table()
+if os.path.exists(TABLE_FILE):
+    opened_data = pd.read_csv(TABLE_FILE, header=None)
+    plt.plot(opened_data[0], opened_data[1], "o")
+plt.plot(new_tau, hash_of_tau(new_tau), "-")
 plt.savefig("HashTau.png", dpi=1000)
 plt.show()
\ No newline at end of file
@@ -3,52 +3,76 @@
 """
 Created on Wed Oct 26 11:12:05 2022
 
+Frequency of features against isogloss density at tau = 0.1 and tau = 1.
+The measured points are read from the result cache, so the figure is redrawn
+from the stored runs without simulating. Only points of one kind of run are
+used, the longest runs on the largest grid with the engine that has most of
+them, averaged over the realizations at each frequency of features.
+Without any runs at a temperature in the cache the points of the
+dissertation are plotted.
 @author: qinohr
 """
 
-import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib import colors
 import numpy as np
-import matplotlib.collections as mc
-from scipy import interpolate
-import imageio
-import os
-
-def fitting_tau_and_hash(tau_point):
-    opened_data = pd.read_csv("tau_hash.csv", header=None)
-    tau = opened_data[0]
-    hash_d = opened_data[1]
-    #new_tau = np.linspace(0.0000000999999999999999,1000,100000)
-    #fig, ax = plt.subplots()
-    fit = interpolate.interp1d(tau, hash_d, kind = 'cubic')
-    #plt.plot(tau,hash_d, "o", new_tau, fit(new_tau), "-")
-    #plt.show()
-    return float(fit(tau_point))
+from hash_tau import hash_of_tau
+import result_cache
+
+TAUS = (0.1, 1)
+# Measured for the dissertation, used when the cache has no runs at a tau
+DISSERTATION_POINTS = {0.1: ([0, 0.248, 0.502, 0.752, 1],
+                             [0, 0.241, 0.322, 0.240, 0]),
+                       1: ([0, 0.251, 0.501, 0.750, 1],
+                           [0, 0.324, 0.432, 0.324, 0])}
 
 def isogloss(hash_v, frequency):
-    
+
     iso = 2*hash_v*frequency*(1-frequency)
     return iso
-    
-
-rho_01 = [0, 0.248, 0.502, 0.752, 1]
-iso_01 = [0, 0.241, 0.322, 0.240, 0]
-rho_1 = [0, 0.251, 0.501, 0.750, 1]
-iso_1 = [0, 0.324, 0.432, 0.324, 0]
-freqs = np.linspace(0,1,10000)
-fit_01 = fitting_tau_and_hash(0.1)
-fit_1 = fitting_tau_and_hash(1)
-
-fig, ax = plt.subplots()
-plt.xlabel("Frequency of Features")
-plt.ylabel("Isogloss Density")
-plt.title("Frequency of Features against Isogloss Desity")
-
-plt.plot(rho_01, iso_01, "o", label="Tau = 0.1") 
-plt.plot(rho_1, iso_1, "x", label="Tau = 1")
-plt.plot(freqs, isogloss(fit_01, freqs), "-")
-plt.plot(freqs, isogloss(fit_1, freqs), "-")
-plt.legend(loc=0)
-plt.savefig("Results_graph", dpi=300)
-plt.show()
\ No newline at end of file
+
+def measured_points(table, tau, grid_size=None, sweeps=None, engine=None):
+    """
+    Measured frequency of features and isogloss density at a temperature,
+    or None when the cache has no runs at it. The grid size, sweeps and
+    engine can be chosen, otherwise those of the most thorough runs are.
+    """
+    if len(table) == 0:
+        return None
+    points = table[np.isclose(table["tau"], tau, rtol=1e-9)]
+    for name, value in (("grid_size", grid_size), ("sweeps", sweeps),
+                        ("engine", engine)):
+        if value is not None:
+            points = points[points[name] == value]
+    if len(points) == 0:
+        return None
+    points = points[points["grid_size"] == points["grid_size"].max()]
+    points = points[points["sweeps"] == points["sweeps"].max()]
+    engine = points["engine"].value_counts().index[0]
+    points = points[points["engine"] == engine]
+    averages = points.groupby("rho")[["frequency", "isogloss"]].mean()
+    return averages["frequency"].to_numpy(), averages["isogloss"].to_numpy()
+
+def main():
+    table = result_cache.measurements()
+    freqs = np.linspace(0,1,10000)
+    fits = hash_of_tau(np.array(TAUS, dtype=float))
+
+    fig, ax = plt.subplots()
+    plt.xlabel("Frequency of Features")
+    plt.ylabel("Isogloss Density")
+    plt.title("Frequency of Features against Isogloss Desity")
+
+    for tau, marker, fit in zip(TAUS, ("o", "x"), fits):
+        points = measured_points(table, tau)
+        if points is None:
+            print("No runs at tau =", tau, "in the cache, plotting the "
+                  "dissertation points")
+            points = DISSERTATION_POINTS[tau]
+        plt.plot(points[0], points[1], marker, label="Tau = " + str(tau))
+        plt.plot(freqs, isogloss(fit, freqs), "-")
+    plt.legend(loc=0)
+    plt.savefig("Results_graph", dpi=300)
+    plt.show()
+
+if __name__ == "__main__":
+    main()
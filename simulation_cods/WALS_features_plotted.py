@@ -3,44 +3,25 @@
 """
 Created on Thu Oct 27 14:44:59 2022
 
+WALS features on the curves of isogloss density against frequency of
+features. The frequencies and isogloss densities of the features are read
+from the latest fit of wals_pipeline.py in the result cache that has all of
+them. Without one the values measured for the dissertation are plotted.
 @author: qinohr
 """
 
-
-import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib import colors
 import numpy as np
-import matplotlib.collections as mc
-from scipy import interpolate
-import imageio
-import os
-
-def fitting_tau_and_hash(tau_point):
-    opened_data = pd.read_csv("tau_hash.csv", header=None)
-    tau = opened_data[0]
-    hash_d = opened_data[1]
-    #new_tau = np.linspace(0.0000000999999999999999,1000,100000)
-    #fig, ax = plt.subplots()
-    fit = interpolate.interp1d(tau, hash_d, kind = 'cubic')
-    #plt.plot(tau,hash_d, "o", new_tau, fit(new_tau), "-")
-    #plt.show()
-    return float(fit(tau_point))
-
-def reverse_fit(hash_point):
-    
-    opened_data = pd.read_csv("tau_hash.csv", header=None)
-    tau = opened_data[0]
-    hash_d = opened_data[1]
-    #new_tau = np.linspace(0.0000000999999999999999,1000,100000)
-    #fig, ax = plt.subplots()
-    fit = interpolate.interp1d(hash_d, tau, kind = 'cubic')
-    #plt.plot(tau,hash_d, "o", new_tau, fit(new_tau), "-")
-    #plt.show()
-    return float(fit(hash_point))
+from hash_tau import hash_of_tau, tau_of_hash
+import result_cache
+
+WALS = ["130A", "37A", "120A", "48A"]
+# Measured for the dissertation, used when the cache has no fit of WALS
+DISSERTATION_RHO = [0.12142, 0.60806, 0.45337, 0.83333]
+DISSERTATION_ISO = [0.18876, 0.36313, 0.32420, 0.20930]
 
 def isogloss(hash_v, frequency):
-    
+
     iso = 2*hash_v*frequency*(1-frequency)
     return iso
 
@@ -49,33 +30,54 @@ def hash_form(freq, isogloss):
     bottom = 2*freq*(1-freq)
     return top/bottom
 
-#WALS: 130A, 37A, 77A, 48A
-rho_01 = [0.12142, 0.60806, 0.45337, 0.83333]
-iso_01 = [0.18876, 0.36313, 0.32420, 0.20930]
-WALS = ["130A", "37A", "120A", "48A"]
+def measured_features(features, cache=None):
+    """
+    Frequency of features and isogloss density of the features from the
+    most recently stored fit that has all of them, or None.
+    """
+    if cache is None:
+        cache = result_cache.ResultCache()
+    latest = None
+    for description, stored in cache.entries(kind="wals_features"):
+        names = list(stored["feature"])
+        if all(feature in names for feature in features):
+            rows = [names.index(feature) for feature in features]
+            latest = (stored["rho"][rows], stored["isogloss"][rows])
+    return latest
+
+def main():
+    measured = measured_features(WALS)
+    if measured is None:
+        print("No fit of the WALS features in the cache, plotting the "
+              "dissertation values")
+        measured = (DISSERTATION_RHO, DISSERTATION_ISO)
+    rho_01 = np.array(measured[0], dtype=float)
+    iso_01 = np.array(measured[1], dtype=float)
+
+    taus = np.linspace(0.1, 1.5, 15)
+    freqs = np.linspace(0,1,1000)
 
-taus = np.linspace(0.1, 1.5, 15)
-freqs = np.linspace(0,1,1000)
+    fig, ax = plt.subplots()
+    plt.xlabel("Frequency of Features")
+    plt.ylabel("Isogloss Density")
+    plt.title("Frequency of Features against Isogloss Desity with WALS Features")
 
-fig, ax = plt.subplots()
-plt.xlabel("Frequency of Features")
-plt.ylabel("Isogloss Density")
-plt.title("Frequency of Features against Isogloss Desity with WALS Features")
+    for n in range(len(rho_01)):
 
-for n in range(len(rho_01)):
+        plt.plot(rho_01[n], iso_01[n], "x", color="black", zorder=1, label=WALS[n])
 
-    plt.plot(rho_01[n], iso_01[n], "x", color="black", zorder=1, label=WALS[n]) 
+    hashes = hash_of_tau(taus)
+    for x in range(len(taus)):
+        plt.plot(freqs, isogloss(hashes[x],freqs), "-",zorder=-1)
 
-for x in range(len(taus)):
-    plt.plot(freqs, isogloss(fitting_tau_and_hash(taus[x]),freqs), "-",zorder=-1)
-    
-for i in range(len(WALS)):
-    #ax.annotate(WALS[i], (rho_01[i], iso_01[i]))
-    h = hash_form(rho_01[i], iso_01[i])
-    tau = "{:.3f}".format(reverse_fit(h))
-    print(tau)
-    ax.annotate(str(tau) +" " + "WALS ID: " + WALS[i], (rho_01[i], iso_01[i]), zorder=1)
+    fitted_taus = tau_of_hash(hash_form(rho_01, iso_01))
+    for i in range(len(WALS)):
+        tau = "{:.3f}".format(fitted_taus[i])
+        print(tau)
+        ax.annotate(str(tau) +" " + "WALS ID: " + WALS[i], (rho_01[i], iso_01[i]), zorder=1)
 
-plt.savefig("WALS_features", dpi=300)
-plt.show()
+    plt.savefig("WALS_features", dpi=300)
+    plt.show()
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched sweep engine for the language evolution model.
+
+Instead of one Python iteration per update, a whole Monte Carlo sweep of
+GRID_SIZE**2 updates is drawn in bulk and applied as array operations. The
+updates are split into sublattices (a checkerboard on even grids) so that the
+cells written in one batch never read each other.
+
+Every update is treated from the side of the cell it writes: a vertical event
+writes the chosen cell, a horizontal event writes the neighbour picked by the
+walk and reads the chosen cell.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+import language_evolution_simulation as simulation
+import random_streams
+import topology
+
+# Row and column offsets of the four walk directions, in the same order as
+# horizontal_walk(): up, right, down, left
+DIRECTION_Y = np.array([-1, 0, 1, 0])
+DIRECTION_X = np.array([0, 1, 0, -1])
+
+def sublattice_colors(grid_size):
+    """
+    Colours the cells of the torus so that no two neighbours share a colour.
+    Even grids use a checkerboard, odd grids need a third colour because the
+    checkerboard does not close up where the torus wraps around.
+    """
+    cycle = np.arange(grid_size) % 2
+    if grid_size % 2 == 0:
+        return (cycle[:, None] + cycle[None, :]) % 2, 2
+    cycle[-1] = 2
+    return (cycle[:, None] + cycle[None, :]) % 3, 3
+
+def occurrence_rank(targets):
+    """
+    Numbers repeated targets in the order they were drawn, so the first update
+    of a cell gets 0, the second 1 and so on. Updates with the same rank never
+    write the same cell.
+    """
+    order = np.argsort(targets, kind="stable")
+    sorted_targets = targets[order]
+    positions = np.arange(len(targets))
+    new_group = np.ones(len(targets), dtype=bool)
+    new_group[1:] = sorted_targets[1:] != sorted_targets[:-1]
+    group_start = np.maximum.accumulate(np.where(new_group, positions, 0))
+    rank = np.empty(len(targets), dtype=np.intp)
+    rank[order] = positions - group_start
+    return rank
+
+def apply_updates(flat_map, source, target, horizontal, acceptance, params):
+    """
+    Applies a batch of conflict free updates. A yellow source is lost with the
+    ingress probability and a blue source is gained with the egress
+    probability, using the horizontal or vertical rates depending on the event.
+    """
+    ingress = np.where(horizontal, params["ingress_horizontal"],
+                       params["ingress_vert"])
+    egress = np.where(horizontal, params["egress_horizontal"],
+                      params["egress_vert"])
+    yellow = flat_map[source] == 1
+    new_value = np.where(yellow, acceptance >= ingress, acceptance < egress)
+    flat_map[target] = new_value
+
+def checkerboard_sweep(integer_map, params, rng):
+    """
+    Performs one Monte Carlo sweep on the integer map in place. The sites,
+    event types, walk directions and acceptance dice for all GRID_SIZE**2
+    updates are drawn at once and then applied one sublattice at a time.
+    """
+    grid_size = len(integer_map)
+    cells = grid_size**2
+    site = rng.integers(0, cells, size=cells)
+    horizontal = rng.random(cells) > params["vertical"]
+    direction = rng.integers(0, 4, size=cells)
+    acceptance = rng.random(cells)
+
+    y, x = np.divmod(site, grid_size)
+    y_new = (y + DIRECTION_Y[direction]) % grid_size
+    x_new = (x + DIRECTION_X[direction]) % grid_size
+    target = np.where(horizontal, y_new*grid_size + x_new, site)
+
+    colors, number_of_colors = sublattice_colors(grid_size)
+    target_color = colors.ravel()[target]
+    flat_map = np.ravel(integer_map)
+
+    for color in rng.permutation(number_of_colors):
+        selected = np.flatnonzero(target_color == color)
+        rank = occurrence_rank(target[selected])
+        for repeat in range(rank.max(initial=-1) + 1):
+            batch = selected[rank == repeat]
+            apply_updates(flat_map, site[batch], target[batch],
+                          horizontal[batch], acceptance[batch], params)
+
+    if not np.shares_memory(flat_map, integer_map):
+        integer_map[...] = flat_map.reshape(integer_map.shape)
+    return integer_map
+
+def run_sweeps(integer_map, sweeps, params, rng):
+    """
+    Evolves the integer map in place for a number of sweeps. Returns the
+    frequency of features and isogloss density measured after every sweep,
+    in the same form as compiled_kernels.run_sweeps().
+    """
+    borders = simulation.number_of_borders(len(integer_map))
+    frequency = np.empty(sweeps)
+    isogloss = np.empty(sweeps)
+    for sweep in range(sweeps):
+        checkerboard_sweep(integer_map, params, rng)
+        frequency[sweep] = np.count_nonzero(integer_map == 0)/integer_map.size
+        count, border_list = simulation.isogloss_calculator(integer_map)
+        isogloss[sweep] = count/borders
+    return frequency, isogloss
+
+def experiment_checkerboard(sweeps, rng=None):
+    """
+    Headless counterpart of experiment() using the batched engine. Returns
+    the frequency of features, the time in sweeps and the isogloss density
+    measured after every sweep.
+    """
+    rng = np.random.default_rng(rng)
+    params = simulation.model_parameters()
+    integer_map = simulation.change_elements(
+        rng.random((simulation.GRID_SIZE, simulation.GRID_SIZE)))
+    lattice = topology.square_torus(simulation.GRID_SIZE)
+    freq_feature = []
+    isogloss = []
+    time_array = []
+
+    for sweep in range(1, sweeps + 1):
+        checkerboard_sweep(integer_map, params, rng)
+        freq_feature.append(simulation.calculate_freq_feature(integer_map))
+        count, borders = simulation.isogloss_calculator(integer_map,
+                                                        lattice=lattice)
+        isogloss.append(count/lattice.number_of_borders())
+        time_array.append(sweep)
+
+    return freq_feature, time_array, isogloss
+
+def experiment_serial(sweeps, rng=None):
+    """
+    Runs the serial loop of experiment() for a number of sweeps without any
+    plotting and measures after every sweep in the same way.
+    """
+    rng = random_streams.BufferedRandom(rng)
+    integer_map = simulation.change_elements(simulation.generate_initial(rng))
+    lattice = topology.square_torus(simulation.GRID_SIZE)
+    freq_feature = []
+    isogloss = []
+    time_array = []
+
+    for sweep in range(1, sweeps + 1):
+        for update in range(simulation.GRID_SIZE**2):
+            simulation.monte_carlo_step(integer_map, rng, None, lattice)
+        freq_feature.append(simulation.calculate_freq_feature(integer_map))
+        count, borders = simulation.isogloss_calculator(integer_map,
+                                                        lattice=lattice)
+        isogloss.append(count/lattice.number_of_borders())
+        time_array.append(sweep)
+
+    return freq_feature, time_array, isogloss
+
+def compare_with_serial(sweeps, realizations, burn_in=None, seed=None):
+    """
+    Statistical equivalence check between the batched engine and the serial
+    loop. Both are run for a number of realizations, the frequency of features
+    and isogloss density are averaged over the sweeps after the burn in and
+    the two means are compared within three standard errors.
+    """
+    if burn_in is None:
+        burn_in = sweeps//2
+    seeds = [random_streams.substream(seed, realization)
+             for realization in range(realizations)]
+    results = {"serial": [], "checkerboard": []}
+
+    for realization in range(realizations):
+        freq, time, iso = experiment_serial(sweeps, seeds[realization])
+        results["serial"].append((np.mean(freq[burn_in:]),
+                                  np.mean(iso[burn_in:])))
+        freq, time, iso = experiment_checkerboard(sweeps, seeds[realization])
+        results["checkerboard"].append((np.mean(freq[burn_in:]),
+                                        np.mean(iso[burn_in:])))
+
+    serial = np.array(results["serial"])
+    batched = np.array(results["checkerboard"])
+    difference = batched.mean(axis=0) - serial.mean(axis=0)
+    error = np.sqrt(serial.var(axis=0, ddof=1)/realizations
+                    + batched.var(axis=0, ddof=1)/realizations)
+    consistent = bool(np.all(np.abs(difference) <= 3*error + 1e-12))
+
+    print("Serial frequency, isogloss density:", serial.mean(axis=0))
+    print("Batched frequency, isogloss density:", batched.mean(axis=0))
+    print("Standard error of the difference:", error)
+    print("Statistically equivalent:", consistent)
+    return {"serial": serial.mean(axis=0), "checkerboard": batched.mean(axis=0),
+            "error": error, "consistent": consistent}
+
+if __name__ == "__main__":
+    compare_with_serial(sweeps=200, realizations=20)
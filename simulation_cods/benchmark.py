@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of simulation throughput and measurement cost.
+
+Times the serial loop of experiment(), the alternative engines and the
+measurement functions over a range of grid sizes. Every result records
+updates and sweeps per second (or seconds per call) together with the peak
+memory allocated while it ran, and the whole set is stored as json so two
+runs, for example before and after an engine change, can be compared with
+compare_results().
+
+experiment() runs in headless mode with its output silenced, so only
+computation is timed.
+@author: Qi Nohr Chen
+"""
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import language_evolution_simulation as simulation
+import realizations
+import compiled_kernels
+import random_streams
+import hash_tau
+
+GRID_SIZES = (4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+ENGINES = ("serial", "checkerboard", "event")
+MAX_SWEEPS = 1000 # Sweeps an engine is timed for at most, for small grids
+# A point with all kinds of events, tau = 0.3 and rho = 0.5
+BENCHMARK_PARAMS = {"vertical": 0.5, "egress_vert": 0.05, "ingress_vert": 0.05,
+                    "egress_horizontal": 0.025, "ingress_horizontal": 0.025}
+
+@contextlib.contextmanager
+def simulation_settings(grid_size, trials, params):
+    """
+    Temporarily sets the module constants of the simulation for one
+    benchmark, headless, and restores them afterwards.
+    """
+    names = ("GRID_SIZE", "TRIALS", "HEADLESS",
+             "PROBABILITY_VERTICAL", "PROBABILITY_EGRESS_VERT",
+             "PROBABILITY_INGRESS_VERT", "PROBABILITY_EGRESS_HORIZONTAL",
+             "PROBABILITY_INGRESS_HORIZONTAL")
+    saved = {name: getattr(simulation, name) for name in names}
+    simulation.GRID_SIZE = grid_size
+    simulation.TRIALS = trials
+    simulation.HEADLESS = True
+    simulation.PROBABILITY_VERTICAL = params["vertical"]
+    simulation.PROBABILITY_EGRESS_VERT = params["egress_vert"]
+    simulation.PROBABILITY_INGRESS_VERT = params["ingress_vert"]
+    simulation.PROBABILITY_EGRESS_HORIZONTAL = params["egress_horizontal"]
+    simulation.PROBABILITY_INGRESS_HORIZONTAL = params["ingress_horizontal"]
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(simulation, name, value)
+
+def measure(function, *arguments, repeats=1):
+    """
+    Runs a function and returns the best wall time of the repeats and the
+    peak memory allocated through Python, in bytes. Tracing allocations
+    slows Python loops down far more than compiled kernels, so the peak is
+    taken in one more run after the timed ones.
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*arguments)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(*arguments)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def benchmark_experiment(grid_size, max_updates, params=BENCHMARK_PARAMS):
+    """
+    Times the serial loop of experiment() for one sweep, or for max_updates
+    updates on grids where a sweep would take longer. Less than a sweep
+    records no observation, so only updates per second are reported then
+    and sweeps_per_second is None.
+    """
+    updates = max(min(grid_size**2, max_updates), 1)
+    with simulation_settings(grid_size, updates, params):
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds, peak = measure(simulation.experiment, False)
+    sweeps_per_second = None
+    if updates == grid_size**2:
+        sweeps_per_second = 1/seconds
+    return {"benchmark": "experiment", "grid_size": grid_size,
+            "updates": updates, "seconds": seconds,
+            "updates_per_second": updates/seconds,
+            "sweeps_per_second": sweeps_per_second,
+            "peak_memory": peak}
+
+def benchmark_engine(engine, grid_size, max_updates, params=BENCHMARK_PARAMS,
+                     max_sweeps=MAX_SWEEPS):
+    """
+    Times one of the engines of realizations.run_engine() over as many whole
+    sweeps as fit in max_updates, at least one and at most max_sweeps, as an
+    engine with a cost per sweep would otherwise spend minutes on the
+    smallest grids. The engine is run once on a small grid first so
+    compilation is not timed.
+    """
+    sweeps = max(1, min(max_updates//grid_size**2, max_sweeps))
+    rng = np.random.default_rng(0)
+    warm_up = (rng.random((4, 4)) > 0.5).astype(float)
+    realizations.run_engine(engine, warm_up, 1, params, rng)
+    integer_map = (rng.random((grid_size, grid_size)) > 0.5).astype(float)
+    seconds, peak = measure(realizations.run_engine, engine, integer_map,
+                            sweeps, params, rng)
+    updates = sweeps*grid_size**2
+    return {"benchmark": "engine_" + engine, "grid_size": grid_size,
+            "updates": updates, "seconds": seconds,
+            "updates_per_second": updates/seconds,
+            "sweeps_per_second": sweeps/seconds,
+            "peak_memory": peak}
+
+def uncached_hash(tau_point):
+    """
+    fitting_tau_and_hash() with the values remembered by hash_tau forgotten
+    first, so the evaluation is timed and not a lookup.
+    """
+    hash_tau.cached_hash.cache_clear()
+    return simulation.fitting_tau_and_hash(tau_point)
+
+def benchmark_measurements(grid_size, repeats=3):
+    """
+    Times a single call of each measurement function on a random lattice.
+    """
+    rng = random_streams.BufferedRandom(0)
+    with simulation_settings(grid_size, grid_size**2, BENCHMARK_PARAMS):
+        integer_map = simulation.change_elements(
+            simulation.generate_initial(rng))
+        calls = {
+            "isogloss_calculator": (simulation.isogloss_calculator,
+                                    integer_map),
+            "calculate_freq_feature": (simulation.calculate_freq_feature,
+                                       integer_map),
+            "change_elements": (lambda: simulation.change_elements(
+                simulation.generate_initial(rng)),),
+            "fitting_tau_and_hash": (uncached_hash,
+                                     simulation.tau(BENCHMARK_PARAMS)),
+        }
+        results = []
+        for name, (function, *arguments) in calls.items():
+            seconds, peak = measure(function, *arguments, repeats=repeats)
+            results.append({"benchmark": name, "grid_size": grid_size,
+                            "seconds_per_observation": seconds,
+                            "peak_memory": peak})
+    return results
+
+def run_benchmarks(grid_sizes=GRID_SIZES, engines=ENGINES,
+                   max_updates=2*10**5, engine_updates=10**7,
+                   filename="benchmark_results.json"):
+    """
+    Runs every benchmark for every grid size and writes the results with a
+    description of the machine to a json file. Returns the results.
+    """
+    results = []
+    for grid_size in grid_sizes:
+        results.append(benchmark_experiment(grid_size, max_updates))
+        for engine in engines:
+            results.append(benchmark_engine(engine, grid_size, engine_updates))
+        results.extend(benchmark_measurements(grid_size))
+        print("Benchmarked grid size", grid_size)
+
+    report = {"python": sys.version, "numpy": np.__version__,
+              "platform": platform.platform(),
+              "numba": "numba" in compiled_kernels.BACKENDS,
+              "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "params": BENCHMARK_PARAMS, "results": results}
+    if filename is not None:
+        with open(filename, "w") as file:
+            json.dump(report, file, indent=1)
+    return report
+
+def compare_results(old_filename, new_filename):
+    """
+    Prints the speed of every benchmark in the new results relative to the
+    old ones, above 1 meaning faster. Returns the ratios by benchmark and
+    grid size.
+    """
+    def rates(filename):
+        with open(filename) as file:
+            report = json.load(file)
+        table = {}
+        for result in report["results"]:
+            key = (result["benchmark"], result["grid_size"])
+            if "updates_per_second" in result:
+                table[key] = result["updates_per_second"]
+            else:
+                table[key] = 1/result["seconds_per_observation"]
+        return table
+
+    old = rates(old_filename)
+    new = rates(new_filename)
+    ratios = {key: new[key]/old[key] for key in new if key in old}
+    for (benchmark, grid_size), ratio in sorted(ratios.items()):
+        print(benchmark, grid_size, "{:.2f}x".format(ratio))
+    return ratios
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        compare_results(sys.argv[1], sys.argv[2])
+    else:
+        run_benchmarks()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checkpointing of long simulation runs.
+
+A checkpoint holds the lattice, the number of sweeps done, the observables
+measured so far and the state of the random number generator. That is a
+numpy Generator or the buffered stream of random_streams used by
+experiment(). Every checkpoint
+also stores the description of its run, as result_cache.describe() gives it,
+and is only resumed by a run with the same description. Checkpoints are
+written to a temporary file and moved into place, so a run killed while
+saving still leaves the previous checkpoint intact. Resuming restores
+everything, so the continued run is bit-for-bit the same as one that was
+never interrupted.
+@author: Qi Nohr Chen
+"""
+import json
+import os
+import numpy as np
+import random_streams
+import result_cache
+
+def rng_state(rng):
+    """
+    State of a Generator or buffered stream in a form that np.savez can
+    store without pickling.
+    """
+    if isinstance(rng, random_streams.BufferedRandom):
+        return {"rng_kind": "buffered", "rng_state": json.dumps(rng.state())}
+    if isinstance(rng, np.random.Generator):
+        return {"rng_kind": "generator",
+                "rng_state": json.dumps(rng.bit_generator.state)}
+    raise TypeError("Only a np.random.Generator or a "
+                    "random_streams.BufferedRandom can be checkpointed")
+
+def restore_rng(saved):
+    """
+    Rebuilds the Generator or buffered stream of a stored random state.
+    """
+    if str(saved["rng_kind"]) == "buffered":
+        return random_streams.BufferedRandom.from_state(
+            json.loads(str(saved["rng_state"])))
+    state = json.loads(str(saved["rng_state"]))
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+def save_checkpoint(filename, integer_map, sweep, observables, rng,
+                    description=None):
+    """
+    Atomically writes a checkpoint. observables is a dictionary of arrays,
+    rng the Generator or stream of the run and description the description
+    of the run.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    arrays = {"integer_map": integer_map, "sweep": sweep}
+    for name, values in observables.items():
+        arrays["observable_" + name] = np.asarray(values)
+    arrays.update(rng_state(rng))
+    if description is not None:
+        arrays["description"] = np.array(json.dumps(description,
+                                                    sort_keys=True))
+
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, filename)
+
+def load_checkpoint(filename, description=None):
+    """
+    Reads a checkpoint and restores its random state. Returns the lattice,
+    the sweep, the observables and the Generator or stream. With a description, raises ValueError when the
+    checkpoint was written by a run with another one.
+    """
+    with np.load(filename) as saved:
+        if description is not None:
+            check_description(filename, saved, description)
+        observables = {name[len("observable_"):]: saved[name]
+                       for name in saved.files
+                       if name.startswith("observable_")}
+        return {"integer_map": saved["integer_map"],
+                "sweep": int(saved["sweep"]),
+                "observables": observables,
+                "rng": restore_rng(saved)}
+
+def check_description(filename, saved, description):
+    """
+    Raises ValueError naming the settings in which the run of a checkpoint
+    differs from the described one.
+    """
+    if "description" not in saved.files:
+        raise ValueError(filename + " does not record the run it belongs "
+                         "to, delete it to start the run again")
+    stored = json.loads(str(saved["description"]))
+    #Through JSON, so both sides have lists and sorted keys
+    expected = json.loads(json.dumps(description, sort_keys=True))
+    changed = sorted(name for name in set(stored) | set(expected)
+                     if stored.get(name) != expected.get(name))
+    if changed:
+        raise ValueError(filename + " belongs to a run with other settings ("
+                         + ", ".join(changed) + "), delete it or restore "
+                         "them to resume")
+
+def run_with_checkpoints(filename, sweeps, params=None, grid_size=None,
+                         seed=None, checkpoint_every=100, engine="serial",
+                         backend="auto"):
+    """
+    Runs a realization for a number of sweeps with one of the engines,
+    checkpointing every checkpoint_every sweeps. When the checkpoint file
+    already exists the run resumes from it. Returns the frequency of
+    features and isogloss density of every sweep.
+    """
+    #The engines load numba, so they are only imported for runs
+    import language_evolution_simulation as simulation
+    import realizations
+    if params is None:
+        params = simulation.model_parameters()
+    if grid_size is None:
+        grid_size = simulation.GRID_SIZE
+    description = result_cache.describe("checkpoint", engine, params,
+                                        grid_size, sweeps, seed)
+
+    if os.path.exists(filename):
+        saved = load_checkpoint(filename, description)
+        integer_map = saved["integer_map"]
+        done = saved["sweep"]
+        rng = saved["rng"]
+        frequency = np.empty(sweeps)
+        isogloss = np.empty(sweeps)
+        frequency[:done] = saved["observables"]["frequency"][:done]
+        isogloss[:done] = saved["observables"]["isogloss"][:done]
+    else:
+        rng = np.random.default_rng(seed)
+        integer_map = simulation.change_elements(
+            rng.random((grid_size, grid_size)))
+        done = 0
+        frequency = np.empty(sweeps)
+        isogloss = np.empty(sweeps)
+
+    while done < sweeps:
+        block = min(checkpoint_every, sweeps - done)
+        frequency[done:done+block], isogloss[done:done+block] = \
+            realizations.run_engine(engine, integer_map, block, params, rng,
+                                    backend)
+        done = done + block
+        save_checkpoint(filename, integer_map, done,
+                        {"frequency": frequency[:done],
+                         "isogloss": isogloss[:done]}, rng, description)
+    return frequency, isogloss
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact storage of the lattice for very large grids.
+
+generate_initial() and change_elements() keep the lattice as float64, 8 bytes
+for a single binary feature. CompactLattice stores a cell in one byte
+("uint8") or one bit ("packed", rows packed into bytes with np.packbits), so a
+20000x20000 grid takes 400 MB or 50 MB. It is filled by thresholding random
+numbers a block of rows at a time, and it counts blue cells and unlike borders
+without ever unpacking the whole grid.
+
+The uint8 cells are run by the serial engine in place, with the neighbours on
+the torus worked out on the fly instead of read from a neighbour table, so a
+run takes little more memory than its lattice. The other engines and the
+packed storage still need a full size copy of the map.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+
+# Number of set bits in every possible byte
+POPCOUNT = np.array([bin(n).count("1") for n in range(256)], dtype=np.uint8)
+
+class CompactLattice:
+    """
+    Square lattice of binary features stored as uint8 or as packed bits.
+    Cells hold 1 for the yellow feature and 0 for the blue one.
+    """
+
+    def __init__(self, grid_size, storage="packed"):
+        if storage not in ("uint8", "packed"):
+            raise ValueError("Storage has to be 'uint8' or 'packed'")
+        self.grid_size = grid_size
+        self.storage = storage
+        if storage == "packed":
+            self.cells = np.zeros((grid_size, (grid_size + 7)//8),
+                                  dtype=np.uint8)
+        else:
+            self.cells = np.zeros((grid_size, grid_size), dtype=np.uint8)
+
+    @classmethod
+    def random(cls, grid_size, rng=None, storage="packed", block_rows=1024):
+        """
+        Uniformly random initial lattice, the compact version of
+        change_elements(generate_initial()).
+        """
+        rng = np.random.default_rng(rng)
+        lattice = cls(grid_size, storage)
+        for start in range(0, grid_size, block_rows):
+            rows = min(block_rows, grid_size - start)
+            block = rng.random((rows, grid_size)) > 0.5
+            lattice.set_rows(start, block)
+        return lattice
+
+    @classmethod
+    def from_array(cls, integer_map, storage="packed"):
+        """
+        Compact copy of an integer map.
+        """
+        lattice = cls(len(integer_map), storage)
+        lattice.set_rows(0, np.asarray(integer_map) != 0)
+        return lattice
+
+    def nbytes(self):
+        """
+        Memory taken by the cells.
+        """
+        return self.cells.nbytes
+
+    def set_rows(self, start, block):
+        """
+        Overwrites consecutive rows from a boolean or 0/1 block.
+        """
+        block = np.asarray(block, dtype=bool)
+        if self.storage == "packed":
+            block = np.packbits(block, axis=1, bitorder="little")
+        self.cells[start:start+len(block)] = block
+
+    def rows(self, start, stop):
+        """
+        Rows start to stop as a 0/1 uint8 array.
+        """
+        if self.storage == "packed":
+            return np.unpackbits(self.cells[start:stop], axis=1,
+                                 count=self.grid_size, bitorder="little")
+        return self.cells[start:stop]
+
+    def to_array(self):
+        """
+        The whole lattice as a 0/1 uint8 array.
+        """
+        return np.array(self.rows(0, self.grid_size))
+
+    def get(self, y, x):
+        """
+        Value of a single cell.
+        """
+        if self.storage == "packed":
+            return (self.cells[y, x >> 3] >> (x & 7)) & 1
+        return self.cells[y, x]
+
+    def set(self, y, x, value):
+        """
+        Writes a single cell.
+        """
+        if self.storage == "packed":
+            mask = np.uint8(1 << (x & 7))
+            if value:
+                self.cells[y, x >> 3] |= mask
+            else:
+                self.cells[y, x >> 3] &= ~mask
+        else:
+            self.cells[y, x] = value
+
+    def neighbours(self, y, x):
+        """
+        The four neighbours of a cell on the torus in the order of
+        horizontal_walk(): up, right, down and left.
+        """
+        size = self.grid_size
+        return [((y-1) % size, x), (y, (x+1) % size),
+                ((y+1) % size, x), (y, (x-1) % size)]
+
+    def run_sweeps(self, sweeps, params, rng, backend="auto"):
+        """
+        Evolves uint8 cells in place with the serial engine of
+        compiled_kernels. Returns the frequency of features and isogloss
+        density after every sweep.
+        """
+        #Only runs need numba, storing and counting do not
+        import compiled_kernels
+        if self.storage != "uint8":
+            raise ValueError("Only uint8 cells can be run in place")
+        return compiled_kernels.run_sweeps(self.cells, sweeps, params, rng,
+                                           backend)
+
+    def count_zeros(self):
+        """
+        Number of blue (0) cells.
+        """
+        if self.storage == "packed":
+            ones = int(POPCOUNT[self.cells].sum(dtype=np.int64))
+        else:
+            ones = int(np.count_nonzero(self.cells))
+        return self.grid_size**2 - ones
+
+    def frequency(self):
+        """
+        Frequency of the blue feature, as in calculate_freq_feature().
+        """
+        return self.count_zeros()/self.grid_size**2
+
+    def unlike_borders(self, periodic=True, block_rows=1024):
+        """
+        Number of neighbouring pairs that disagree, counted a block of rows at
+        a time so the lattice is never unpacked as a whole.
+        """
+        size = self.grid_size
+        borders = 0
+        for start in range(0, size, block_rows):
+            stop = min(start + block_rows, size)
+            #Rows below each row of the block, wrapping around the torus
+            below = np.arange(start + 1, stop + 1) % size
+            if self.storage == "packed":
+                different = self.cells[start:stop] ^ self.cells[below]
+                if not periodic and stop == size:
+                    different = different[:-1]
+                borders += int(POPCOUNT[different].sum(dtype=np.int64))
+            else:
+                block = self.cells[start:stop]
+                different = block != self.cells[below]
+                if not periodic and stop == size:
+                    different = different[:-1]
+                borders += int(np.count_nonzero(different))
+
+            block = self.rows(start, stop)
+            if periodic:
+                borders += int(np.count_nonzero(
+                    block != np.roll(block, -1, axis=1)))
+            else:
+                borders += int(np.count_nonzero(block[:, :-1] != block[:, 1:]))
+        return borders
+
+    def isogloss_density(self, periodic=True):
+        """
+        Fraction of neighbouring pairs that disagree.
+        """
+        size = self.grid_size
+        if periodic:
+            return self.unlike_borders(True)/(2*size**2)
+        return self.unlike_borders(False)/(2*size*(size-1))
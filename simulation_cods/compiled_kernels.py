@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled backend for the serial dynamics of the language evolution model.
+
+The kernel below runs exactly the update rules of monte_carlo_step(): a random
+cell, a vertical or horizontal event, the ingress/egress dice and the walk to
+a neighbour from the table of a topology.Topology. It draws from its own
+numpy Generator and keeps the frequency and border counts up to date as it
+goes, like ObservableTracker.
+
+When numba is installed the kernel is compiled, otherwise the same function
+runs as plain Python. Both read the Generator in the same order, so they give
+identical results for the same seed.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+import topology
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def serial_kernel(values, offsets, neighbours, sweeps, vertical, egress_vert,
+                  ingress_vert, egress_horizontal, ingress_horizontal, rng,
+                  frequency, isogloss):
+    """
+    Runs a number of Monte Carlo sweeps in place on the flat map values,
+    whose neighbours are given by the CSR table offsets and neighbours of a
+    topology.Topology, and writes the frequency of features and isogloss
+    density after each sweep into the two output arrays.
+    """
+    cells = len(values)
+    pairs = len(neighbours)//2
+    zeros = 0
+    borders = 0
+    for cell in range(cells):
+        if values[cell] == 0:
+            zeros += 1
+        for entry in range(offsets[cell], offsets[cell+1]):
+            if values[cell] != values[neighbours[entry]]:
+                borders += 1
+    borders = borders//2
+
+    for sweep in range(sweeps):
+        for update in range(cells):
+            cell = int(rng.random()*cells)
+            value = values[cell]
+            if rng.random() > vertical: #Horizontal event
+                if value == 1:
+                    new_value = 0.0 if rng.random() < ingress_horizontal else 1.0
+                else:
+                    new_value = 1.0 if rng.random() < egress_horizontal else 0.0
+                #Walk to a random entry of the cell's row of the table
+                degree = offsets[cell+1] - offsets[cell]
+                if degree > 0:
+                    cell = neighbours[offsets[cell] + int(rng.random()*degree)]
+            else: #Vertical event
+                if value == 1:
+                    new_value = 0.0 if rng.random() < ingress_vert else 1.0
+                else:
+                    new_value = 1.0 if rng.random() < egress_vert else 0.0
+
+            previous = values[cell]
+            if new_value != previous:
+                for entry in range(offsets[cell], offsets[cell+1]):
+                    if values[neighbours[entry]] == previous:
+                        borders += 1
+                    else:
+                        borders -= 1
+                if previous == 0:
+                    zeros -= 1
+                elif new_value == 0:
+                    zeros += 1
+                values[cell] = new_value
+
+        frequency[sweep] = zeros/cells
+        isogloss[sweep] = borders/pairs if pairs > 0 else 0.0
+
+def torus_kernel(values, grid_size, sweeps, vertical, egress_vert,
+                 ingress_vert, egress_horizontal, ingress_horizontal, rng,
+                 frequency, isogloss):
+    """
+    serial_kernel() on the von Neumann torus with the neighbours worked out
+    from the cell number instead of read from a table, so a flat uint8 map
+    can be updated in place without any memory per cell besides its byte.
+    The neighbours come in the order of topology.square(), so for the same
+    seed the results are those of serial_kernel().
+    """
+    cells = len(values)
+    pairs = 2*cells
+    zeros = 0
+    borders = 0
+    for cell in range(cells):
+        y = cell//grid_size
+        x = cell - y*grid_size
+        if values[cell] == 0:
+            zeros += 1
+        #Right and bottom borders count every pair once
+        if values[cell] != values[y*grid_size + (x+1) % grid_size]:
+            borders += 1
+        if values[cell] != values[((y+1) % grid_size)*grid_size + x]:
+            borders += 1
+
+    for sweep in range(sweeps):
+        for update in range(cells):
+            cell = int(rng.random()*cells)
+            value = values[cell]
+            if rng.random() > vertical: #Horizontal event
+                if value == 1:
+                    new_value = 0 if rng.random() < ingress_horizontal else 1
+                else:
+                    new_value = 1 if rng.random() < egress_horizontal else 0
+                #Up, right, down or left, wrapping around the torus
+                direction = int(rng.random()*4)
+                y = cell//grid_size
+                x = cell - y*grid_size
+                if direction == 0:
+                    y = (y-1) % grid_size
+                elif direction == 1:
+                    x = (x+1) % grid_size
+                elif direction == 2:
+                    y = (y+1) % grid_size
+                else:
+                    x = (x-1) % grid_size
+                cell = y*grid_size + x
+            else: #Vertical event
+                if value == 1:
+                    new_value = 0 if rng.random() < ingress_vert else 1
+                else:
+                    new_value = 1 if rng.random() < egress_vert else 0
+
+            previous = values[cell]
+            if new_value != previous:
+                y = cell//grid_size
+                x = cell - y*grid_size
+                for neighbour in (((y-1) % grid_size)*grid_size + x,
+                                  y*grid_size + (x+1) % grid_size,
+                                  ((y+1) % grid_size)*grid_size + x,
+                                  y*grid_size + (x-1) % grid_size):
+                    if values[neighbour] == previous:
+                        borders += 1
+                    else:
+                        borders -= 1
+                if previous == 0:
+                    zeros -= 1
+                elif new_value == 0:
+                    zeros += 1
+                values[cell] = new_value
+
+        frequency[sweep] = zeros/cells
+        isogloss[sweep] = borders/pairs
+
+BACKENDS = {"python": serial_kernel}
+TORUS_BACKENDS = {"python": torus_kernel}
+if numba is not None:
+    BACKENDS["numba"] = numba.njit(cache=True)(serial_kernel)
+    TORUS_BACKENDS["numba"] = numba.njit(cache=True)(torus_kernel)
+
+def select_backend(backend="auto", kernels=BACKENDS):
+    """
+    Picks the kernel to run. "auto" uses numba when it is installed and falls
+    back to pure Python otherwise.
+    """
+    if backend == "auto":
+        backend = "numba" if "numba" in kernels else "python"
+    if backend not in kernels:
+        raise ValueError("Backend " + str(backend) + " is not available, "
+                         "choose from " + str(sorted(kernels)))
+    return kernels[backend]
+
+def run_sweeps(integer_map, sweeps, params, rng, backend="auto", lattice=None):
+    """
+    Evolves the integer map in place for a number of sweeps with the selected
+    kernel, on the given topology or the square torus of the map. Returns the
+    frequency of features and isogloss density measured after every sweep.
+    A contiguous uint8 map on the torus, like the cells of a
+    compact_lattice.CompactLattice, is updated without being copied.
+    """
+    frequency = np.empty(sweeps)
+    isogloss = np.empty(sweeps)
+    if (lattice is None and integer_map.dtype == np.uint8
+            and integer_map.flags.c_contiguous):
+        kernel = select_backend(backend, TORUS_BACKENDS)
+        kernel(integer_map.reshape(-1), len(integer_map), sweeps,
+               params["vertical"], params["egress_vert"],
+               params["ingress_vert"], params["egress_horizontal"],
+               params["ingress_horizontal"], rng, frequency, isogloss)
+        return frequency, isogloss
+    kernel = select_backend(backend)
+    if lattice is None:
+        lattice = topology.square_torus(len(integer_map))
+    values = np.ascontiguousarray(integer_map, dtype=np.float64).reshape(-1)
+    kernel(values, lattice.offsets, lattice.neighbours, sweeps,
+           params["vertical"], params["egress_vert"], params["ingress_vert"],
+           params["egress_horizontal"], params["ingress_horizontal"], rng,
+           frequency, isogloss)
+    integer_map[...] = values.reshape(integer_map.shape)
+    return frequency, isogloss
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Equilibration detection and early stopping for simulation runs.
+
+The per-sweep frequency of features and isogloss density are monitored while
+a realization runs:
+
+    the end of the burn in is found with MSER-5 (the truncation point that
+    minimises the squared standard error of the remaining batch means),
+    the integrated autocorrelation time with Sokal's automatic window,
+    the effective sample size and standard error of the mean follow from it.
+
+A run stops once the standard errors of all observables are below a
+tolerance, instead of always running for a fixed number of updates.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+import realizations
+
+def mser_truncation(series, batch=5):
+    """
+    MSER-5 estimate of the end of the burn in, in sweeps. Only truncation
+    points in the first half of the series are considered.
+    """
+    series = np.asarray(series, dtype=float)
+    batches = len(series)//batch
+    if batches < 2:
+        return 0
+    means = series[:batches*batch].reshape(batches, batch).mean(axis=1)
+    #Sums over the remaining batches for every truncation point
+    remaining = np.arange(batches, 0, -1)
+    sums = np.cumsum(means[::-1])[::-1]
+    squares = np.cumsum((means**2)[::-1])[::-1]
+    variance_sum = squares - sums**2/remaining
+    mser = variance_sum/remaining**2
+    return int(np.argmin(mser[:batches//2 + 1]))*batch
+
+def integrated_autocorrelation_time(series, window=5):
+    """
+    Integrated autocorrelation time 1 + 2*sum(rho(t)), summed up to Sokal's
+    automatic window, the first M with M >= window*tau(M). The
+    autocorrelation is computed with an FFT.
+    """
+    series = np.asarray(series, dtype=float)
+    n = len(series)
+    if n < 2:
+        return 1.0
+    centred = series - series.mean()
+    transform = np.fft.rfft(centred, 2*n)
+    autocorrelation = np.fft.irfft(transform*np.conj(transform))[:n]
+    if autocorrelation[0] <= 0:
+        return 1.0
+    autocorrelation = autocorrelation/autocorrelation[0]
+    taus = 2*np.cumsum(autocorrelation) - 1
+    lags = np.arange(n)
+    inside = lags >= window*taus
+    cut = int(np.argmax(inside)) if np.any(inside) else n - 1
+    return float(max(taus[cut], 1.0))
+
+def effective_sample_size(series):
+    """
+    Number of independent samples the series is worth.
+    """
+    return len(series)/integrated_autocorrelation_time(series)
+
+def standard_error(series):
+    """
+    Standard error of the mean, corrected for autocorrelation.
+    """
+    series = np.asarray(series, dtype=float)
+    if len(series) < 2:
+        return np.inf
+    return float(np.sqrt(series.var(ddof=1)
+                         * integrated_autocorrelation_time(series)
+                         / len(series)))
+
+class ConvergenceMonitor:
+    """
+    Collects the per-sweep observables of a realization and decides when
+    their means are known well enough.
+    """
+
+    def __init__(self, tolerance, minimum_samples=100,
+                 observables=("frequency", "isogloss")):
+        self.tolerance = tolerance
+        self.minimum_samples = minimum_samples
+        self.series = {name: [] for name in observables}
+
+    def add(self, **values):
+        """
+        Adds the values of one or more sweeps, given per observable.
+        """
+        for name in self.series:
+            self.series[name].extend(np.atleast_1d(values[name]))
+
+    def burn_in(self):
+        """
+        End of the burn in, the latest of all observables.
+        """
+        return max(mser_truncation(values) for values in self.series.values())
+
+    def summary(self):
+        """
+        Burn in, and for every observable the mean, standard error,
+        autocorrelation time and effective sample size after the burn in.
+        """
+        burn_in = self.burn_in()
+        result = {"burn_in": burn_in,
+                  "sweeps": len(next(iter(self.series.values())))}
+        for name, values in self.series.items():
+            stationary = np.asarray(values[burn_in:], dtype=float)
+            result[name] = float(stationary.mean())
+            result[name + "_error"] = standard_error(stationary)
+            result[name + "_tau"] = integrated_autocorrelation_time(stationary)
+            result[name + "_ess"] = effective_sample_size(stationary)
+        return result
+
+    def converged(self):
+        """
+        True once every observable has enough samples after the burn in and
+        a standard error below the tolerance.
+        """
+        summary = self.summary()
+        if summary["sweeps"] - summary["burn_in"] < self.minimum_samples:
+            return False
+        return all(summary[name + "_error"] < self.tolerance
+                   for name in self.series)
+
+def run_until_converged(integer_map, params, rng, tolerance, max_sweeps,
+                        check_every=100, minimum_samples=100,
+                        engine="serial", backend="auto"):
+    """
+    Runs a realization in blocks of check_every sweeps until the observables
+    have converged or max_sweeps is reached. Returns the summary of the
+    monitor with a flag telling whether it converged.
+    """
+    monitor = ConvergenceMonitor(tolerance, minimum_samples)
+    done = 0
+    converged = False
+    while done < max_sweeps and not converged:
+        block = min(check_every, max_sweeps - done)
+        frequency, isogloss = realizations.run_engine(engine, integer_map,
+                                                      block, params, rng,
+                                                      backend)
+        monitor.add(frequency=frequency, isogloss=isogloss)
+        done = done + block
+        converged = monitor.converged()
+    summary = monitor.summary()
+    summary["converged"] = converged
+    return summary
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rejection-free (continuous time) engine for the language evolution model.
+
+At low linguistic temperature most updates of the serial loop leave the
+lattice as it is. This engine only keeps track of the events that flip a
+cell. The rate at which a cell flips depends only on its own value s and on
+the number k of neighbours that differ from it:
+
+    vertical    (1-q) * (ingress if s is yellow else egress)
+    horizontal  q/4 per neighbour, the probability that copying that
+                neighbour, with mutation, gives the other value
+
+Cells are grouped into the ten (s, k) classes. Every step picks a class in
+proportion to its total rate, a uniform cell in it, flips that cell and moves
+it and its neighbours to their new classes. Time advances by an exponential
+waiting time. Every cell is chosen once per unit of time on average, so the
+time is counted in Monte Carlo sweeps, the same units as time_array in
+experiment().
+
+Like compiled_kernels.py the kernel is compiled with numba when it is
+installed and runs as plain Python otherwise.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def flip_rates(params):
+    """
+    Flip rate of a cell by its value s (rows) and number of unlike
+    neighbours k (columns), in flips per sweep.
+    """
+    vertical = params["vertical"]
+    horizontal = 1 - vertical
+    ingress_h = params["ingress_horizontal"]
+    egress_h = params["egress_horizontal"]
+    rates = np.empty((2, 5))
+    unlike = np.arange(5)
+    #Blue cell: turns yellow from a blue neighbour by mutation, from a yellow
+    #one unless the copy mutates
+    rates[0] = (vertical*params["egress_vert"]
+                + horizontal/4*((4-unlike)*egress_h + unlike*(1-ingress_h)))
+    rates[1] = (vertical*params["ingress_vert"]
+                + horizontal/4*((4-unlike)*ingress_h + unlike*(1-egress_h)))
+    return rates
+
+def move_cell(cell, new_class, cell_class, position, members, counts):
+    """
+    Moves a cell from its class to another one, keeping every class a packed
+    list so a uniform member can be drawn directly.
+    """
+    old_class = cell_class[cell]
+    if old_class == new_class:
+        return
+    last = members[old_class, counts[old_class]-1]
+    members[old_class, position[cell]] = last
+    position[last] = position[cell]
+    counts[old_class] -= 1
+    members[new_class, counts[new_class]] = cell
+    position[cell] = counts[new_class]
+    counts[new_class] += 1
+    cell_class[cell] = new_class
+
+def event_kernel(values, size, sweeps, rates, rng, frequency, isogloss):
+    """
+    Evolves the flat 0/1 lattice values in continuous time up to the given
+    number of sweeps, writing the frequency of features and isogloss density
+    at every whole sweep into the output arrays.
+    """
+    cells = size*size
+    flat_rates = rates.ravel()
+    unlike = np.zeros(cells, dtype=np.int64)
+    for cell in range(cells):
+        y = cell//size
+        x = cell % size
+        for neighbour in (((y-1) % size)*size + x, y*size + (x+1) % size,
+                          ((y+1) % size)*size + x, y*size + (x-1) % size):
+            if values[neighbour] != values[cell]:
+                unlike[cell] += 1
+
+    cell_class = np.full(cells, -1, dtype=np.int64)
+    position = np.zeros(cells, dtype=np.int64)
+    members = np.zeros((10, cells), dtype=np.int64)
+    counts = np.zeros(10, dtype=np.int64)
+    zeros = 0
+    borders = 0
+    for cell in range(cells):
+        new_class = int(values[cell])*5 + unlike[cell]
+        members[new_class, counts[new_class]] = cell
+        position[cell] = counts[new_class]
+        counts[new_class] += 1
+        cell_class[cell] = new_class
+        if values[cell] == 0:
+            zeros += 1
+        borders += unlike[cell]
+    borders = borders//2
+
+    time = 0.0
+    sample = 0
+    while sample < sweeps:
+        total = 0.0
+        for c in range(10):
+            total += counts[c]*flat_rates[c]
+        if total <= 0:
+            time = np.inf
+        else:
+            time += -np.log(1.0 - rng.random())/total
+        while sample < sweeps and sample + 1 <= time:
+            frequency[sample] = zeros/cells
+            isogloss[sample] = borders/(2*cells)
+            sample += 1
+        if sample >= sweeps:
+            break
+
+        #Pick a class in proportion to its total rate, then a member
+        threshold = rng.random()*total
+        chosen = 9
+        for c in range(10):
+            threshold -= counts[c]*flat_rates[c]
+            if threshold < 0 and counts[c] > 0:
+                chosen = c
+                break
+        while counts[chosen] == 0:
+            chosen -= 1
+        cell = members[chosen, int(rng.random()*counts[chosen])]
+
+        previous = values[cell]
+        values[cell] = 1 - previous
+        if previous == 0:
+            zeros -= 1
+        else:
+            zeros += 1
+        borders += 4 - 2*unlike[cell]
+        unlike[cell] = 4 - unlike[cell]
+        move_cell(cell, int(values[cell])*5 + unlike[cell], cell_class,
+                  position, members, counts)
+        y = cell//size
+        x = cell % size
+        for neighbour in (((y-1) % size)*size + x, y*size + (x+1) % size,
+                          ((y+1) % size)*size + x, y*size + (x-1) % size):
+            if values[neighbour] == values[cell]:
+                unlike[neighbour] -= 1
+            else:
+                unlike[neighbour] += 1
+            move_cell(neighbour, int(values[neighbour])*5 + unlike[neighbour],
+                      cell_class, position, members, counts)
+
+BACKENDS = {"python": event_kernel}
+if numba is not None:
+    move_cell = numba.njit(cache=True)(move_cell)
+    BACKENDS["numba"] = numba.njit(cache=True)(event_kernel)
+
+def run_sweeps(integer_map, sweeps, params, rng, backend="auto"):
+    """
+    Evolves the integer map in place for a number of sweeps of continuous
+    time. Returns the frequency of features and isogloss density at the end
+    of every sweep, like compiled_kernels.run_sweeps().
+    """
+    if backend == "auto":
+        backend = "numba" if "numba" in BACKENDS else "python"
+    if backend not in BACKENDS:
+        raise ValueError("Backend " + str(backend) + " is not available, "
+                         "choose from " + str(sorted(BACKENDS)))
+    values = np.ascontiguousarray(integer_map, dtype=np.int64).ravel()
+    frequency = np.empty(sweeps)
+    isogloss = np.empty(sweeps)
+    BACKENDS[backend](values, len(integer_map), sweeps, flip_rates(params),
+                      rng, frequency, isogloss)
+    integer_map[...] = values.reshape(integer_map.shape)
+    return frequency, isogloss
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+H(tau), the function linking the isogloss density to the frequency of
+features through 2*H(tau)*rho*(1-rho).
+
+The pair correlations of the model obey a linear lattice equation whose
+solution is the lattice Green's function of the square lattice. This gives
+
+    H(tau) = 1/P(0) - tau,   P(0) = 2*K(1/(1+tau))/(pi*(1+tau))
+
+with K the complete elliptic integral of the first kind. On a finite torus
+P(0) is the corresponding sum over the grid's wave vectors instead.
+
+    hash_of_tau(tau)   H(tau) evaluated directly, for any tau > 0
+    tau_of_hash(hash)  its inverse, found by bisection on log(tau)
+
+The interpolation of the tabulated tau_hash.csv is still available through
+table_hash_of_tau() and table_tau_of_hash(). The table is read and fitted once
+per process and the fit is also stored next to the csv file. generate_table()
+writes a new table at any resolution. The table is looked for next to this
+file, not in the current directory, and pandas and scipy are only imported
+when they are needed.
+@author: Qi Nohr Chen
+"""
+import functools
+import os
+import numpy as np
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "tau_hash.csv")
+
+def load_table(filename=None):
+    """
+    Reads the tau and H(tau) columns of the table.
+    """
+    import pandas as pd
+    if filename is None:
+        filename = TABLE_FILE
+    opened_data = pd.read_csv(filename, header=None)
+    return opened_data[0].to_numpy(float), opened_data[1].to_numpy(float)
+
+def fit_table(tau, hash_d):
+    """
+    Fits the cubic spline of H(tau) and the monotone interpolant of its
+    inverse. Repeated H values are dropped so the inverse is well defined.
+    """
+    from scipy import interpolate
+    order = np.argsort(tau)
+    tau = tau[order]
+    hash_d = hash_d[order]
+    forward = interpolate.make_interp_spline(tau, hash_d, k=3)
+    hash_sorted, first = np.unique(hash_d, return_index=True)
+    inverse = interpolate.PchipInterpolator(hash_sorted, tau[first],
+                                            extrapolate=False)
+    return forward, inverse
+
+def cache_file(filename):
+    """
+    File next to the table where the fitted coefficients are kept.
+    """
+    return os.path.splitext(filename)[0] + "_fit.npz"
+
+@functools.lru_cache(maxsize=None)
+def fitted(filename, modified, size):
+    """
+    Returns the fitted pair of interpolants for a table. The modification
+    time and size of the file are part of the key, so an edited table is
+    refitted. The on-disk cache is used when it matches the same file.
+    """
+    from scipy import interpolate
+    stored = cache_file(filename)
+    try:
+        with np.load(stored) as saved:
+            if saved["modified"] == modified and saved["size"] == size:
+                forward = interpolate.BSpline(saved["knots"],
+                                              saved["coefficients"], 3,
+                                              extrapolate=False)
+                inverse = interpolate.PPoly(saved["inverse_coefficients"],
+                                            saved["inverse_breaks"],
+                                            extrapolate=False)
+                return forward, inverse
+    except (OSError, KeyError, ValueError):
+        pass
+
+    forward, inverse = fit_table(*load_table(filename))
+    forward = interpolate.BSpline(forward.t, forward.c, 3, extrapolate=False)
+    try:
+        np.savez(stored, modified=modified, size=size, knots=forward.t,
+                 coefficients=forward.c, inverse_coefficients=inverse.c,
+                 inverse_breaks=inverse.x)
+    except OSError:
+        pass
+    return forward, inverse
+
+def interpolants(filename=None):
+    """
+    Fitted interpolants for the table at filename, loaded at most once.
+    """
+    if filename is None:
+        filename = TABLE_FILE
+    filename = os.path.abspath(filename)
+    status = os.stat(filename)
+    return fitted(filename, status.st_mtime_ns, status.st_size)
+
+def evaluate(function, points):
+    """
+    Evaluates an interpolant on a scalar or array. Points outside the
+    tabulated range raise a ValueError like interp1d does.
+    """
+    values = function(np.asarray(points, dtype=float))
+    if np.any(np.isnan(values)):
+        raise ValueError("A value is outside the range of the table")
+    if np.ndim(values) == 0:
+        return float(values)
+    return values
+
+def table_hash_of_tau(tau, filename=None):
+    """
+    H(tau) interpolated from the table for a linguistic temperature or an
+    array of them.
+    """
+    forward, inverse = interpolants(filename)
+    return evaluate(forward, tau)
+
+def table_tau_of_hash(hash_d, filename=None):
+    """
+    The linguistic temperature belonging to a value or array of H(tau),
+    interpolated from the table.
+    """
+    forward, inverse = interpolants(filename)
+    return evaluate(inverse, hash_d)
+
+def wave_vector_weights(grid_size):
+    """
+    Distinct values of (cos(k_x)+cos(k_y))/2 over the wave vectors of a
+    periodic grid, together with the fraction of wave vectors having each.
+    """
+    cosines = np.cos(2*np.pi*np.arange(grid_size)/grid_size)
+    structure = ((cosines[:, None] + cosines[None, :])/2).ravel()
+    values, counts = np.unique(np.round(structure, 14), return_counts=True)
+    return values, counts/grid_size**2
+
+def green_function_origin(tau, grid_size=None):
+    """
+    Lattice Green's function at the origin, P(0), for an array of tau. The
+    infinite lattice uses the elliptic integral, a torus the sum over its
+    wave vectors.
+    """
+    tau = np.asarray(tau, dtype=float)
+    if grid_size is None:
+        from scipy import special
+        # 1 - 1/(1+tau)**2 written so it stays accurate for tiny tau
+        complement = tau*(2+tau)/(1+tau)**2
+        return 2*special.ellipkm1(complement)/(np.pi*(1+tau))
+    return green_function_sum(tau, *wave_vector_weights(grid_size))
+
+def green_function_sum(tau, values, weights):
+    """
+    P(0) = sum of weights/(1 + tau - values) for an array of tau, where
+    values are the distinct values of the structure function of a torus and
+    weights the fractions of wave vectors having each. The sum is taken for
+    blocks of temperatures at a time to bound the memory.
+    """
+    tau = np.asarray(tau, dtype=float)
+    flat_tau = tau.ravel()
+    origin = np.empty(len(flat_tau))
+    block = max(1, 2**22//len(values))
+    for start in range(0, len(flat_tau), block):
+        chunk = flat_tau[start:start+block]
+        origin[start:start+block] = (1/(chunk[:, None]
+                                        + (1 - values)[None, :])) @ weights
+    return origin.reshape(tau.shape)
+
+@functools.lru_cache(maxsize=4096)
+def cached_hash(tau, grid_size):
+    """
+    H(tau) for a single temperature, remembered between calls.
+    """
+    return float(1/green_function_origin(tau, grid_size) - tau)
+
+def hash_of_tau(tau, grid_size=None):
+    """
+    H(tau) for a linguistic temperature or an array of them, on the infinite
+    lattice or on a periodic grid of the given size.
+    """
+    if np.ndim(tau) == 0:
+        return cached_hash(float(tau), grid_size)
+    tau = np.asarray(tau, dtype=float)
+    return 1/green_function_origin(tau, grid_size) - tau
+
+def tau_of_hash(hash_d, grid_size=None, iterations=80):
+    """
+    The linguistic temperature belonging to a value or array of H(tau). H
+    grows monotonically from 0 to 1, so the inverse is found by bisection on
+    log(tau) for all values at once.
+    """
+    hash_d = np.asarray(hash_d, dtype=float)
+    if np.any((hash_d <= 0) | (hash_d >= 1)):
+        raise ValueError("H(tau) only takes values between 0 and 1")
+    # H only vanishes logarithmically, so the bracket reaches tiny tau
+    lower = np.full(hash_d.shape, np.log(np.finfo(float).tiny))
+    upper = np.full(hash_d.shape, np.log(1e12))
+    for _ in range(iterations):
+        middle = (lower + upper)/2
+        too_high = hash_of_tau(np.exp(middle), grid_size) > hash_d
+        upper = np.where(too_high, middle, upper)
+        lower = np.where(too_high, lower, middle)
+    tau = np.exp((lower + upper)/2)
+    if tau.ndim == 0:
+        return float(tau)
+    return tau
+
+def generate_table(filename=None, tau_min=1e-7, tau_max=1000,
+                   points=1000, grid_size=None):
+    """
+    Writes a table of tau and H(tau) in the format of tau_hash.csv, with
+    points spaced logarithmically between tau_min and tau_max.
+    """
+    if filename is None:
+        filename = TABLE_FILE
+    tau = np.logspace(np.log10(tau_min), np.log10(tau_max), points)
+    np.savetxt(filename, np.column_stack((tau, hash_of_tau(tau, grid_size))),
+               delimiter=",")
+    return filename
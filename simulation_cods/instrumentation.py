@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Built-in instrumentation of the simulation loop.
+
+A Profile handed to experiment() counts every update by event type,
+
+    vertical or horizontal, ingress or egress, accepted or rejected
+
+where an update is accepted when it changed the cell it was applied to, and
+adds up the wall time spent in each phase of the loop (update, measurement,
+I/O for recorders, checkpoints and frames, plotting). With sampling switched
+on the call stack is also sampled every few milliseconds, which shows how
+the update time splits between the random draws, horizontal_walk() and the
+branches of monte_carlo_step().
+
+When no profile is given the loop only pays for a comparison with None, so
+instrumentation costs next to nothing when it is disabled.
+@author: Qi Nohr Chen
+"""
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+EVENT_KINDS = ("vertical", "horizontal")
+EVENT_DIRECTIONS = ("ingress", "egress")
+PHASES = ("update", "measurement", "io", "plotting")
+
+class SamplingProfiler:
+    """
+    Samples the call stack at a fixed interval of CPU time and counts the
+    functions seen, both as the innermost frame (self time) and anywhere on
+    the stack (total time).
+
+    On Unix the samples are taken by a SIGPROF timer, which interrupts the
+    simulation wherever it is. Elsewhere, or off the main thread, a
+    background thread looks at the stack instead. That only sees the stack
+    when the interpreter switches threads, which is much coarser.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.own = collections.Counter()
+        self.total = collections.Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+        self.previous_handler = None
+        self.use_signal = (hasattr(signal, "setitimer")
+                           and threading.current_thread()
+                           is threading.main_thread())
+
+    def record(self, frame):
+        """
+        Counts the functions on the stack above the given frame once.
+        """
+        self.samples = self.samples + 1
+        seen = set()
+        innermost = True
+        while frame is not None:
+            code = frame.f_code
+            name = (code.co_name + " ("
+                    + os.path.basename(code.co_filename) + ")")
+            if innermost:
+                self.own[name] += 1
+                innermost = False
+            if name not in seen:
+                self.total[name] += 1
+                seen.add(name)
+            frame = frame.f_back
+
+    def handle_signal(self, number, frame):
+        self.record(frame)
+
+    def loop(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.record(frame)
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        if self.use_signal:
+            self.previous_handler = signal.signal(signal.SIGPROF,
+                                                  self.handle_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.thread = threading.Thread(target=self.loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.previous_handler)
+        elif self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def top(self, number=10):
+        """
+        The functions most often on top of the stack, with the fraction of
+        samples they were on top and anywhere on the stack.
+        """
+        if self.samples == 0:
+            return []
+        return [(name, count/self.samples, self.total[name]/self.samples)
+                for name, count in self.own.most_common(number)]
+
+class Profile:
+    """
+    Counters of events and timers of phases for one realization.
+    """
+
+    def __init__(self, sampling=False, interval=0.005):
+        self.events = {(kind, direction, accepted): 0
+                       for kind in EVENT_KINDS
+                       for direction in EVENT_DIRECTIONS
+                       for accepted in (True, False)}
+        self.seconds = {phase: 0.0 for phase in PHASES}
+        self.calls = {phase: 0 for phase in PHASES}
+        self.profiler = SamplingProfiler(interval) if sampling else None
+        self.started = None
+        self.elapsed = 0.0
+
+    def start(self):
+        """
+        Starts the wall clock of the realization, and the sampling profiler.
+        """
+        self.started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.start()
+
+    def stop(self):
+        self.elapsed = self.elapsed + time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def count_event(self, kind, direction, accepted):
+        self.events[(kind, direction, bool(accepted))] += 1
+
+    def clock(self):
+        """
+        Current time, to be handed back to add_time() when the phase ends.
+        """
+        return time.perf_counter()
+
+    def add_time(self, phase, started):
+        self.seconds[phase] += time.perf_counter() - started
+        self.calls[phase] += 1
+
+    def updates(self):
+        return sum(self.events.values())
+
+    def as_dict(self):
+        """
+        Everything measured, in a form json can store.
+        """
+        result = {"elapsed": self.elapsed, "updates": self.updates(),
+                  "events": {kind + "_" + direction + "_"
+                             + ("accepted" if accepted else "rejected"): count
+                             for (kind, direction, accepted), count
+                             in self.events.items()},
+                  "seconds": dict(self.seconds), "calls": dict(self.calls)}
+        if self.profiler is not None:
+            result["samples"] = [{"function": name, "own": own,
+                                  "total": total}
+                                 for name, own, total in self.profiler.top(20)]
+        return result
+
+    def write(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.as_dict(), file, indent=1)
+
+    def table(self):
+        """
+        Summary of the realization as a text table.
+        """
+        updates = max(self.updates(), 1)
+        lines = ["{:<12}{:<10}{:>12}{:>12}{:>9}".format(
+            "Event", "Type", "Accepted", "Rejected", "Share")]
+        for kind in EVENT_KINDS:
+            for direction in EVENT_DIRECTIONS:
+                accepted = self.events[(kind, direction, True)]
+                rejected = self.events[(kind, direction, False)]
+                lines.append("{:<12}{:<10}{:>12}{:>12}{:>8.1%}".format(
+                    kind, direction, accepted, rejected,
+                    (accepted + rejected)/updates))
+        lines.append("")
+        lines.append("{:<12}{:>12}{:>12}{:>9}".format(
+            "Phase", "Seconds", "Calls", "Share"))
+        elapsed = self.elapsed if self.elapsed > 0 else 1.0
+        for phase in PHASES:
+            lines.append("{:<12}{:>12.4f}{:>12}{:>8.1%}".format(
+                phase, self.seconds[phase], self.calls[phase],
+                self.seconds[phase]/elapsed))
+        other = self.elapsed - sum(self.seconds.values())
+        lines.append("{:<12}{:>12.4f}{:>12}{:>8.1%}".format(
+            "other", other, "", other/elapsed))
+        lines.append("{:<12}{:>12.4f}".format("total", self.elapsed))
+        if self.profiler is not None and self.profiler.samples > 0:
+            lines.append("")
+            lines.append("{:<52}{:>9}{:>9}".format("Function (sampled)",
+                                                  "Own", "Total"))
+            for name, own, total in self.profiler.top():
+                lines.append("{:<52}{:>8.1%}{:>8.1%}".format(name[:51], own,
+                                                             total))
+        return "\n".join(lines)
@@ -10,20 +10,29 @@ Yellow cells denote the existence of that linguistic feature and blue cells
 are communities without that feature.
 
 Models a toroidal universe due to its periodic boundary conditions
+
+Importing the module runs nothing. matplotlib is only imported by the
+plotting functions, so headless workers start without it. Runs are started
+from run_simulation.py, which sets the constants below from a config file.
 @author: Qi Nohr Chen
 """
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib import colors
 import numpy as np
-import matplotlib.collections as mc
-from scipy import interpolate
+from observable_tracker import ObservableTracker
+import hash_tau
+import rendering
+from streaming_recorder import SeriesRecorder
+import checkpoint
+import instrumentation
+import random_streams
+import topology
+import result_cache
+import json
 #import imageio
-#import os
+import os
 
 REALIZATION = 1
 GRID_SIZE = 4
-NUMBER_OF_BORDERS = 2*GRID_SIZE*(GRID_SIZE-1)
+TOPOLOGY = None # topology.Topology to run on, None for the square torus
 TRIALS = 16
 PROBABILITY_VERTICAL = 0.5 #1-q
 PROBABILITY_HORIZONTAL = 0.5 #q
@@ -31,69 +40,126 @@ PROBABILITY_EGRESS_VERT = 1 # Getting the yellow feature from out of nowhere
 PROBABILITY_INGRESS_VERT = 0  # Losing the yellow feature from within a community
 PROBABILITY_EGRESS_HORIZONTAL = 0 # not adopting blue feature from neighbor
 PROBABILITY_INGRESS_HORIZONTAL = 0 # not adopting neighbor yellow feature
+HEADLESS = False # No figures during the run, snapshots go to a frame buffer
+SNAPSHOT_INTERVAL = 1 # Sweeps between snapshots in headless runs
+SERIES_DIRECTORY = None # Directory in OUTPUT_DIRECTORY the per-sweep observables are streamed to
+CHECKPOINT_DIRECTORY = None # Directory in OUTPUT_DIRECTORY for checkpoints of each realization
+CHECKPOINT_INTERVAL = 100 # Sweeps between checkpoints
+PROFILE = False # Count events and time the phases of every realization
+PROFILE_SAMPLING = False # Also sample which functions the loop spends time in
+SPATIAL_OBSERVABLES = False # Average C(r), S(k) and cluster sizes every sweep, square torus only
+SEED = None # Seed of the run, None draws a fresh one that is saved with results
+OUTPUT_DIRECTORY = "." # Directory the results, figures and frames are written to
+RESULT_CACHE = result_cache.CACHE_DIRECTORY # Directory of stored realizations of seeded runs, None always simulates
+WARM_START = False # Start from an equilibrated coarse lattice, see warm_start.py
 p = PROBABILITY_EGRESS_VERT + PROBABILITY_INGRESS_VERT
 p_prime = PROBABILITY_EGRESS_HORIZONTAL + PROBABILITY_INGRESS_HORIZONTAL
 
+# Keys of the parameter dictionaries of model_parameters()
+PARAMETER_NAMES = ("vertical", "egress_vert", "ingress_vert",
+                   "egress_horizontal", "ingress_horizontal")
+
+def model_parameters():
+    """
+    Collects the transmission probabilities set above into a dictionary so
+    that they can be handed to the alternative simulation engines.
+    """
+    return {"vertical": PROBABILITY_VERTICAL,
+            "egress_vert": PROBABILITY_EGRESS_VERT,
+            "ingress_vert": PROBABILITY_INGRESS_VERT,
+            "egress_horizontal": PROBABILITY_EGRESS_HORIZONTAL,
+            "ingress_horizontal": PROBABILITY_INGRESS_HORIZONTAL}
+
+def lattice_topology():
+    """
+    Neighbour table the simulation runs on: TOPOLOGY when one is set,
+    otherwise the square torus of GRID_SIZE. Maps on graphs are not grids,
+    so they can only be run HEADLESS.
+    """
+    if TOPOLOGY is not None:
+        return TOPOLOGY
+    return topology.square_torus(GRID_SIZE)
+
+def output_path(filename):
+    """
+    Path of a result file in OUTPUT_DIRECTORY, which is created if needed.
+    """
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    return os.path.join(OUTPUT_DIRECTORY, filename)
+
+def checkpoint_path(realization):
+    """
+    Checkpoint file of a realization, None when runs are not checkpointed.
+    """
+    if CHECKPOINT_DIRECTORY is None:
+        return None
+    return os.path.join(output_path(CHECKPOINT_DIRECTORY),
+                        "realization_" + str(realization) + ".npz")
+
 def fitting_tau_and_hash(tau_point):
     """
-    Takes in a linguistic temperature and returns a H(tau) using interpolation
+    Takes in a linguistic temperature and returns H(tau), evaluated from the
+    lattice Green's function in hash_tau
     """
-    opened_data = pd.read_csv("tau_hash.csv", header=None)
-    tau = opened_data[0]
-    hash_d = opened_data[1]
-    #new_tau = np.linspace(0.0000000999999999999999,1000,100000)
-    #fig, ax = plt.subplots()
-    fit = interpolate.interp1d(tau, hash_d, kind = 'cubic')
-    #plt.plot(tau,hash_d, "o", new_tau, fit(new_tau), "-")
-    #plt.show()
-    return float(fit(tau_point))
+    return hash_tau.hash_of_tau(tau_point)
 
-def frequency_of_feature_in_stationary_distribution():
+def frequency_of_feature_in_stationary_distribution(params=None):
     """
-    Calculates the frequency of a feature in a stationary distribution
+    Calculates the frequency of a feature in a stationary distribution. Uses
+    the probabilities set above unless a dictionary like the one from
+    model_parameters() is given.
     """
+    if params is None:
+        params = model_parameters()
+    vertical = params["vertical"]
+    horizontal = 1 - vertical
+    p = params["egress_vert"] + params["ingress_vert"]
+    p_prime = params["egress_horizontal"] + params["ingress_horizontal"]
  
-    top = (PROBABILITY_VERTICAL*
-           PROBABILITY_INGRESS_VERT)+(PROBABILITY_HORIZONTAL*
-                                      PROBABILITY_INGRESS_HORIZONTAL)
-    bottom = PROBABILITY_VERTICAL*p+PROBABILITY_HORIZONTAL*p_prime
+    top = (vertical*params["ingress_vert"])+(horizontal*
+                                             params["ingress_horizontal"])
+    bottom = vertical*p+horizontal*p_prime
     rho = top/bottom
     return rho
 
-def tau():
+def tau(params=None):
     """
     This parameter gives the relative rate
     of unfaithful transmission events (i.e., mutations) over faithful
     transmission events
     """
-    top =(PROBABILITY_VERTICAL*p+PROBABILITY_HORIZONTAL*p_prime)
-    bot = (PROBABILITY_HORIZONTAL*(1-p_prime))
+    if params is None:
+        params = model_parameters()
+    vertical = params["vertical"]
+    horizontal = 1 - vertical
+    p = params["egress_vert"] + params["ingress_vert"]
+    p_prime = params["egress_horizontal"] + params["ingress_horizontal"]
+    top =(vertical*p+horizontal*p_prime)
+    bot = (horizontal*(1-p_prime))
     
     tau = top/bot
     return tau
     
-def generate_initial():
+def generate_initial(rng, shape=None):
     
     """
     Generates the inital grid of the system with randomly and uniformly
-    distributed linguistic features.
+    distributed linguistic features, drawn from the random stream rng. The
+    grid is GRID_SIZE by GRID_SIZE unless another shape is given.
     """
-    inital_color = np.random.rand(GRID_SIZE,GRID_SIZE)
+    if shape is None:
+        shape = (GRID_SIZE,GRID_SIZE)
+    inital_color = rng.random(shape)
     return inital_color
 
 def change_elements(float_map):
     """
     Takes in a map from the initially generated grid and turns the floats into
-    integers.
+    integers, thresholding the whole map in place at once.
 
     """
     data = float_map
-    for row in range(len((data))):
-        for column in range(len((data))):
-            if data[row,column] > 0.5:
-                data[row,column] = 1
-            else:
-                data[row,column] = 0
+    data[...] = data > 0.5
     return data
 
 def color_map(data,filename):
@@ -101,6 +167,8 @@ def color_map(data,filename):
     Creates a color map and takes in the data from the map created earlier as
     well as a filename that is used to create an animation.
     """
+    import matplotlib.pyplot as plt
+    from matplotlib import colors
     # create discrete colormap
     cmap = colors.ListedColormap(['yellow', 'blue'])
     bounds = [0,1,20]
@@ -127,6 +195,9 @@ def final_plot_with_circles(list_circles,data):
     """
     Plot of data, but it also adds circles on the boundaries.
     """
+    import matplotlib.pyplot as plt
+    from matplotlib import colors
+    import matplotlib.collections as mc
     
     sizes = len(list_circles)*[200]
     xy = list_circles
@@ -150,164 +221,142 @@ def final_plot_with_circles(list_circles,data):
     collection = mc.CircleCollection(sizes, offsets=xy, transOffset=ax.transData, color='black')
     ax.add_collection(collection)
   
-    plt.savefig("Language Evolution Map with Isogloss.png", dpi = 1200)
+    plt.savefig(output_path("Language Evolution Map with Isogloss.png"),
+                dpi = 1200)
     plt.show()
    
 
-def event():
+def event(rng):
     """
     Throws a dice to edcide whether a vertical or horizontal event happens
     """
     
-    dice = np.random.rand()
+    dice = rng.random()
     if dice > PROBABILITY_VERTICAL:
         return 1 #Int signify horizontal
     else:
         return 0 #Int signify vertical
 
-def vertical_event_ingress():
+def vertical_event_ingress(rng):
     """
     Throws a dice to devide whether vertical ingression was successful
     """
-    dice = np.random.rand()
+    dice = rng.random()
     if dice < PROBABILITY_INGRESS_VERT:
         return True
     else:
         return False
 
-def vertical_event_egress():
+def vertical_event_egress(rng):
     """
     Throws a dice to determine wehter verticel egression was successful
     """
-    dice = np.random.rand()
+    dice = rng.random()
     if dice < PROBABILITY_EGRESS_VERT:
         return True
     else:
         return False
     
-def horizontal_event_ingress():
+def horizontal_event_ingress(rng):
     """
    Throws a dice to determine whether horizontal ingression was successful
     """
-    dice = np.random.rand()
+    dice = rng.random()
     if dice < PROBABILITY_INGRESS_HORIZONTAL:
         return True
     else:
         return False
 
-def horizontal_event_egress():
+def horizontal_event_egress(rng):
     """
     Throws a dice to determine whether horizontal egression was successful
     """
-    dice = np.random.rand()
+    dice = rng.random()
     
     if dice < PROBABILITY_EGRESS_HORIZONTAL:
         return True
     else:
         return False
     
-def horizontal_walk(boo,x_coord,y_coord): #EDIT THIS FOR PERIODIC BOUNDARY CONDITIONS
-    """
-    Will randomly decide on a direction that won't cause an error in the
-    simulation
-    """
-    found = False
-    while found == False:
-        direction =  np.random.randint(1,5)
-        if direction == 1:
-            if y_coord-1 < 0:
-                found = True
-                y_coord = GRID_SIZE-1
-                return x_coord, y_coord
-            else:
-                found = True
-                return x_coord,y_coord-1
-        elif direction == 2:
-            if x_coord+1 > GRID_SIZE-1:
-                found = True
-                x_coord = 0
-                return x_coord, y_coord
-            else:
-                found = True
-                return x_coord+1,y_coord
-        elif direction == 3:
-           
-            if y_coord+1 > GRID_SIZE-1:
-                found = True
-                y_coord = 0
-                return x_coord, y_coord
-            else:
-                found = True
-                return x_coord,y_coord+1
-        else:
-            if x_coord-1 < 0:
-                found = True
-                x_coord = GRID_SIZE-1
-                return x_coord, y_coord
-            else:
-                found = True
-                return x_coord-1,y_coord
-            
+def horizontal_walk(cell, rng, lattice=None):
+    """
+    Picks the neighbour a horizontal event talks to: one uniformly chosen
+    entry of the cell's row in the neighbour table of the lattice, which on
+    the square torus wraps around the periodic boundaries.
+    """
+    if lattice is None:
+        lattice = lattice_topology()
+    return lattice.random_neighbour(cell, rng)
 
-def isogloss_calculator(data): #EDIT THIS FOR PERIODIC BOUNDARY CONDITIONS
+def isogloss_calculator(data, periodic=True, lattice=None):
     """
     Function calculates the number of blue to yellow or yellow to blue
     boundaries from which the isogloss density can be calculated. Will also
-    mark the boundaries using a tuple which will then later be graphed
+    mark the boundaries using a tuple which will then later be graphed.
 
+    The borders are the neighbour pairs of the lattice, a topology.Topology,
+    so they are the same ones the updates walk along. Without a lattice the
+    square grid of the data is taken, periodic or with open boundaries.
+    Every border is marked halfway between its cells, across the periodic
+    boundaries by the shortest way.
     """
-    
-    counter = 0
-    border_list =[]
-    
-    for row in range(len((data))):
-       for column in range(len((data))):
-           
-           #General Walk from right to left and downwards
-           if row < GRID_SIZE-1 and column < GRID_SIZE-1:
-               border_cen = data[row,column]
-               border_right = data[row,column+1]
-               border_down = data[row+1,column]
-               #Check if the cell right side is equal
-               if border_cen != border_right:
-                   counter = counter + 1
-                   dot = (0.5+column,0+row)
-                   border_list.append(dot)
-                   #Check if cell bottom is equal
-                   if border_cen != border_down:
-                       counter = counter + 1
-                       dot = (0+column,0.5+row)
-                       border_list.append(dot)
-                #Right check
-               elif border_cen != border_down:
-                   counter = counter + 1
-                   dot = (0+column,0.5+row)
-                   border_list.append(dot)
-                   #Bottom check
-                   if border_cen != border_right:
-                       counter = counter + 1
-                       dot = (0.5+column,0+row)
-                       border_list.append(dot)
-           #Right check only cause of index
-           elif row == GRID_SIZE-1 and column != GRID_SIZE-1:
-               border_cen = data[row,column]
-               border_right = data[row,column+1]
-               
-               if border_cen != border_right:
-                   counter = counter + 1
-                   dot = (0.5+column,0+row)
-                   border_list.append(dot)
-           #Bottom check only cause of index 
-           elif column == GRID_SIZE-1 and row != GRID_SIZE-1:
-               border_cen = data[row,column]
-               border_down = data[row+1,column]
-               if border_cen != border_down:
-                   counter = counter + 1
-                   dot = (0+column,0.5+row)
-                   border_list.append(dot)
-          
+    if lattice is None:
+        return square_isogloss(np.asarray(data), periodic)
+    if lattice.name in ("square", "square_open"):
+        return square_isogloss(np.asarray(data).reshape(lattice.shape),
+                               lattice.name == "square")
+    flat = np.asarray(data).reshape(-1)
+    #Every pair is in the table once from either side, keep one of them
+    border = ((flat[lattice.sources] != flat[lattice.neighbours])
+              & (lattice.sources < lattice.neighbours))
+    sources = lattice.sources[border]
+    targets = lattice.neighbours[border]
+    counter = len(sources)
+
+    border_list = np.empty((0, 2))
+    if lattice.coordinates is not None:
+        start = lattice.coordinates[sources]
+        step = lattice.coordinates[targets] - start
+        if len(lattice.shape) == 2:
+            sides = np.array(lattice.shape[::-1], dtype=float)
+            step = step - sides*np.round(step/sides)
+        border_list = start + step/2
+
+    return counter, border_list
+
+def square_isogloss(data, periodic=True):
+    """
+    isogloss_calculator() on the von Neumann square, without going through
+    the neighbour table. With periodic boundaries every cell has a right and
+    a bottom border, the ones on the last column and row wrap around the
+    torus like horizontal_walk() does. With open boundaries only interior
+    borders count.
+    """
+    right = data != np.roll(data, -1, axis=1)
+    down = data != np.roll(data, -1, axis=0)
+    if not periodic:
+        right[:, -1] = False
+        down[-1, :] = False
+
+    #Right borders sit half a cell right of the cell, bottom ones half below
+    rows, columns = np.nonzero(right)
+    right_dots = np.column_stack((0.5+columns, rows))
+    rows, columns = np.nonzero(down)
+    down_dots = np.column_stack((columns, 0.5+rows))
+    border_list = np.concatenate((right_dots, down_dots))
+    counter = len(border_list)
+
     return counter, border_list
 
+def number_of_borders(grid_size, periodic=True):
+    """
+    Number of neighbouring pairs of cells of the square grid, the same
+    number topology.square() has, used to normalise the isogloss density.
+    """
+    if periodic:
+        return 2*grid_size**2
+    return 2*grid_size*(grid_size-1)
+
 def calculate_freq_feature(data):
     """
     Takes in the integer map and counts the frequency of features numerically.
@@ -322,6 +371,7 @@ def calculate_freq_feature(data):
     return counter/(GRID_SIZE**2)
 
 def graph_freq_feat(freq_data,time):
+    import matplotlib.pyplot as plt
     
     plt.xlabel('Time (Monte Carlo Sweeps)')
     plt.axhline(y=frequency_of_feature_in_stationary_distribution(), 
@@ -331,10 +381,11 @@ def graph_freq_feat(freq_data,time):
     # giving a title to my graph
     plt.title('Frequency of Features (Averages) against Time')
     plt.scatter(time, freq_data)
-    plt.savefig("Freq.png", dpi = 1200)
+    plt.savefig(output_path("Freq.png"), dpi = 1200)
     plt.show()
     
 def graph_isogloss_density(iso_data,time):
+    import matplotlib.pyplot as plt
     
     t_freq = frequency_of_feature_in_stationary_distribution()
     hash_d = fitting_tau_and_hash(tau())
@@ -346,99 +397,199 @@ def graph_isogloss_density(iso_data,time):
     # giving a title to my graph
     plt.title('Isogloss Density (Averaged) against Time')
     plt.scatter(time, iso_data)
-    plt.savefig("Isogloss.png", dpi = 1200)
+    plt.savefig(output_path("Isogloss.png"), dpi = 1200)
     plt.show()
 
-def experiment(isogloss):
+def monte_carlo_step(integer_map, rng, profile=None, lattice=None):
+    """
+    Performs a single update of the Monte Carlo loop: picks a random cell,
+    decides between a vertical and horizontal event and writes the outcome
+    into the map, drawing from the random stream rng. Returns the number of
+    the cell that was written, counted row by row, and the value it held
+    before. The event is counted in the profile if given.
+    """
+    if lattice is None:
+        lattice = lattice_topology()
+    cells = integer_map.reshape(-1)
+    cell = rng.integers(0,lattice.size)
+    event_indicator = event(rng)
+    if event_indicator == 1 and cells[cell] == 1:#If it is a horizontal event and it is yellow (Ingress)
+        boolean = horizontal_event_ingress(rng)
+        new_cell = horizontal_walk(cell, rng, lattice)
+        previous = cells[new_cell]
+        if boolean == True:
+            cells[new_cell] = 0
+        else:
+            cells[new_cell] = 1
+        if profile is not None:
+            profile.count_event("horizontal", "ingress",
+                                cells[new_cell] != previous)
+        return new_cell, previous
+    elif event_indicator == 1 and cells[cell] == 0: #If it's horizontal and blue (egress)
+        boolean = horizontal_event_egress(rng)
+        new_cell = horizontal_walk(cell, rng, lattice)
+        previous = cells[new_cell]
+        if boolean == True:
+            cells[new_cell] = 1
+        else:
+            cells[new_cell] = 0
+        if profile is not None:
+            profile.count_event("horizontal", "egress",
+                                cells[new_cell] != previous)
+        return new_cell, previous
+    previous = cells[cell]
+    if event_indicator == 0 and cells[cell] == 1: #If it's vertical and yellow (Ingress)
+        boolean = vertical_event_ingress(rng)
+        if boolean == True:
+            cells[cell] = 0
+        else:
+            cells[cell] = 1
+        if profile is not None:
+            profile.count_event("vertical", "ingress",
+                                cells[cell] != previous)
+    else: # #If it's vertical and Blue (egress)
+        boolean = vertical_event_egress(rng)
+        if boolean == True:
+            cells[cell] = 1
+        else:
+            cells[cell] = 0
+        if profile is not None:
+            profile.count_event("vertical", "egress",
+                                cells[cell] != previous)
+    return cell, previous
+
+def experiment(isogloss, frame_buffer=None, recorder=None,
+               checkpoint_file=None, profile=None, rng=None, spatial=None,
+               seed=None):
+    """
+    Runs one realization of the serial loop. All random numbers come from
+    the stream rng, a random_streams.BufferedRandom or np.random.Generator;
+    without one a buffered stream is seeded from SEED. The cells and their
+    neighbours are those of lattice_topology(). A spatial_observables
+    SpatialAccumulator given as spatial samples the lattice every sweep.
+    A checkpoint is only resumed by a run with the same settings and seed,
+    the seed of rng or SEED without one.
+    """
+    lattice = lattice_topology()
+    if rng is None and seed is None:
+        seed = SEED
+    description = checkpoint_description(lattice, seed)
 
     counter = 0
-    inital_color = generate_initial()
-    integer_map = change_elements(inital_color)
-    color_map(integer_map, str(counter))
-    files= [] #File names that are used to create a GIF
     freq_feature = []
-    frequency_summed = []
     isogloss = []
-    isogloss_summed = []
     time_array = []
+    if profile is not None:
+        profile.start()
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        #Carry on from the last checkpoint, random state included
+        saved = checkpoint.load_checkpoint(checkpoint_file, description)
+        integer_map = saved["integer_map"]
+        rng = saved["rng"]
+        counter = saved["sweep"]*lattice.size
+        freq_feature = list(saved["observables"]["frequency"])
+        isogloss = list(saved["observables"]["isogloss"])
+        time_array = list(saved["observables"]["time"])
+        if recorder is not None:
+            #The series is flushed before every checkpoint, so it holds the
+            #rows of the checkpoint and perhaps rows recorded after it
+            recorder.truncate(min(len(recorder), len(time_array)))
+            for row in range(len(recorder), len(time_array)):
+                recorder.append(time=time_array[row],
+                                frequency=freq_feature[row],
+                                isogloss=isogloss[row])
+    else:
+        if recorder is not None:
+            #A fresh run replaces the series of an earlier one
+            recorder.truncate(0)
+        if rng is None:
+            rng = random_streams.BufferedRandom(SEED)
+        if WARM_START and TOPOLOGY is None:
+            import warm_start
+            integer_map = warm_start.coarse_to_fine(
+                GRID_SIZE, model_parameters(),
+                np.random.default_rng(rng.integers(0, 2**62)))[0]
+        else:
+            inital_color = generate_initial(rng, lattice.shape)
+            integer_map = change_elements(inital_color)
+        if not HEADLESS:
+            color_map(integer_map, str(counter))
+        elif frame_buffer is not None:
+            frame_buffer.record(0, integer_map)
+    tracker = ObservableTracker(integer_map, lattice=lattice)
     
-    for trials in range(TRIALS):
-        y,x = np.random.randint(0,GRID_SIZE, size=(2))
-        event_indicator = event()
-        if event_indicator == 1 and integer_map[y,x] == 1:#If it is a horizontal event and it is yellow (Ingress)
-            boolean = horizontal_event_ingress()
-            x_new_cell, y_new_cell = horizontal_walk(boolean,x,y)
-            if boolean == True:
-                integer_map[y_new_cell,x_new_cell] = 0
-                counter = counter + 1
-            else:
-                integer_map[y_new_cell,x_new_cell] = 1
-                counter = counter + 1
-        elif event_indicator == 1 and integer_map[y,x] == 0: #If it's horizontal and blue (egress)
-            boolean = horizontal_event_egress()
-            x_new_cell, y_new_cell = horizontal_walk(boolean,x,y)
-            if boolean == True:
-                integer_map[y_new_cell,x_new_cell] = 1
-                counter = counter + 1
-            else:
-                integer_map[y_new_cell,x_new_cell] = 0
-                counter = counter + 1
-        elif event_indicator == 0 and integer_map[y,x] == 1: #If it's vertical and yellow (Ingress)
-            boolean = vertical_event_ingress()
-            if boolean == True:
-                integer_map[y,x] = 0
-                counter = counter + 1
-            else:
-                integer_map[y,x] = 1
-                counter = counter + 1
-        else: # #If it's vertical and Blue (egress)
-            boolean = vertical_event_egress()
-            if boolean == True:
-                integer_map[y,x] = 1
-                counter = counter + 1
-            else:
-                integer_map[y,x] = 0
-                counter = counter + 1
-        if counter % GRID_SIZE**2 == 0:
+    for trials in range(counter, TRIALS):
+        if profile is not None:
+            started = profile.clock()
+        cell, previous = monte_carlo_step(integer_map, rng, profile, lattice)
+        if profile is not None:
+            profile.add_time("update", started)
+            started = profile.clock()
+        tracker.cell_changed(cell, previous)
+        counter = counter + 1
+        if counter % lattice.size == 0:
             name = str(counter)
-            frequency = calculate_freq_feature(integer_map)
+            frequency = tracker.frequency()
             
             freq_feature.append(frequency)
-         
-            freq_sum = freq_feature
-            
-            frequency_summed.append(freq_sum)
-            count, borders = isogloss_calculator(integer_map)
-            isogloss.append(count/NUMBER_OF_BORDERS)
-            iso_sum = (isogloss)
-            #print("Isogloss Mean,", iso_sum)
-            isogloss_summed.append(iso_sum)
+            isogloss.append(tracker.isogloss_density())
             print(counter)
-            time_array.append(counter/GRID_SIZE**2)
-            
-            #GIF CREATING - START
-            filename = color_map(integer_map, name)
-            # filename = filename+".png"
-            # files.append(filename)
+            time_array.append(counter/lattice.size)
+            if spatial is not None:
+                spatial.sample(integer_map)
+            if profile is not None:
+                profile.add_time("measurement", started)
+                started = profile.clock()
+            if recorder is not None:
+                recorder.append(time=time_array[-1], frequency=frequency,
+                                isogloss=isogloss[-1])
             
-    # with imageio.get_writer('mygif.gif', mode='I') as writer:
-    #     for filename in files:
-    #         image = imageio.imread(filename)
-    #         writer.append_data(image)
-        
-    # for filename in set(files):
-    #     os.remove(filename)
-    #GIF CREATING - END
+            #Snapshots for the GIF are rendered afterwards by rendering.py
+            sweep = counter//lattice.size
+            if not HEADLESS:
+                filename = color_map(integer_map, name)
+                if profile is not None:
+                    profile.add_time("plotting", started)
+                    started = profile.clock()
+            elif frame_buffer is not None and sweep % SNAPSHOT_INTERVAL == 0:
+                frame_buffer.record(sweep, integer_map)
+            if checkpoint_file is not None and (
+                    sweep % CHECKPOINT_INTERVAL == 0
+                    or counter + lattice.size > TRIALS):
+                if recorder is not None:
+                    recorder.flush()
+                checkpoint.save_checkpoint(checkpoint_file, integer_map, sweep,
+                                           {"frequency": freq_feature,
+                                            "isogloss": isogloss,
+                                            "time": time_array}, rng,
+                                           description)
+            if profile is not None:
+                profile.add_time("io", started)
+        elif profile is not None:
+            profile.add_time("measurement", started)
         
-    iso_count, borders = isogloss_calculator(integer_map)
-    graph_freq_feat(freq_feature,time_array)
-    graph_isogloss_density(isogloss, time_array)
-    if isogloss == True:
-        final_plot_with_circles(borders,integer_map)
+    if profile is not None:
+        started = profile.clock()
+    isogloss_density = lattice.isogloss_density(integer_map)
+    if profile is not None:
+        profile.add_time("measurement", started)
+        started = profile.clock()
+    if not HEADLESS:
+        graph_freq_feat(freq_feature,time_array)
+        graph_isogloss_density(isogloss, time_array)
+        if isogloss == True:
+            iso_count, borders = isogloss_calculator(integer_map,
+                                                     lattice=lattice)
+            final_plot_with_circles(borders,integer_map)
+        if profile is not None:
+            profile.add_time("plotting", started)
+    if profile is not None:
+        profile.stop()
+        print(profile.table())
     print("Tau is theoretically:", tau())
     print("Frequency of features is theoretically:", 
           frequency_of_feature_in_stationary_distribution())
-    print("Isogloss density is:", iso_count/NUMBER_OF_BORDERS)
+    print("Isogloss density is:", isogloss_density)
     t_freq = frequency_of_feature_in_stationary_distribution()
     hash_d = fitting_tau_and_hash(tau())
     isogloss_t = 2*hash_d * (1-t_freq)*t_freq
@@ -447,27 +598,124 @@ def experiment(isogloss):
     return freq_feature, time_array, isogloss
 
 
+def warm_start_description(enabled=None):
+    """
+    Extra fields of the description of a stored realization that started
+    warm, with the settings of the ladder, so warm and cold starts are never
+    mixed up in the result cache. enabled defaults to WARM_START.
+    """
+    if enabled is None:
+        enabled = WARM_START
+    if not enabled:
+        return {}
+    import warm_start
+    return {"warm_start": {"coarse_size": warm_start.COARSE_SIZE,
+                           "coarse_sweeps": warm_start.COARSE_SWEEPS,
+                           "level_sweeps": warm_start.LEVEL_SWEEPS}}
+
+def checkpoint_description(lattice, seed=None):
+    """
+    Description of a run of the serial loop for its checkpoints: the
+    parameters, lattice, number of updates and seed, None for a fresh one.
+    """
+    return result_cache.describe("checkpoint", "loop", model_parameters(),
+                                 GRID_SIZE, TRIALS//lattice.size, seed,
+                                 trials=TRIALS, topology=lattice.name,
+                                 cells=lattice.size,
+                                 **warm_start_description())
+
 def _main_():
 
-    data_in, time, iso_data_in = np.array((experiment(False)))
+    sweeps = TRIALS//lattice_topology().size
+    data_in = np.empty((REALIZATION, sweeps))
+    iso_data_in = np.empty((REALIZATION, sweeps))
+    #Every realization gets its own substream of the seed of the run
+    seeds = random_streams.seed_sequence(SEED)
+    cache = None
+    if RESULT_CACHE is not None and TOPOLOGY is None:
+        cache = result_cache.ResultCache(RESULT_CACHE)
+    spatial = None
+    if SPATIAL_OBSERVABLES and TOPOLOGY is not None:
+        #The FFTs of C(r) and S(k) need the square torus
+        print("Spatial observables are only measured on the square torus, "
+              "skipping them on", TOPOLOGY.name)
+    elif SPATIAL_OBSERVABLES:
+        #scipy is only loaded when the spatial observables are measured
+        import spatial_observables
+        spatial = spatial_observables.SpatialAccumulator(GRID_SIZE)
     
-    for _ in range(REALIZATION-1):
-         data, time, iso_data = (experiment(False))
-         data = np.array(data)
-         iso_data = np.array(iso_data)
-         data_in = np.vstack((data_in,data))
-         iso_data_in = np.vstack((iso_data_in,iso_data))
+    #Headless runs keep the snapshots of the first realization on disk. A
+    #resumed run adds to its frames, a new one replaces those of older runs.
+    frames = None
+    if HEADLESS:
+        resuming = (checkpoint_path(0) is not None
+                    and os.path.exists(checkpoint_path(0)))
+        frames = rendering.FrameBuffer(output_path("frames"),
+                                       clear=not resuming)
+    for realization in range(REALIZATION):
+         recorder = None
+         if SERIES_DIRECTORY is not None:
+             recorder = SeriesRecorder(os.path.join(
+                 output_path(SERIES_DIRECTORY),
+                 "realization_" + str(realization)),
+                 attributes={"seed": seeds.entropy,
+                             "realization": realization})
+         checkpoint_file = checkpoint_path(realization)
+         profile = None
+         if PROFILE:
+             profile = instrumentation.Profile(sampling=PROFILE_SAMPLING)
+         #Realizations that only give the averages are looked up first.
+         #A stored realization records no frames.
+         description = None
+         stored = None
+         if (cache is not None and recorder is None and checkpoint_file is None
+                 and profile is None and spatial is None):
+             description = result_cache.describe(
+                 "realization", "loop", model_parameters(), GRID_SIZE, sweeps,
+                 SEED, (realization,), **warm_start_description())
+             stored = cache.get(description)
+         if stored is not None:
+             data = stored["frequency"]
+             time = stored["time"]
+             iso_data = stored["isogloss"]
+         else:
+             rng = random_streams.generator(seeds, realization)
+             seed = None
+             if SEED is not None:
+                 seed = random_streams.substream(seeds, realization)
+             data, time, iso_data = experiment(False, frames, recorder,
+                                               checkpoint_file, profile, rng,
+                                               spatial, seed)
+             if description is not None:
+                 cache.put(description, {"frequency": data, "time": time,
+                                         "isogloss": iso_data})
+         frames = None
+         if profile is not None:
+             profile.write(output_path("profile_realization_"
+                                       + str(realization) + ".json"))
+         if recorder is not None:
+             recorder.close()
+         data_in[realization] = data
+         iso_data_in[realization] = iso_data
          
     
     iso_average = np.mean(iso_data_in, axis=0)     
     f_averages = np.mean(data_in, axis=0)
-    graph_freq_feat(f_averages,time)
-    graph_isogloss_density(iso_average, time)
-    np.savetxt("iso_average.csv", iso_average)
-    np.savetxt("frequency_average.csv", f_averages)
+    if not HEADLESS:
+        graph_freq_feat(f_averages,time)
+        graph_isogloss_density(iso_average, time)
+    np.savetxt(output_path("iso_average.csv"), iso_average)
+    np.savetxt(output_path("frequency_average.csv"), f_averages)
+    if spatial is not None:
+        spatial.save(output_path("spatial_observables.npz"))
+    with open(output_path("run_metadata.json"), "w") as file:
+        json.dump({"seed": seeds.entropy, "realizations": REALIZATION,
+                   "grid_size": GRID_SIZE, "trials": TRIALS,
+                   "params": model_parameters()}, file, indent=1)
     
 
-_main_()    
+if __name__ == "__main__":
+    _main_()
 
 """
 Section Below is for Debugging
@@ -483,8 +731,13 @@ Section Below is for Debugging
 #print("Isogloss density theoretically is:", isogloss_t)
 
 
-# inital_color = generate_initial()
+# inital_color = generate_initial(random_streams.BufferedRandom())
 # integer_map = change_elements(inital_color)
 # color_map(integer_map, str(0))
 # iso_count, borders = isogloss_calculator(integer_map)
-# final_plot_with_circles(borders,integer_map)
\ No newline at end of file
+# final_plot_with_circles(borders,integer_map)
+
+# frames = rendering.FrameBuffer("frames")
+# experiment(False, frames) # with HEADLESS = True
+# filenames = rendering.render_frames(frames, "pictures")
+# rendering.assemble_gif(filenames, "mygif.gif")
\ No newline at end of file
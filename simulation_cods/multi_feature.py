@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simulation of many independent linguistic features on one lattice.
+
+The lattice is an (F, GRID_SIZE, GRID_SIZE) array with one layer per feature.
+Each feature has its own transmission probabilities, given as arrays of
+length F. Every sweep shares the chosen sites and walk directions between all
+features, while the event type and acceptance dice are drawn per feature, so
+each layer still follows its own dynamics.
+
+The sweep follows the batched engine of batched_sweep.py, with the sublattice
+phases and the ordering of repeated cells worked out once for all layers.
+One set of array operations then updates every feature. Each feature still
+needs its own dice, one uniform per draw, so the cost grows with the number
+of features, but slowly: on a 64 by 64 lattice a sweep of 200 features
+takes about 10 times as long as one of a single feature.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+import language_evolution_simulation as simulation
+import batched_sweep
+
+def feature_parameters(parameter_sets):
+    """
+    Turns a list of parameter dictionaries, one per feature, into a
+    dictionary of arrays indexed by feature.
+    """
+    return {name: np.array([params[name] for params in parameter_sets],
+                           dtype=float)
+            for name in simulation.PARAMETER_NAMES}
+
+def random_lattice(features, grid_size, rng=None):
+    """
+    Uniformly random initial lattice for every feature.
+    """
+    rng = np.random.default_rng(rng)
+    values = rng.random((features, grid_size, grid_size))
+    return (values > 0.5).astype(np.uint8)
+
+def outcome_codes(params, uniforms):
+    """
+    What every draw does to every feature, from one uniform per draw and
+    feature, given as a (draws, F) array. A uniform below vertical is a
+    vertical event, otherwise a horizontal one, and within its interval it
+    is the acceptance die, so the ingress and egress thresholds are scaled
+    into that interval. Bit 0 is the new value of a blue source, bit 1 that
+    of a yellow source and bit 2 is set for horizontal events.
+    """
+    vertical = params["vertical"]
+    horizontal = uniforms >= vertical
+    #Vertical thresholds lie below vertical and horizontal ones above it
+    codes = ((uniforms < vertical*params["egress_vert"])
+             | (horizontal & (uniforms < vertical + (1 - vertical)
+                              *params["egress_horizontal"])))
+    codes = codes.astype(np.uint8)
+    codes |= (((uniforms >= vertical*params["ingress_vert"]) & ~horizontal)
+              | (uniforms >= vertical + (1 - vertical)
+                 *params["ingress_horizontal"])).astype(np.uint8) << 1
+    codes |= horizontal.astype(np.uint8) << 2
+    return codes
+
+def multi_feature_sweep(lattice, params, rng):
+    """
+    Performs one Monte Carlo sweep of every feature of the lattice in place.
+
+    A shared draw touches the chosen site (vertical events) or its neighbour
+    (horizontal events). Both cells have different sublattice colours, so in
+    the phase of one colour each draw has at most one cell it can write, the
+    same for every feature. Ranking draws by that cell is therefore done once
+    and holds for all layers. The outcomes are worked out for all draws and
+    features at once by outcome_codes(), and the sweep runs on a copy with
+    the features of a cell next to each other, so a batch reads and writes
+    whole rows of bytes.
+    """
+    features, grid_size = lattice.shape[0], lattice.shape[1]
+    cells = grid_size**2
+    site = rng.integers(0, cells, size=cells)
+    direction = rng.integers(0, 4, size=cells)
+    codes = outcome_codes(params, rng.random((cells, features)))
+
+    y, x = np.divmod(site, grid_size)
+    y_new = (y + batched_sweep.DIRECTION_Y[direction]) % grid_size
+    x_new = (x + batched_sweep.DIRECTION_X[direction]) % grid_size
+    neighbour = y_new*grid_size + x_new
+    colors, number_of_colors = batched_sweep.sublattice_colors(grid_size)
+    site_color = colors.ravel()[site]
+    neighbour_color = colors.ravel()[neighbour]
+
+    by_cell = np.ascontiguousarray(lattice.reshape(features, cells).T,
+                                   dtype=np.uint8)
+    for color in rng.permutation(number_of_colors):
+        selected = np.flatnonzero((site_color == color)
+                                  | (neighbour_color == color))
+        to_neighbour = (neighbour_color[selected] == color).astype(np.uint8)
+        cell = np.where(to_neighbour, neighbour[selected], site[selected])
+        rank = batched_sweep.occurrence_rank(cell)
+        for repeat in range(rank.max(initial=-1) + 1):
+            in_batch = rank == repeat
+            batch = selected[in_batch]
+            batch_cells = cell[in_batch]
+            batch_codes = codes[batch]
+            #Features whose event writes the cell of this colour
+            active = (batch_codes >> 2) == to_neighbour[in_batch][:, None]
+            new_value = (batch_codes >> by_cell[site[batch]]) & 1
+            by_cell[batch_cells] = np.where(active, new_value,
+                                            by_cell[batch_cells])
+    lattice[...] = by_cell.T.reshape(lattice.shape)
+    return lattice
+
+def measure(lattice):
+    """
+    Frequency of the blue feature and isogloss density of every layer, on the
+    torus, in one batched operation.
+    """
+    cells = lattice.shape[1]*lattice.shape[2]
+    frequency = np.count_nonzero(lattice == 0, axis=(1, 2))/cells
+    borders = (np.count_nonzero(lattice != np.roll(lattice, -1, axis=2),
+                                axis=(1, 2))
+               + np.count_nonzero(lattice != np.roll(lattice, -1, axis=1),
+                                  axis=(1, 2)))
+    return frequency, borders/(2*cells)
+
+def run_sweeps(lattice, sweeps, params, rng):
+    """
+    Evolves every feature for a number of sweeps. Returns the frequency and
+    isogloss density after each sweep as (sweeps, F) arrays.
+    """
+    features = lattice.shape[0]
+    frequency = np.empty((sweeps, features))
+    isogloss = np.empty((sweeps, features))
+    for sweep in range(sweeps):
+        multi_feature_sweep(lattice, params, rng)
+        frequency[sweep], isogloss[sweep] = measure(lattice)
+    return frequency, isogloss
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental tracking of the observables of the language evolution model.
+
+calculate_freq_feature() and isogloss_calculator() rescan the whole grid for
+every measurement. A single update only changes one cell and the borders
+around it, so the tracker below keeps the number of blue (0) cells and the
+number of unlike neighbour borders up to date at constant cost per update.
+The borders are the ones of the neighbour table of a topology.Topology, the
+same table the serial loop walks.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+import topology
+
+class ObservableTracker:
+    """
+    Follows an integer map and its counts. Without a lattice the map is a
+    square grid, on the torus that horizontal_walk() walks with periodic
+    boundaries and with only the interior borders counted with open ones.
+    Cells are numbered row by row, like in topology.
+    """
+
+    def __init__(self, integer_map, periodic=True, lattice=None):
+        self.integer_map = integer_map
+        if lattice is None:
+            if periodic:
+                lattice = topology.square_torus(len(integer_map))
+            else:
+                lattice = topology.open_square(len(integer_map))
+        self.lattice = lattice
+        #Flat view, so a cell number indexes the map directly
+        self.cells = integer_map.reshape(-1)
+        self.zeros, self.borders = self.full_count()
+
+    def number_of_borders(self):
+        """
+        Number of neighbour pairs of the lattice, used to normalise the
+        isogloss density.
+        """
+        return self.lattice.number_of_borders()
+
+    def neighbours(self, cell):
+        """
+        Neighbours of a cell, for a square lattice in the same order as
+        horizontal_walk(): up, right, down and left.
+        """
+        return self.lattice.neighbours_of(cell)
+
+    def cell_changed(self, cell, previous):
+        """
+        Updates the counts after a cell of the map was overwritten. previous
+        is the value the cell held before the write.
+        """
+        value = self.cells[cell]
+        if value == previous:
+            return
+        for neighbour in self.lattice.neighbours_of(cell):
+            if self.cells[neighbour] == previous:
+                self.borders = self.borders + 1
+            else:
+                self.borders = self.borders - 1
+        if previous == 0:
+            self.zeros = self.zeros - 1
+        elif value == 0:
+            self.zeros = self.zeros + 1
+
+    def write(self, cell, value):
+        """
+        Writes a value into the map and updates the counts.
+        """
+        previous = self.cells[cell]
+        self.cells[cell] = value
+        self.cell_changed(cell, previous)
+
+    def frequency(self):
+        """
+        Frequency of the blue (0) feature, as in calculate_freq_feature().
+        """
+        return self.zeros/self.lattice.size
+
+    def isogloss_density(self):
+        """
+        Fraction of neighbour pairs that disagree.
+        """
+        return self.borders/self.number_of_borders()
+
+    def full_count(self):
+        """
+        Recounts the blue cells and unlike borders over the whole map.
+        """
+        zeros = int(np.count_nonzero(self.cells == 0))
+        return zeros, self.lattice.unlike_borders(self.cells)
+
+    def verify(self):
+        """
+        Checks the incrementally tracked counts against a full recount.
+        """
+        return (self.zeros, self.borders) == self.full_count()
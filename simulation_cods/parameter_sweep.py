@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps of the language evolution model.
+
+Runs many parameter points, each for several realizations, on a process pool
+and collects everything into one table: the parameters, the theoretical tau
+and frequency of features, and the measured frequency and isogloss density.
+
+Points are ordered by tau and handed out in chunks. Within a chunk the lattice
+of one point is the starting state of the next, so only the first point of a
+chunk needs the full burn in. Chains can be kept in a result_cache.ResultCache,
+so repeating a sweep with the same seed only simulates the chains that are
+not stored yet.
+@author: Qi Nohr Chen
+"""
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import numpy as np
+import pandas as pd
+import language_evolution_simulation as simulation
+import realizations
+import convergence
+import random_streams
+import result_cache
+
+def model_point(q, p, p_prime, rho=0.5):
+    """
+    Turns the horizontal probability q, the vertical and horizontal error
+    rates p and p' and a target frequency of features rho into the dictionary
+    of transmission probabilities used by the engines.
+    """
+    return {"vertical": 1 - q,
+            "egress_vert": (1 - rho)*p, "ingress_vert": rho*p,
+            "egress_horizontal": (1 - rho)*p_prime,
+            "ingress_horizontal": rho*p_prime}
+
+def parameter_grid(q, p, p_prime, rho=(0.5,)):
+    """
+    Every combination of the given values of q, p, p' and rho as a list of
+    parameter dictionaries.
+    """
+    return [model_point(*point) for point in
+            itertools.product(q, p, p_prime, rho)]
+
+def run_chain(points, realization, seed, grid_size, sweeps, burn_in,
+              warm_burn_in, engine, backend, tolerance=None):
+    """
+    Runs one realization through a chain of parameter points, carrying the
+    lattice from one point to the next. Returns a row of results per point.
+    With a tolerance each point runs until its standard errors are below it,
+    for at most the given number of sweeps.
+    """
+    rng = np.random.default_rng(seed)
+    integer_map = simulation.change_elements(rng.random((grid_size, grid_size)))
+    rows = []
+    for n, (index, params) in enumerate(points):
+        warm_up = burn_in if n == 0 else warm_burn_in
+        if warm_up > 0:
+            realizations.run_engine(engine, integer_map, warm_up, params, rng,
+                                    backend)
+        if tolerance is not None:
+            summary = convergence.run_until_converged(
+                integer_map, params, rng, tolerance, sweeps, engine=engine,
+                backend=backend)
+            rows.append({"point": index, "realization": realization,
+                         "frequency": summary["frequency"],
+                         "isogloss": summary["isogloss"],
+                         "sweeps_run": summary["sweeps"]})
+            continue
+        frequency, isogloss = realizations.run_engine(engine, integer_map,
+                                                      sweeps, params, rng,
+                                                      backend)
+        rows.append({"point": index, "realization": realization,
+                     "frequency": frequency.mean(),
+                     "isogloss": isogloss.mean()})
+    return rows
+
+def chain_description(chunk, seed, stream, grid_size, sweeps, burn_in,
+                      warm_burn_in, engine, tolerance):
+    """
+    Description of a chain for the result cache. seed is the seed of the
+    sweep and stream the key of the chain's substream. The numbers of the
+    points within the sweep are left out, so the same chain is found from
+    any sweep.
+    """
+    return result_cache.describe("sweep_chain", engine,
+                                 [params for index, params in chunk],
+                                 grid_size, sweeps, seed, stream,
+                                 burn_in=burn_in,
+                                 warm_burn_in=warm_burn_in,
+                                 tolerance=tolerance)
+
+def run_sweep(parameter_sets, realization_count, sweeps, grid_size=None,
+              burn_in=None, warm_burn_in=None, chunk_size=4, seed=None,
+              workers=None, engine="serial", backend="auto", filename=None,
+              tolerance=None, cache=None):
+    """
+    Simulates every parameter set for a number of realizations. Each
+    realization of each point is measured over the given number of sweeps
+    after its burn in, or with a tolerance until it has converged (see
+    convergence.py). Chains found in the cache, if one is given, are not
+    simulated again. Returns a table with one row per parameter point and
+    optionally writes it to a csv file.
+    """
+    if grid_size is None:
+        grid_size = simulation.GRID_SIZE
+    if burn_in is None:
+        burn_in = sweeps
+    if warm_burn_in is None:
+        warm_burn_in = burn_in//4
+    if workers is None:
+        workers = os.cpu_count()
+    seed_sequence = random_streams.seed_sequence(seed)
+
+    #Neighbouring points in tau have similar equilibria, so chain those
+    taus = [simulation.tau(params) for params in parameter_sets]
+    order = sorted(range(len(parameter_sets)), key=lambda n: taus[n])
+    chunks = [[(n, parameter_sets[n]) for n in order[start:start+chunk_size]]
+              for start in range(0, len(order), chunk_size)]
+
+    jobs = []
+    rows = []
+    descriptions = []
+    for realization in range(realization_count):
+        for number, chunk in enumerate(chunks):
+            chain_seed = random_streams.substream(seed_sequence, realization,
+                                                  number)
+            if cache is not None:
+                description = chain_description(chunk, seed,
+                                                (realization, number),
+                                                grid_size, sweeps, burn_in,
+                                                warm_burn_in, engine,
+                                                tolerance)
+                stored = cache.get(description)
+                if stored is not None:
+                    for position, (index, params) in enumerate(chunk):
+                        row = {"point": index, "realization": realization}
+                        row.update({name: stored[name][position].item()
+                                    for name in stored})
+                        rows.append(row)
+                    continue
+                descriptions.append(description)
+            jobs.append((chunk, realization, chain_seed, grid_size, sweeps,
+                         burn_in, warm_burn_in, engine, backend, tolerance))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(run_chain, *zip(*jobs)) if jobs else []
+        for number, chain_rows in enumerate(results):
+            rows.extend(chain_rows)
+            if cache is not None:
+                measured = pd.DataFrame(chain_rows).drop(
+                    columns=["point", "realization"])
+                cache.put(descriptions[number],
+                          {name: measured[name].to_numpy()
+                           for name in measured.columns})
+
+    measured = pd.DataFrame(rows).groupby("point")
+    table = pd.DataFrame(parameter_sets)
+    table["tau"] = taus
+    table["rho"] = [simulation.frequency_of_feature_in_stationary_distribution(
+        params) for params in parameter_sets]
+    table["frequency"] = measured["frequency"].mean()
+    table["frequency_error"] = measured["frequency"].sem()
+    table["isogloss"] = measured["isogloss"].mean()
+    table["isogloss_error"] = measured["isogloss"].sem()
+    if tolerance is not None:
+        table["sweeps_run"] = measured["sweeps_run"].mean()
+    table["realizations"] = realization_count
+    table["grid_size"] = grid_size
+    table["sweeps"] = sweeps
+    table["seed"] = seed_sequence.entropy
+    if filename is not None:
+        table.to_csv(filename, index=False)
+    return table
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Explicit, reproducible random number streams for the simulation.
+
+Every run starts from one seed. Independent substreams for realizations and
+parameter points are derived from it with np.random.SeedSequence, keyed by
+their numbers, so a stream does not depend on how many others exist or in
+which order or process they run.
+
+The serial loop draws one number at a time. BufferedRandom draws uniforms
+from a Generator in large blocks and hands them out one by one, which avoids
+the overhead of a numpy call per draw. The values form a single sequence, so
+draws of arrays and of single numbers can be mixed freely and its state,
+the Generator state before the current block plus the position in it, can
+be checkpointed and restored exactly.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+
+BLOCK_SIZE = 65536
+
+def seed_sequence(seed=None):
+    """
+    A SeedSequence from a seed, which may already be one. A seed of None
+    takes fresh entropy from the operating system.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+def substream(seed, *key):
+    """
+    Seed of the independent substream with the given key, for example
+    (realization,) or (realization, point). The same seed and key always
+    give the same stream.
+    """
+    parent = seed_sequence(seed)
+    return np.random.SeedSequence(parent.entropy,
+                                  spawn_key=parent.spawn_key + tuple(key))
+
+class BufferedRandom:
+    """
+    Generator wrapper that pre-draws uniforms in blocks. Offers random() and
+    integers() like np.random.Generator for the draws of the serial loop.
+    """
+
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        if isinstance(seed, np.random.Generator):
+            self.rng = seed
+        else:
+            self.rng = np.random.default_rng(seed_sequence(seed))
+        self.block_size = block_size
+        self.refill()
+
+    def refill(self):
+        """
+        Draws the next block. The state before it is kept for state().
+        """
+        self.block_state = self.rng.bit_generator.state
+        self.block = self.rng.random(self.block_size).tolist()
+        self.position = 0
+
+    def random(self, size=None):
+        """
+        The next uniform in [0, 1), or an array of the next ones when a size
+        is given.
+        """
+        if size is None:
+            if self.position == self.block_size:
+                self.refill()
+            value = self.block[self.position]
+            self.position = self.position + 1
+            return value
+        values = np.empty(size)
+        flat = values.reshape(-1)
+        done = 0
+        while done < flat.size:
+            if self.position == self.block_size:
+                self.refill()
+            take = min(flat.size - done, self.block_size - self.position)
+            flat[done:done+take] = self.block[self.position:self.position+take]
+            self.position = self.position + take
+            done = done + take
+        return values
+
+    def integers(self, low, high=None):
+        """
+        A uniform integer from low up to but not including high, or from 0
+        to low when high is not given.
+        """
+        if high is None:
+            low, high = 0, low
+        return low + int(self.random()*(high - low))
+
+    def state(self):
+        """
+        State of the stream in a form json can store.
+        """
+        return {"block_state": self.block_state, "position": self.position,
+                "block_size": self.block_size}
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuilds a stream from state(). It continues exactly where the saved
+        one was.
+        """
+        block_state = state["block_state"]
+        bit_generator = getattr(np.random, block_state["bit_generator"])()
+        bit_generator.state = block_state
+        stream = cls(np.random.Generator(bit_generator), state["block_size"])
+        stream.position = state["position"]
+        return stream
+
+def generator(seed, *key, block_size=BLOCK_SIZE):
+    """
+    Buffered stream of the substream with the given key.
+    """
+    return BufferedRandom(substream(seed, *key), block_size)
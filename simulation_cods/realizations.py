@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel execution of independent realizations of the language evolution
+model.
+
+Each realization gets its own stream spawned from one np.random.SeedSequence,
+so a run is reproducible from a single seed no matter how many worker
+processes share the work. Results are streamed back in realization order into
+preallocated arrays and a running mean/variance accumulator. With a
+result_cache.ResultCache only the realizations not found in it are simulated.
+@author: Qi Nohr Chen
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+import language_evolution_simulation as simulation
+import compiled_kernels
+import batched_sweep
+import event_driven
+import random_streams
+import result_cache
+
+def run_engine(engine, integer_map, sweeps, params, rng, backend="auto",
+               lattice=None):
+    """
+    Runs one of the simulation engines on the integer map. "serial" is the
+    serial dynamics of compiled_kernels, "checkerboard" the batched engine and
+    "event" the rejection-free engine of event_driven. Only the serial engine
+    runs on other topologies than the square torus.
+    """
+    if engine == "serial":
+        return compiled_kernels.run_sweeps(integer_map, sweeps, params, rng,
+                                           backend, lattice)
+    if lattice is not None and lattice.name != "square":
+        raise ValueError("The " + str(engine) + " engine only runs on the "
+                         "square torus")
+    if engine == "checkerboard":
+        return batched_sweep.run_sweeps(integer_map, sweeps, params, rng)
+    if engine == "event":
+        return event_driven.run_sweeps(integer_map, sweeps, params, rng,
+                                       backend)
+    raise ValueError("Unknown engine " + str(engine))
+
+class RunningMoments:
+    """
+    Welford accumulator for the mean and variance of a series of arrays,
+    so realizations never have to be kept in memory to be averaged.
+    """
+
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.squares = np.zeros(shape)
+
+    def add(self, values):
+        """
+        Adds one realization to the accumulator.
+        """
+        self.count = self.count + 1
+        delta = values - self.mean
+        self.mean = self.mean + delta/self.count
+        self.squares = self.squares + delta*(values - self.mean)
+
+    def variance(self):
+        """
+        Sample variance over the realizations added so far.
+        """
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return self.squares/(self.count - 1)
+
+def simulate_realization(seed, params, grid_size, sweeps, engine="serial",
+                         backend="auto", warm_start=False, tolerance=None):
+    """
+    Runs a single realization from a fresh random lattice, or with
+    warm_start=True from the coarse to fine start of warm_start.py. This is
+    the job handed to each worker process. With a tolerance the realization
+    stops once it has converged (see convergence.py), after at most the
+    given number of sweeps, and the summary of its stationary part is
+    returned instead of its series.
+    """
+    rng = np.random.default_rng(seed)
+    if warm_start:
+        import warm_start as ladder
+        integer_map = ladder.coarse_to_fine(grid_size, params, rng,
+                                            engine=engine, backend=backend)[0]
+    else:
+        integer_map = simulation.change_elements(
+            rng.random((grid_size, grid_size)))
+    if tolerance is not None:
+        #convergence runs its blocks through run_engine() of this module
+        import convergence
+        return convergence.run_until_converged(integer_map, params, rng,
+                                               tolerance, sweeps,
+                                               engine=engine, backend=backend)
+    frequency, isogloss = run_engine(engine, integer_map, sweeps, params, rng,
+                                     backend)
+    return {"frequency": frequency, "isogloss": isogloss}
+
+def converged_summary(summaries, seed_sequence):
+    """
+    Results of realizations run to a tolerance: the stationary mean,
+    standard error, burn in and sweeps run of every realization, and the
+    mean and variance of the stationary means over the realizations.
+    """
+    table = {name: np.array([float(summary[name]) for summary in summaries])
+             for name in ("frequency", "frequency_error", "isogloss",
+                          "isogloss_error", "burn_in", "sweeps",
+                          "converged")}
+    result = {"frequency": table["frequency"],
+              "frequency_error": table["frequency_error"],
+              "isogloss": table["isogloss"],
+              "isogloss_error": table["isogloss_error"],
+              "burn_in": table["burn_in"].astype(int),
+              "sweeps_run": table["sweeps"].astype(int),
+              "converged": table["converged"].astype(bool),
+              "seed": seed_sequence.entropy}
+    for name in ("frequency", "isogloss"):
+        result[name + "_mean"] = table[name].mean()
+        result[name + "_variance"] = (table[name].var(ddof=1)
+                                      if len(summaries) > 1 else np.nan)
+    return result
+
+def run_realizations(realizations, sweeps, params=None, grid_size=None,
+                     seed=None, workers=None, engine="serial", backend="auto",
+                     keep=True, cache=None, warm_start=False, tolerance=None):
+    """
+    Spreads independent realizations over a process pool. Returns the time in
+    sweeps, the mean and variance of the frequency of features and isogloss
+    density, and with keep=True every realization in preallocated arrays.
+    Realizations stored in the cache, if one is given, are not simulated
+    again and new ones are added to it. Runs without a seed are not cached.
+    warm_start=True starts every realization from an equilibrated coarse
+    lattice instead of noise.
+
+    With a tolerance every realization runs until the standard errors of its
+    observables are below it, for at most sweeps sweeps, and the results are
+    those of converged_summary() instead.
+    """
+    if params is None:
+        params = simulation.model_parameters()
+    if grid_size is None:
+        grid_size = simulation.GRID_SIZE
+    seed_sequence = random_streams.seed_sequence(seed)
+
+    frequency_moments = RunningMoments(sweeps)
+    isogloss_moments = RunningMoments(sweeps)
+    frequencies = None
+    isoglosses = None
+    if keep and tolerance is None:
+        frequencies = np.empty((realizations, sweeps))
+        isoglosses = np.empty((realizations, sweeps))
+    summaries = []
+
+    if workers is None:
+        workers = os.cpu_count()
+    seeds = [random_streams.substream(seed_sequence, n)
+             for n in range(realizations)]
+    kind = "realization"
+    extra = simulation.warm_start_description(warm_start)
+    if tolerance is not None:
+        kind = "converged_realization"
+        extra["tolerance"] = float(tolerance)
+    stored = {}
+    descriptions = {}
+    if cache is not None:
+        for n in range(realizations):
+            descriptions[n] = result_cache.describe(
+                kind, engine, params, grid_size, sweeps, seed, (n,), **extra)
+            found = cache.get(descriptions[n])
+            if found is not None:
+                stored[n] = found
+    jobs = [(seeds[n], params, grid_size, sweeps, engine, backend,
+             warm_start, tolerance) for n in range(realizations)
+            if n not in stored]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(jobs)//(4*workers))
+        results = iter(())
+        if jobs:
+            results = executor.map(simulate_realization, *zip(*jobs),
+                                   chunksize=chunksize)
+        for n in range(realizations):
+            if n in stored:
+                result = stored[n]
+            else:
+                result = next(results)
+                if cache is not None:
+                    cache.put(descriptions[n], result)
+            if tolerance is not None:
+                summaries.append(result)
+                continue
+            frequency_moments.add(result["frequency"])
+            isogloss_moments.add(result["isogloss"])
+            if keep:
+                frequencies[n] = result["frequency"]
+                isoglosses[n] = result["isogloss"]
+
+    if tolerance is not None:
+        return converged_summary(summaries, seed_sequence)
+    return {"time": np.arange(1, sweeps + 1),
+            "frequency_mean": frequency_moments.mean,
+            "frequency_variance": frequency_moments.variance(),
+            "isogloss_mean": isogloss_moments.mean,
+            "isogloss_variance": isogloss_moments.variance(),
+            "frequency": frequencies, "isogloss": isoglosses,
+            "seed": seed_sequence.entropy}
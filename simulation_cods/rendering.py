@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshot recording and post-processing of lattice pictures.
+
+In headless runs experiment() does not draw anything. It records the lattice
+every few sweeps into a FrameBuffer, kept in memory or written to a directory
+as .npy files. The pictures and the GIF are made afterwards by
+render_frames(), which splits the frames over worker processes. Each worker
+draws one figure and only swaps the image data for every frame.
+@author: Qi Nohr Chen
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+
+class FrameBuffer:
+    """
+    Snapshots of the lattice with the sweep they were taken at. Frames are
+    stored as uint8 in memory, or as .npy files when a directory is given.
+    With clear=True the frames an earlier run left in the directory are
+    deleted, so they never end up in the GIF of a new run.
+    """
+
+    def __init__(self, directory=None, clear=False):
+        self.directory = directory
+        self.sweeps = []
+        self.snapshots = []
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            if clear:
+                for name in os.listdir(directory):
+                    if name.startswith("frame_") and name.endswith(".npy"):
+                        os.remove(os.path.join(directory, name))
+
+    def __len__(self):
+        return len(self.sweeps)
+
+    def record(self, sweep, integer_map):
+        """
+        Stores a copy of the lattice taken at the given sweep.
+        """
+        snapshot = np.asarray(integer_map, dtype=np.uint8)
+        if self.directory is None:
+            self.snapshots.append(snapshot.copy())
+        else:
+            filename = os.path.join(self.directory,
+                                    "frame_" + str(sweep).zfill(8) + ".npy")
+            np.save(filename, snapshot)
+            self.snapshots.append(filename)
+        self.sweeps.append(sweep)
+
+    @classmethod
+    def from_directory(cls, directory):
+        """
+        Buffer of the frames an earlier run wrote to a directory.
+        """
+        frames = cls(directory)
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("frame_") and name.endswith(".npy"):
+                frames.sweeps.append(int(name[len("frame_"):-len(".npy")]))
+                frames.snapshots.append(os.path.join(directory, name))
+        return frames
+
+    def frame(self, n):
+        """
+        The n-th recorded lattice.
+        """
+        snapshot = self.snapshots[n]
+        if isinstance(snapshot, str):
+            return np.load(snapshot)
+        return snapshot
+
+def render_chunk(frames, sweeps, directory, dpi):
+    """
+    Draws a list of frames into png files with a single figure. Returns the
+    file names in the order of the frames.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib import colors
+
+    cmap = colors.ListedColormap(['yellow', 'blue'])
+    norm = colors.BoundaryNorm([0,1,20], cmap.N)
+    fig, ax = plt.subplots()
+    title = ax.set_title("", fontsize=10)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    image = None
+
+    filenames = []
+    for frame, sweep in zip(frames, sweeps):
+        if isinstance(frame, str):
+            frame = np.load(frame)
+        if image is None:
+            image = ax.imshow(frame, cmap=cmap, norm=norm)
+        else:
+            image.set_data(frame)
+        title.set_text("Model of Language Evolution, sweep " + str(sweep))
+        filename = os.path.join(directory, str(sweep).zfill(8) + ".png")
+        fig.savefig(filename, dpi=dpi)
+        filenames.append(filename)
+    plt.close(fig)
+    return filenames
+
+def render_frames(frame_buffer, directory, dpi=100, workers=None):
+    """
+    Renders every frame of a buffer to png files in a directory, spreading
+    the frames over a process pool. Returns the file names in sweep order.
+    """
+    if len(frame_buffer) == 0:
+        return []
+    os.makedirs(directory, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count()
+    workers = min(workers, len(frame_buffer))
+    chunks = np.array_split(np.arange(len(frame_buffer)), workers)
+    jobs = [([frame_buffer.snapshots[n] for n in chunk],
+             [frame_buffer.sweeps[n] for n in chunk], directory, dpi)
+            for chunk in chunks if len(chunk) > 0]
+
+    filenames = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_files in executor.map(render_chunk, *zip(*jobs)):
+            filenames.extend(chunk_files)
+    return filenames
+
+def assemble_gif(filenames, gif_name="mygif.gif", remove=False):
+    """
+    Joins rendered frames into an animation, optionally deleting the frames
+    afterwards.
+    """
+    import imageio
+    with imageio.get_writer(gif_name, mode='I') as writer:
+        for filename in filenames:
+            image = imageio.imread(filename)
+            writer.append_data(image)
+    if remove:
+        for filename in set(filenames):
+            os.remove(filename)
+    return gif_name
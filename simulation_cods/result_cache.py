@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content addressed cache of simulation results on disk.
+
+A result is described by everything that determines it: the model
+parameters, grid size, sweeps, engine and its version, and the seed of its
+random stream. The SHA-256 of that description, written as canonical JSON,
+names the file the result is kept in:
+
+    <directory>/<key>.npz    the arrays of the result and its description
+
+A run that finds its key in the cache loads the result instead of
+simulating. The numba and Python backends give the same numbers for a seed,
+so the backend is not part of the key. Runs without a seed draw a fresh one
+that nothing could look up again, so describe() gives them the seed None
+and the cache neither stores nor looks up such descriptions.
+
+The cache is bounded in size. Reading a result marks it as used, and when
+the directory grows past its limit the least recently used results are
+deleted. A cache keeps a running estimate of its size, counting what it
+writes, so the directory is only listed again when the estimate passes the
+limit. Files are written to a temporary name first and moved into place,
+so worker processes can share a cache.
+
+The plotting scripts read their measured points from here through
+measurements().
+@author: Qi Nohr Chen
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import random_streams
+
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "result_cache")
+MAX_BYTES = 2**30 # Size the cache is trimmed to
+# Bump the version of an engine or pipeline when its results for a seed
+# change, so results of the old code are never found again
+VERSIONS = {"loop": 1, "serial": 1, "checkerboard": 1, "event": 1,
+            "wals": 1}
+
+def parameters(params):
+    """
+    The transmission probabilities of a parameter dictionary as floats, so
+    0 and 0.0 give the same key.
+    """
+    #The simulation module imports this one, so it is imported when needed
+    import language_evolution_simulation as simulation
+    return {name: float(params[name]) for name in simulation.PARAMETER_NAMES}
+
+def seed_key(seed):
+    """
+    A seed as the entropy and spawn key of its np.random.SeedSequence, None
+    for a fresh seed.
+    """
+    if seed is None:
+        return None
+    if isinstance(seed, np.random.SeedSequence):
+        return [int(seed.entropy), [int(n) for n in seed.spawn_key]]
+    return [int(seed), []]
+
+def describe(kind, engine, params, grid_size, sweeps, seed, stream=(),
+             **extra):
+    """
+    Description of a result, the dictionary its key is made from. params is
+    one parameter dictionary or a list of them, for chains of points. seed
+    is the seed of the run as it was given, None for a fresh one, and stream
+    the key of the substream of the result within the run.
+    """
+    if isinstance(params, dict):
+        params = parameters(params)
+    else:
+        params = [parameters(point) for point in params]
+    description = {"kind": kind, "engine": engine,
+                   "version": VERSIONS[engine], "params": params,
+                   "grid_size": int(grid_size), "sweeps": int(sweeps),
+                   "seed": None}
+    if seed is not None:
+        description["seed"] = seed_key(random_streams.substream(seed,
+                                                                *stream))
+    description.update(extra)
+    return description
+
+def cache_key(description):
+    """
+    SHA-256 of the description written as canonical JSON.
+    """
+    text = json.dumps(description, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultCache:
+    """
+    Results stored under the keys of their descriptions in a directory, at
+    most max_bytes of them.
+    """
+
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        if directory is None:
+            directory = CACHE_DIRECTORY
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        #Size of the directory, measured on the first write
+        self.estimated_bytes = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, description):
+        """
+        The arrays stored for a description, or None when there are none or
+        the description has no seed.
+        """
+        if description.get("seed") is None:
+            return None
+        path = self.path(cache_key(description))
+        try:
+            with np.load(path) as stored:
+                result = {name: stored[name] for name in stored.files
+                          if name != "description"}
+        except (OSError, ValueError):
+            return None
+        #The modification time records the last use for the eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, description, result):
+        """
+        Stores a dictionary of arrays for a description and trims the cache.
+        Returns the key, or None for a description without a seed, which is
+        not stored.
+        """
+        if description.get("seed") is None:
+            return None
+        key = cache_key(description)
+        if self.estimated_bytes is None:
+            self.estimated_bytes = self.size()
+        temporary = self.path(key) + "." + str(os.getpid()) + ".tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, description=np.array(json.dumps(description)),
+                     **{name: np.asarray(value)
+                        for name, value in result.items()})
+            written = file.tell()
+        try:
+            replaced = os.path.getsize(self.path(key))
+        except OSError:
+            replaced = 0
+        os.replace(temporary, self.path(key))
+        self.estimated_bytes = self.estimated_bytes + written - replaced
+        if self.estimated_bytes > self.max_bytes:
+            self.evict()
+        return key
+
+    def cached(self, description, function, *arguments):
+        """
+        The stored result of a description, or the result of the function,
+        which is then stored.
+        """
+        result = self.get(description)
+        if result is None:
+            result = function(*arguments)
+            self.put(description, result)
+        return result
+
+    def files(self):
+        """
+        Paths, sizes and times of last use of the stored results.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, status.st_size, status.st_mtime))
+        return entries
+
+    def size(self):
+        return sum(size for path, size, used in self.files())
+
+    def evict(self):
+        """
+        Deletes the least recently used results until the cache fits in
+        max_bytes, and measures the size estimate again. Returns the number
+        of results deleted.
+        """
+        entries = sorted(self.files(), key=lambda entry: entry[2])
+        total = sum(size for path, size, used in entries)
+        deleted = 0
+        for path, size, used in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total = total - size
+            deleted = deleted + 1
+        self.estimated_bytes = total
+        return deleted
+
+    def entries(self, **conditions):
+        """
+        Descriptions and arrays of the stored results whose descriptions
+        have the given values, for example kind="realization", from the
+        least to the most recently used.
+        """
+        found = []
+        for path, size, used in sorted(self.files(),
+                                       key=lambda entry: entry[2]):
+            try:
+                with np.load(path) as stored:
+                    description = json.loads(str(stored["description"]))
+                    if any(description.get(name) != value
+                           for name, value in conditions.items()):
+                        continue
+                    result = {name: stored[name] for name in stored.files
+                              if name != "description"}
+            except (OSError, ValueError, KeyError):
+                continue
+            found.append((description, result))
+        return found
+
+def stationary_mean(series):
+    """
+    Mean of a series after its burn in, found with MSER-5.
+    """
+    import convergence
+    series = np.asarray(series, dtype=float)
+    return float(series[convergence.mser_truncation(series):].mean())
+
+def measurements(cache=None):
+    """
+    Every measured point in a cache as rows of a table: the parameters,
+    grid size, sweeps, engine, theoretical tau and rho and the measured
+    frequency of features and isogloss density. Single realizations are
+    measured after their burn in, points of parameter sweeps as they were
+    stored.
+    """
+    import pandas as pd
+    import language_evolution_simulation as simulation
+    if cache is None:
+        cache = ResultCache()
+    rows = []
+    for description, result in cache.entries():
+        if description["kind"] == "realization":
+            points = [(description["params"],
+                       stationary_mean(result["frequency"]),
+                       stationary_mean(result["isogloss"]))]
+        elif description["kind"] == "sweep_chain":
+            points = zip(description["params"], result["frequency"],
+                         result["isogloss"])
+        else:
+            continue
+        for params, frequency, isogloss in points:
+            row = dict(params)
+            #numpy floats give inf instead of raising without horizontal
+            #transmission
+            params = {name: np.float64(value)
+                      for name, value in params.items()}
+            with np.errstate(divide="ignore", invalid="ignore"):
+                tau = float(simulation.tau(params))
+                rho = float(
+                    simulation.frequency_of_feature_in_stationary_distribution(
+                        params))
+            row.update({"grid_size": description["grid_size"],
+                        "sweeps": description["sweeps"],
+                        "engine": description["engine"],
+                        "tau": tau, "rho": rho,
+                        "frequency": float(frequency),
+                        "isogloss": float(isogloss)})
+            rows.append(row)
+    return pd.DataFrame(rows)
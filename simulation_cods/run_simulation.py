@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line entry point of the language evolution simulation.
+
+A run is described by a TOML or JSON config file, and options given on the
+command line override the file. Everything left out keeps the value of the
+constants in language_evolution_simulation.py. An example in TOML:
+
+    grid_size = 64
+    sweeps = 1000
+    realizations = 8
+    seed = 12345
+    engine = "serial"       # loop, serial, checkerboard or event
+    backend = "auto"        # auto, python or numba
+    output_directory = "runs/tau_0.3"
+    result_cache = "result_cache"  # false simulates everything again
+    warm_start = false      # start from an equilibrated coarse lattice
+    tolerance = 0.001       # stop realizations once their errors are below
+
+    [probabilities]
+    vertical = 0.5
+    egress_vert = 0.05
+    ingress_vert = 0.05
+    egress_horizontal = 0.025
+    ingress_horizontal = 0.025
+
+    [plotting]
+    enabled = false         # figures during and after the run
+    snapshot_interval = 10  # sweeps between frames of headless loop runs
+    gif = true              # render the frames into a GIF afterwards
+    dpi = 100
+
+The "loop" engine is the serial loop of experiment(), with its snapshots,
+checkpoints, series, profiles and spatial observables. The other engines are
+the fast engines of realizations.py, run over a process pool. Either way the
+averages go to iso_average.csv and frequency_average.csv in the output
+directory, together with the resolved config. A run without a seed gets a
+fresh one, which is written to the config so it can be repeated.
+Realizations of runs given a seed are kept in the result cache
+(result_cache.py), shared by all runs, and a repeated run reads them
+instead of simulating. Runs with a drawn seed are not cached.
+
+With a tolerance every realization of the fast engines runs until the
+standard errors of its frequency and isogloss density are below it, for at
+most the given number of sweeps (see convergence.py). The averages then hold
+one stationary mean per realization, written to realizations.csv.
+
+    python run_simulation.py config.toml --sweeps 200 --output runs/test
+@author: Qi Nohr Chen
+"""
+import argparse
+import importlib.util
+import json
+import sys
+import numpy as np
+import language_evolution_simulation as simulation
+import random_streams
+import result_cache
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+ENGINES = ("loop", "serial", "checkerboard", "event")
+BACKENDS = ("auto", "python", "numba")
+LOOP_OPTIONS = ("series_directory", "checkpoint_directory",
+                "checkpoint_interval", "profile", "profile_sampling",
+                "spatial_observables")
+
+def default_config():
+    """
+    The config of a run with the constants currently set in the simulation
+    module.
+    """
+    return {"grid_size": simulation.GRID_SIZE,
+            "sweeps": simulation.TRIALS//simulation.GRID_SIZE**2,
+            "realizations": simulation.REALIZATION,
+            "seed": simulation.SEED,
+            "engine": "loop",
+            "backend": "auto",
+            "workers": None,
+            "output_directory": simulation.OUTPUT_DIRECTORY,
+            "result_cache": simulation.RESULT_CACHE,
+            "warm_start": simulation.WARM_START,
+            "tolerance": None,
+            "probabilities": simulation.model_parameters(),
+            "plotting": {"enabled": not simulation.HEADLESS,
+                         "snapshot_interval": simulation.SNAPSHOT_INTERVAL,
+                         "gif": False,
+                         "dpi": 100},
+            "series_directory": simulation.SERIES_DIRECTORY,
+            "checkpoint_directory": simulation.CHECKPOINT_DIRECTORY,
+            "checkpoint_interval": simulation.CHECKPOINT_INTERVAL,
+            "profile": simulation.PROFILE,
+            "profile_sampling": simulation.PROFILE_SAMPLING,
+            "spatial_observables": simulation.SPATIAL_OBSERVABLES}
+
+def load_config(filename):
+    """
+    Reads a config file, TOML or JSON by its extension.
+    """
+    if filename.endswith(".json"):
+        with open(filename) as file:
+            return json.load(file)
+    if tomllib is None:
+        raise ValueError("Reading TOML needs Python 3.11 or the tomli "
+                         "package, use a JSON config instead")
+    with open(filename, "rb") as file:
+        return tomllib.load(file)
+
+def merge_config(config, changes, section="config"):
+    """
+    Copy of a config with the changes applied, tables merged key by key.
+    Raises ValueError for keys the config does not have, so typos are not
+    silently ignored.
+    """
+    merged = dict(config)
+    for key, value in changes.items():
+        if key not in config:
+            raise ValueError("Unknown option " + str(key) + " in " + section)
+        if isinstance(config[key], dict):
+            if not isinstance(value, dict):
+                raise ValueError(str(key) + " has to be a table")
+            merged[key] = merge_config(config[key], value, key)
+        else:
+            merged[key] = value
+    return merged
+
+def check_config(config):
+    """
+    Raises ValueError for configs that cannot be run.
+    """
+    if config["engine"] not in ENGINES:
+        raise ValueError("Unknown engine " + str(config["engine"])
+                         + ", choose one of " + ", ".join(ENGINES))
+    if config["backend"] not in BACKENDS:
+        raise ValueError("Unknown backend " + str(config["backend"])
+                         + ", choose one of " + ", ".join(BACKENDS))
+    if (config["backend"] == "numba"
+            and importlib.util.find_spec("numba") is None):
+        raise ValueError("The numba backend needs numba to be installed")
+    for name in ("grid_size", "sweeps", "realizations"):
+        if int(config[name]) < 1:
+            raise ValueError(name + " has to be at least 1")
+    for name, value in config["probabilities"].items():
+        if not 0 <= value <= 1:
+            raise ValueError("The probability " + name
+                             + " has to be between 0 and 1")
+    if config["tolerance"] is not None:
+        if config["engine"] == "loop":
+            raise ValueError("A tolerance needs one of the fast engines")
+        if not float(config["tolerance"]) > 0:
+            raise ValueError("tolerance has to be positive")
+    if config["plotting"]["gif"] and config["plotting"]["enabled"]:
+        raise ValueError("A GIF is rendered from the frames of headless "
+                         "runs, turn plotting off (--no-plot) for --gif")
+    if config["engine"] != "loop":
+        if config["plotting"]["gif"]:
+            raise ValueError("Only the loop engine records frames for a GIF")
+        defaults = default_config()
+        for name in LOOP_OPTIONS:
+            if config[name] != defaults[name]:
+                raise ValueError(name + " is only used by the loop engine")
+
+def apply_config(config):
+    """
+    Sets the constants of the simulation module from a config.
+    """
+    params = config["probabilities"]
+    simulation.GRID_SIZE = int(config["grid_size"])
+    simulation.TRIALS = int(config["sweeps"])*simulation.GRID_SIZE**2
+    simulation.REALIZATION = int(config["realizations"])
+    simulation.SEED = config["seed"]
+    simulation.OUTPUT_DIRECTORY = config["output_directory"]
+    simulation.RESULT_CACHE = config["result_cache"] or None
+    simulation.WARM_START = bool(config["warm_start"])
+    simulation.PROBABILITY_VERTICAL = params["vertical"]
+    simulation.PROBABILITY_HORIZONTAL = 1 - params["vertical"]
+    simulation.PROBABILITY_EGRESS_VERT = params["egress_vert"]
+    simulation.PROBABILITY_INGRESS_VERT = params["ingress_vert"]
+    simulation.PROBABILITY_EGRESS_HORIZONTAL = params["egress_horizontal"]
+    simulation.PROBABILITY_INGRESS_HORIZONTAL = params["ingress_horizontal"]
+    simulation.p = params["egress_vert"] + params["ingress_vert"]
+    simulation.p_prime = (params["egress_horizontal"]
+                          + params["ingress_horizontal"])
+    simulation.HEADLESS = not config["plotting"]["enabled"]
+    simulation.SNAPSHOT_INTERVAL = int(config["plotting"]["snapshot_interval"])
+    #Directories of the loop engine are taken inside the output directory
+    simulation.SERIES_DIRECTORY = config["series_directory"]
+    simulation.CHECKPOINT_DIRECTORY = config["checkpoint_directory"]
+    simulation.CHECKPOINT_INTERVAL = int(config["checkpoint_interval"])
+    simulation.PROFILE = config["profile"]
+    simulation.PROFILE_SAMPLING = config["profile_sampling"]
+    simulation.SPATIAL_OBSERVABLES = config["spatial_observables"]
+
+def run_loop(config):
+    """
+    Runs the serial loop of the simulation module and renders the GIF of
+    the recorded frames when asked to.
+    """
+    simulation._main_()
+    if config["plotting"]["gif"]:
+        import rendering
+        frames = rendering.FrameBuffer.from_directory(
+            simulation.output_path("frames"))
+        filenames = rendering.render_frames(
+            frames, simulation.output_path("pictures"),
+            config["plotting"]["dpi"], config["workers"])
+        rendering.assemble_gif(filenames, simulation.output_path("mygif.gif"))
+
+def run_engine(config):
+    """
+    Runs the realizations with one of the fast engines and writes their
+    averages like the loop does.
+    """
+    import realizations
+    cache = None
+    if simulation.RESULT_CACHE is not None:
+        cache = result_cache.ResultCache(simulation.RESULT_CACHE)
+    result = realizations.run_realizations(
+        int(config["realizations"]), int(config["sweeps"]),
+        config["probabilities"], int(config["grid_size"]), config["seed"],
+        config["workers"], config["engine"], config["backend"], keep=False,
+        cache=cache, warm_start=bool(config["warm_start"]),
+        tolerance=config["tolerance"])
+    if config["tolerance"] is not None:
+        import pandas as pd
+        table = pd.DataFrame({name: result[name] for name in
+                              ("frequency", "frequency_error", "isogloss",
+                               "isogloss_error", "burn_in", "sweeps_run",
+                               "converged")})
+        table.to_csv(simulation.output_path("realizations.csv"),
+                     index_label="realization")
+        for name in ("frequency", "isogloss"):
+            print(name, result[name + "_mean"], "+-",
+                  np.sqrt(result[name + "_variance"]/len(result[name])))
+        return result
+    np.savetxt(simulation.output_path("iso_average.csv"),
+               result["isogloss_mean"])
+    np.savetxt(simulation.output_path("frequency_average.csv"),
+               result["frequency_mean"])
+    np.savez(simulation.output_path("realizations.npz"),
+             **{name: value for name, value in result.items()
+                if value is not None})
+    if config["plotting"]["enabled"]:
+        simulation.graph_freq_feat(result["frequency_mean"], result["time"])
+        simulation.graph_isogloss_density(result["isogloss_mean"],
+                                          result["time"])
+    return result
+
+def resolve_config(config):
+    """
+    A config with every option filled in from the defaults and checked. A
+    missing seed is drawn here, so the written config repeats the run, and
+    the cache is switched off as nothing would look the run up again.
+    """
+    config = merge_config(default_config(), config)
+    check_config(config)
+    if config["seed"] is None:
+        config["seed"] = random_streams.seed_sequence(None).entropy
+        config["result_cache"] = False
+    return config
+
+def run(config):
+    """
+    Runs the simulation described by a config and returns the resolved
+    config.
+    """
+    config = resolve_config(config)
+    run_resolved(config)
+    return config
+
+def run_resolved(config):
+    """
+    Runs the simulation of a config already filled in by resolve_config().
+    """
+    apply_config(config)
+    with open(simulation.output_path("config.json"), "w") as file:
+        json.dump(config, file, indent=1)
+    if config["engine"] == "loop":
+        run_loop(config)
+    else:
+        run_engine(config)
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(
+        description="Simulates the language evolution model")
+    parser.add_argument("config", nargs="?",
+                        help="TOML or JSON file describing the run")
+    parser.add_argument("--grid-size", type=int)
+    parser.add_argument("--sweeps", type=int)
+    parser.add_argument("--realizations", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--engine", choices=ENGINES)
+    parser.add_argument("--backend", choices=BACKENDS)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", dest="output_directory")
+    parser.add_argument("--cache", dest="result_cache",
+                        help="Directory of the result cache")
+    parser.add_argument("--no-cache", dest="result_cache",
+                        action="store_false", default=None,
+                        help="Simulate everything, even runs in the cache")
+    parser.add_argument("--tolerance", type=float,
+                        help="Stop realizations once their standard errors "
+                        "are below this, after at most --sweeps sweeps")
+    parser.add_argument("--warm-start", action=argparse.BooleanOptionalAction,
+                        help="Start from an equilibrated coarse lattice")
+    parser.add_argument("--plot", dest="enabled",
+                        action=argparse.BooleanOptionalAction,
+                        help="Show figures during and after the run")
+    parser.add_argument("--gif", action=argparse.BooleanOptionalAction,
+                        help="Render the frames of a loop run into a GIF")
+    return parser.parse_args(arguments)
+
+def main(arguments=None):
+    options = parse_arguments(arguments)
+    config = {}
+    if options.config is not None:
+        config = load_config(options.config)
+    plotting = dict(config.get("plotting", {}))
+    for name in ("enabled", "gif"):
+        if getattr(options, name) is not None:
+            plotting[name] = getattr(options, name)
+    if plotting:
+        config["plotting"] = plotting
+    for name in ("grid_size", "sweeps", "realizations", "seed", "engine",
+                 "backend", "workers", "output_directory", "result_cache",
+                 "warm_start", "tolerance"):
+        if getattr(options, name) is not None:
+            config[name] = getattr(options, name)
+    try:
+        config = resolve_config(config)
+    except ValueError as error:
+        print("run_simulation.py: " + str(error), file=sys.stderr)
+        return 2
+    run_resolved(config)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial observables of the lattice: correlations and domain sizes.
+
+    C(r)   two-point correlation of the features, from the FFT of the
+           lattice (Wiener-Khinchin), in O(N**2 log N). Normalised by its
+           value at r = 0 it is the g(r) of stationary_solver.
+    S(k)   structure factor, |FFT|**2 of the lattice minus its mean
+    sizes  sizes of the clusters (domains) of neighbouring cells sharing a
+           feature, found by labelling each feature and joining the labels
+           that meet across the periodic boundaries with union-find
+
+C(r) and S(k) are averaged over all separations and wave vectors whose
+lengths round to the same whole number of lattice spacings (or of 2*pi/N).
+SpatialAccumulator samples a lattice, for example after every sweep
+of experiment(), and keeps running means and variances across sweeps and
+realizations with realizations.RunningMoments.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import realizations
+
+def torus_distance(grid_size):
+    """
+    Distance of every cell from cell (0, 0) on the torus, nearest image.
+    """
+    steps = np.arange(grid_size)
+    steps = np.minimum(steps, grid_size - steps)
+    return np.hypot(steps[:, None], steps[None, :])
+
+def radial_bins(grid_size):
+    """
+    Bin of every separation by its length rounded to the nearest integer,
+    and the number of separations in each bin.
+    """
+    bins = np.rint(torus_distance(grid_size)).astype(np.int64).ravel()
+    return bins, np.bincount(bins)
+
+def structure_factor(integer_map):
+    """
+    S(k) = |FFT(s - mean)|**2/N**2 over the wave vectors of the half plane
+    used by rfft2.
+    """
+    values = integer_map - integer_map.mean()
+    transform = np.fft.rfft2(values)
+    return (transform.real**2 + transform.imag**2)/values.size
+
+def correlation_function(integer_map):
+    """
+    C(r) = <s(x) s(x+r)> - <s>**2 over the separations of the torus, the
+    inverse transform of the structure factor.
+    """
+    return np.fft.irfft2(structure_factor(integer_map),
+                         s=integer_map.shape)
+
+def cluster_labels(integer_map, periodic=True):
+    """
+    Labels the clusters of neighbouring cells (up, right, down, left) with
+    the same feature. Clusters touching across the periodic boundaries are
+    joined. Returns the label of every cell and the number of clusters.
+    """
+    labels = np.zeros(integer_map.shape, dtype=np.int64)
+    count = 0
+    for value in (0, 1):
+        feature_labels, number = ndimage.label(integer_map == value)
+        labels = labels + np.where(feature_labels > 0, feature_labels + count,
+                                   0)
+        count = count + number
+    labels = labels - 1
+    if not periodic:
+        return labels, count
+    #Union-find over the labels that meet where the torus wraps around
+    left = np.concatenate((labels[:, -1], labels[-1, :]))
+    right = np.concatenate((labels[:, 0], labels[0, :]))
+    same = (np.concatenate((integer_map[:, -1], integer_map[-1, :]))
+            == np.concatenate((integer_map[:, 0], integer_map[0, :])))
+    links = coo_matrix((np.ones(np.count_nonzero(same)),
+                        (left[same], right[same])), shape=(count, count))
+    count, roots = connected_components(links, directed=False)
+    return roots[labels], count
+
+def cluster_sizes(integer_map, periodic=True):
+    """
+    Size of every cluster of same-feature cells.
+    """
+    labels, count = cluster_labels(integer_map, periodic)
+    return np.bincount(labels.ravel(), minlength=count)
+
+class SpatialAccumulator:
+    """
+    Running averages of C(r), S(k), the cluster size distribution and cluster
+    statistics over every lattice sampled.
+    """
+
+    def __init__(self, grid_size, periodic=True):
+        self.grid_size = grid_size
+        self.periodic = periodic
+        self.bins, self.bin_counts = radial_bins(grid_size)
+        #Wave vectors of rfft2 binned by |k| in units of 2*pi/N
+        steps = np.arange(grid_size)
+        steps = np.minimum(steps, grid_size - steps)
+        half = np.arange(grid_size//2 + 1)
+        self.k_bins = np.rint(np.hypot(steps[:, None],
+                                       half[None, :])).astype(np.int64).ravel()
+        #rfft2 keeps one of each pair k, -k except on its first and last
+        #column, so the other columns count twice
+        weights = np.full((grid_size, grid_size//2 + 1), 2.0)
+        weights[:, 0] = 1
+        if grid_size % 2 == 0:
+            weights[:, -1] = 1
+        self.k_weights = weights.ravel()
+        self.k_counts = np.bincount(self.k_bins, weights=self.k_weights)
+        #Clusters are counted in bins of sizes 2**j up to 2**(j+1) - 1
+        self.size_bins = int(np.log2(grid_size**2)) + 1
+        self.correlation = realizations.RunningMoments(len(self.bin_counts))
+        self.structure = realizations.RunningMoments(len(self.k_counts))
+        self.distribution = realizations.RunningMoments(self.size_bins)
+        self.statistics = realizations.RunningMoments(4)
+
+    def sample(self, integer_map):
+        """
+        Measures one lattice and adds it to the running averages.
+        """
+        structure = structure_factor(integer_map)
+        correlation = np.fft.irfft2(structure, s=integer_map.shape)
+        self.correlation.add(np.bincount(self.bins,
+                                         weights=correlation.ravel())
+                             / self.bin_counts)
+        self.structure.add(np.bincount(self.k_bins,
+                                       weights=structure.ravel()
+                                       * self.k_weights)/self.k_counts)
+
+        sizes = cluster_sizes(integer_map, self.periodic)
+        self.distribution.add(np.bincount(np.log2(sizes).astype(np.int64),
+                                          minlength=self.size_bins))
+        #Number of clusters, mean and largest size, and the mean size of the
+        #cluster a random cell belongs to
+        self.statistics.add(np.array([len(sizes), sizes.mean(), sizes.max(),
+                                      np.sum(sizes**2)/np.sum(sizes)],
+                                     dtype=float))
+
+    def results(self):
+        """
+        Means and standard errors of everything sampled so far. The errors
+        treat the samples as independent, so with samples from consecutive
+        sweeps they are too small by the square root of the autocorrelation
+        time.
+        """
+        samples = max(self.statistics.count, 1)
+        result = {"samples": self.statistics.count,
+                  "distance": np.arange(len(self.bin_counts)),
+                  "wave_number": 2*np.pi*np.arange(len(self.k_counts))
+                  / self.grid_size,
+                  "cluster_size_bins": 2**np.arange(self.size_bins)}
+        for name, moments in (("correlation", self.correlation),
+                              ("structure_factor", self.structure),
+                              ("cluster_distribution", self.distribution)):
+            result[name] = moments.mean
+            result[name + "_error"] = np.sqrt(moments.variance()/samples)
+        names = ("clusters", "mean_cluster_size", "largest_cluster",
+                 "weighted_cluster_size")
+        errors = np.sqrt(self.statistics.variance()/samples)
+        for number, name in enumerate(names):
+            result[name] = self.statistics.mean[number]
+            result[name + "_error"] = errors[number]
+        return result
+
+    def save(self, filename):
+        np.savez(filename, **self.results())
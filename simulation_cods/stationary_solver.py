@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simulation-free solver for the stationary state of the model.
+
+The frequency of features rho and the temperature tau follow directly from
+the transmission probabilities. The pair correlations obey a linear lattice
+equation, which on a torus is diagonal in Fourier space:
+
+    P(r) = 1/N**2 * sum_k exp(i k.r)/(1 + tau - phi(k))
+
+with phi(k) the average of exp(i k.d) over the steps d to the neighbours.
+From it
+
+    g(r) = P(r)/P(0)                  normalised pair correlation
+    H    = 1/P(0) - tau = 1 - <g(d)>  one minus g averaged over neighbours
+    isogloss density = 2*H*rho*(1-rho)
+
+For the square torus this is the sum hash_tau uses, and on the infinite
+square lattice P(0) is its elliptic integral. Any periodic lattice whose
+neighbour steps are the same for every cell (square von Neumann or Moore,
+hexagonal) is solved the same way, with g(r) from one inverse FFT per
+parameter set. All parameter sets are solved at once.
+
+cross_validate() compares the solution with simulations of the same points.
+@author: Qi Nohr Chen
+"""
+import numpy as np
+import pandas as pd
+import language_evolution_simulation as simulation
+import hash_tau
+import topology
+import compiled_kernels
+import convergence
+import random_streams
+
+def parameter_arrays(parameter_sets):
+    """
+    A list of parameter dictionaries, or one dictionary of values or arrays,
+    as one dictionary of arrays.
+    """
+    if isinstance(parameter_sets, dict):
+        return {name: np.asarray(parameter_sets[name], dtype=float)
+                for name in simulation.PARAMETER_NAMES}
+    return {name: np.array([params[name] for params in parameter_sets],
+                           dtype=float)
+            for name in simulation.PARAMETER_NAMES}
+
+def neighbour_steps(lattice):
+    """
+    The (dy, dx) steps from a cell to its neighbours on a periodic lattice.
+    Raises ValueError if the steps are not the same for every cell, since
+    the correlations are then not diagonal in Fourier space.
+    """
+    grid_size = int(round(np.sqrt(lattice.size)))
+    if lattice.shape != (grid_size, grid_size):
+        raise ValueError("The solver needs a lattice on a square grid")
+    first = np.array(lattice.neighbours_of(0))
+    steps_y = np.where(first//grid_size > grid_size//2,
+                       first//grid_size - grid_size, first//grid_size)
+    steps_x = np.where(first % grid_size > grid_size//2,
+                       first % grid_size - grid_size, first % grid_size)
+    y, x = np.divmod(np.arange(lattice.size), grid_size)
+    expected = (((y[:, None] + steps_y[None, :]) % grid_size)*grid_size
+                + (x[:, None] + steps_x[None, :]) % grid_size)
+    if (np.any(lattice.degrees != len(first))
+            or np.any(np.sort(expected, axis=1).ravel()
+                      != np.sort(lattice.neighbours.reshape(lattice.size, -1),
+                                 axis=1).ravel())):
+        raise ValueError("The solver needs a periodic lattice with the same "
+                         "neighbour steps for every cell")
+    return steps_y, steps_x
+
+def structure_function(lattice):
+    """
+    phi(k), the average of exp(i k.d) over the neighbour steps, on the
+    wave vectors of the torus.
+    """
+    steps_y, steps_x = neighbour_steps(lattice)
+    grid_size = lattice.shape[0]
+    k = 2*np.pi*np.arange(grid_size)/grid_size
+    phase = (k[:, None, None]*steps_y[None, None, :]
+             + k[None, :, None]*steps_x[None, None, :])
+    return np.cos(phase).mean(axis=2)
+
+def green_function_origin(tau, lattice):
+    """
+    P(0) on a lattice for an array of tau, summed over the distinct values
+    of phi(k) like hash_tau.green_function_origin().
+    """
+    values, counts = np.unique(np.round(structure_function(lattice), 14),
+                               return_counts=True)
+    with np.errstate(divide="ignore"):
+        return hash_tau.green_function_sum(tau, values, counts/lattice.size)
+
+def pair_correlation(tau, lattice):
+    """
+    g(r) = P(r)/P(0) over the cells of the torus for an array of tau, one
+    inverse FFT per temperature. Cell (y, x) of the result is the separation
+    (y, x) along the lattice directions.
+    """
+    tau = np.atleast_1d(np.asarray(tau, dtype=float))
+    phi = structure_function(lattice)
+    correlation = np.empty(tau.shape + phi.shape)
+    for index, value in np.ndenumerate(tau):
+        propagator = np.fft.ifft2(1/(1 + value - phi)).real
+        correlation[index] = propagator/propagator[0, 0]
+    return correlation
+
+def separations(lattice):
+    """
+    Distance of every cell from cell 0 on the torus, in units of the
+    lattice spacing, taking the nearest periodic image.
+    """
+    grid_size = lattice.shape[0]
+    coordinates = lattice.coordinates - lattice.coordinates[0]
+    #Lattice vectors of the torus from the steps along the two directions
+    along_x = (lattice.coordinates[1] - lattice.coordinates[0])*grid_size
+    along_y = (lattice.coordinates[grid_size]
+               - lattice.coordinates[0])*grid_size
+    distance = np.full(lattice.size, np.inf)
+    for shift_y in (-1, 0, 1):
+        for shift_x in (-1, 0, 1):
+            image = coordinates + shift_y*along_y + shift_x*along_x
+            distance = np.minimum(distance, np.hypot(image[:, 0],
+                                                     image[:, 1]))
+    return distance.reshape(lattice.shape)
+
+def radial_profile(correlation, lattice, decimals=6):
+    """
+    g as a function of distance: the distinct distances on the torus and g
+    averaged over the separations at each, for every parameter set.
+    """
+    distance = np.round(separations(lattice), decimals).ravel()
+    distances, groups = np.unique(distance, return_inverse=True)
+    counts = np.bincount(groups)
+    flat = correlation.reshape(-1, lattice.size)
+    profile = np.empty((len(flat), len(distances)))
+    for row in range(len(flat)):
+        profile[row] = np.bincount(groups, weights=flat[row])/counts
+    return distances, profile.reshape(correlation.shape[:-2]
+                                      + (len(distances),))
+
+def solve(parameter_sets, grid_size=None, lattice=None, correlation=False):
+    """
+    Stationary tau, rho, H and isogloss density for many parameter sets at
+    once, on a lattice or the square torus of a grid size. Without either
+    the infinite square lattice is used. On the square torus the infinite
+    lattice values and the finite size correction of the isogloss density
+    are given too. With correlation=True the pair correlation g(r) and its
+    radial profile are added. Returns a dictionary of arrays.
+    """
+    params = parameter_arrays(parameter_sets)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tau = np.asarray(simulation.tau(params), dtype=float)
+        rho = np.asarray(
+            simulation.frequency_of_feature_in_stationary_distribution(params),
+            dtype=float)
+    if lattice is None and grid_size is not None:
+        lattice = topology.square_torus(grid_size)
+
+    result = {"tau": tau, "rho": rho}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if lattice is None:
+            hash_d = np.asarray(hash_tau.hash_of_tau(tau), dtype=float)
+        else:
+            hash_d = 1/green_function_origin(tau, lattice) - tau
+        #Without horizontal transmission nothing is correlated
+        hash_d = np.where(np.isinf(tau), 1.0, hash_d)
+        result["hash"] = hash_d
+        result["isogloss"] = 2*hash_d*rho*(1 - rho)
+        if lattice is not None and lattice.name == "square":
+            infinite = np.asarray(hash_tau.hash_of_tau(tau), dtype=float)
+            infinite = np.where(np.isinf(tau), 1.0, infinite)
+            result["hash_infinite"] = infinite
+            result["isogloss_infinite"] = 2*infinite*rho*(1 - rho)
+            result["finite_size_correction"] = (result["isogloss"]
+                                                - result["isogloss_infinite"])
+    if correlation:
+        if lattice is None:
+            raise ValueError("Pair correlations need a finite lattice")
+        result["correlation"] = pair_correlation(tau, lattice)
+        result["distance"], result["radial_correlation"] = radial_profile(
+            result["correlation"], lattice)
+    return result
+
+def cross_validate(parameter_sets, grid_size, sweeps, burn_in=None,
+                   lattice=None, seed=None, backend="auto"):
+    """
+    Simulates every parameter set once with the serial engine on the same
+    lattice and compares the measured means after the burn in with the
+    solution. Returns a table with both, the standard errors of the
+    measurements and the deviations in standard errors.
+    """
+    if lattice is None:
+        lattice = topology.square_torus(grid_size)
+    if burn_in is None:
+        burn_in = sweeps//2
+    solution = solve(parameter_sets, lattice=lattice)
+    seed_sequence = random_streams.seed_sequence(seed)
+    rows = []
+    for number, params in enumerate(parameter_sets):
+        rng = np.random.default_rng(random_streams.substream(seed_sequence,
+                                                             number))
+        integer_map = simulation.change_elements(rng.random(lattice.shape))
+        frequency, isogloss = compiled_kernels.run_sweeps(
+            integer_map, sweeps, params, rng, backend, lattice)
+        rows.append({"frequency": frequency[burn_in:].mean(),
+                     "frequency_error": convergence.standard_error(
+                         frequency[burn_in:]),
+                     "isogloss": isogloss[burn_in:].mean(),
+                     "isogloss_error": convergence.standard_error(
+                         isogloss[burn_in:])})
+    table = pd.DataFrame(rows)
+    table.insert(0, "tau", solution["tau"])
+    table.insert(1, "rho", solution["rho"])
+    table.insert(2, "isogloss_theory", solution["isogloss"])
+    table["frequency_deviation"] = ((table["frequency"] - table["rho"])
+                                    / table["frequency_error"])
+    table["isogloss_deviation"] = ((table["isogloss"]
+                                    - table["isogloss_theory"])
+                                   / table["isogloss_error"])
+    table["lattice"] = lattice.name
+    table["grid_size"] = lattice.shape[0]
+    table["sweeps"] = sweeps
+    table["seed"] = seed_sequence.entropy
+    return table
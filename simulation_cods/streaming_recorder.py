@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming storage of per-sweep observables.
+
+SeriesRecorder appends rows of observables (time, frequency, isogloss, ...)
+to a directory in fixed size chunks. Every full chunk is written once as its
+own .npy file and never touched again. The rows of the unfinished chunk are
+kept in partial.npy, and series.json records how many rows are stored. A run
+that crashes loses at most the rows since the last flush, and a recorder
+opened on an existing directory carries on where it stopped. truncate()
+drops rows again, so a run resumed from a checkpoint, or started afresh,
+can cut the series back to the rows it still holds.
+
+SeriesReader reads the chunks memory-mapped, so a slice only loads the
+chunks it covers.
+@author: Qi Nohr Chen
+"""
+import json
+import os
+import numpy as np
+
+METADATA_FILE = "series.json"
+PARTIAL_FILE = "partial.npy"
+
+def chunk_name(number):
+    """
+    File name of a full chunk.
+    """
+    return "chunk_" + str(number).zfill(6) + ".npy"
+
+def write_metadata(directory, metadata):
+    """
+    Replaces the metadata file atomically, so readers never see half of it.
+    """
+    temporary = os.path.join(directory, METADATA_FILE + ".tmp")
+    with open(temporary, "w") as file:
+        json.dump(metadata, file)
+    os.replace(temporary, os.path.join(directory, METADATA_FILE))
+
+def read_metadata(directory):
+    """
+    Metadata of a stored series.
+    """
+    with open(os.path.join(directory, METADATA_FILE)) as file:
+        return json.load(file)
+
+class SeriesRecorder:
+    """
+    Append-only, chunked recorder of rows of floating point observables.
+    """
+
+    def __init__(self, directory, fields=("time", "frequency", "isogloss"),
+                 chunk_size=4096, flush_every=None, attributes=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, METADATA_FILE)):
+            metadata = read_metadata(directory)
+            fields = tuple(metadata["fields"])
+            chunk_size = metadata["chunk_size"]
+            if attributes is None:
+                attributes = metadata.get("attributes")
+            self.length = metadata["length"]
+        else:
+            self.length = 0
+        #Anything json can store that describes the run, e.g. its seed
+        self.attributes = {} if attributes is None else dict(attributes)
+        self.fields = tuple(fields)
+        self.chunk_size = chunk_size
+        self.flush_every = chunk_size if flush_every is None else flush_every
+        self.dtype = np.dtype([(field, np.float64) for field in self.fields])
+        self.buffer = np.zeros(chunk_size, dtype=self.dtype)
+        self.buffered = self.length % chunk_size
+        self.unflushed = 0
+        if self.buffered > 0:
+            partial = np.load(os.path.join(directory, PARTIAL_FILE))
+            self.buffer[:self.buffered] = partial[:self.buffered]
+
+    def __len__(self):
+        return self.length
+
+    def append(self, **values):
+        """
+        Adds one row, given as keyword arguments named after the fields.
+        """
+        row = self.buffer[self.buffered]
+        for field in self.fields:
+            row[field] = values[field]
+        self.buffered = self.buffered + 1
+        self.length = self.length + 1
+        self.unflushed = self.unflushed + 1
+        if self.buffered == self.chunk_size:
+            self.flush()
+        elif self.unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows. A full chunk becomes a new chunk file, an
+        unfinished one is kept in the partial file.
+        """
+        if self.buffered == self.chunk_size:
+            number = self.length//self.chunk_size - 1
+            np.save(os.path.join(self.directory, chunk_name(number)),
+                    self.buffer)
+            self.buffered = 0
+        elif self.buffered > 0:
+            temporary = os.path.join(self.directory, "partial.tmp.npy")
+            np.save(temporary, self.buffer[:self.buffered])
+            os.replace(temporary, os.path.join(self.directory, PARTIAL_FILE))
+        write_metadata(self.directory, {"fields": list(self.fields),
+                                        "chunk_size": self.chunk_size,
+                                        "length": self.length,
+                                        "attributes": self.attributes})
+        self.unflushed = 0
+
+    def truncate(self, length):
+        """
+        Drops every row from length on and writes the shortened series.
+        """
+        if length < 0 or length > self.length:
+            raise ValueError("Cannot truncate a series of " + str(self.length)
+                             + " rows to " + str(length))
+        kept_chunks = length//self.chunk_size
+        stored_chunks = self.length//self.chunk_size
+        self.buffered = length % self.chunk_size
+        if self.buffered > 0 and kept_chunks < stored_chunks:
+            #The last kept rows are in a full chunk, not in the buffer
+            chunk = np.load(os.path.join(self.directory,
+                                         chunk_name(kept_chunks)))
+            self.buffer[:self.buffered] = chunk[:self.buffered]
+        for number in range(kept_chunks, stored_chunks):
+            os.remove(os.path.join(self.directory, chunk_name(number)))
+        self.length = length
+        self.flush()
+
+    def close(self):
+        """
+        Flushes whatever is left.
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+class SeriesReader:
+    """
+    Lazy reader of a series written by SeriesRecorder.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        metadata = read_metadata(directory)
+        self.fields = tuple(metadata["fields"])
+        self.chunk_size = metadata["chunk_size"]
+        self.length = metadata["length"]
+        self.attributes = metadata.get("attributes", {})
+
+    def __len__(self):
+        return self.length
+
+    def chunk(self, number):
+        """
+        A stored chunk, memory-mapped.
+        """
+        full_chunks = self.length//self.chunk_size
+        if number < full_chunks:
+            filename = chunk_name(number)
+        else:
+            filename = PARTIAL_FILE
+        return np.load(os.path.join(self.directory, filename), mmap_mode="r")
+
+    def read(self, field, start=0, stop=None):
+        """
+        Values of one field for rows start to stop, loading only the chunks
+        that hold them.
+        """
+        if stop is None or stop > self.length:
+            stop = self.length
+        values = np.empty(max(0, stop - start))
+        position = start
+        while position < stop:
+            number = position//self.chunk_size
+            first = position - number*self.chunk_size
+            last = min(self.chunk_size, stop - number*self.chunk_size)
+            values[position-start:position-start+last-first] = \
+                self.chunk(number)[field][first:last]
+            position = position + last - first
+        return values
+
+    def __getitem__(self, field):
+        return self.read(field)
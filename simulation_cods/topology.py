@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lattice topologies as precomputed neighbour tables.
+
+A Topology stores the neighbours of every cell in compressed sparse row
+(CSR) form: the neighbours of cell c are neighbours[offsets[c]:offsets[c+1]].
+Cells are numbered row by row, so cell y*GRID_SIZE + x of a lattice is
+integer_map[y, x]. The serial loop picks the partner of a horizontal event
+with one index into the table and the isogloss counters walk the same rows,
+so both always agree on who neighbours whom.
+
+Lattices:
+
+    square      von Neumann (4 neighbours, as horizontal_walk() always did)
+                or Moore (8 neighbours, diagonals included)
+    hexagonal   hexagonal cells with 6 neighbours, in axial coordinates
+    triangular  triangular cells with 3 neighbours, pointing up and down in
+                turn along every row
+
+each with open or periodic boundaries. Arbitrary graphs, for example contact
+networks between languages, are built from an edge list or from coordinates.
+
+Every neighbour pair is a border. Lattices keep a neighbour as often as the
+stencil reaches it, so on very small tori a cell can border another twice,
+exactly like the counts of isogloss_calculator().
+@author: Qi Nohr Chen
+"""
+import functools
+import numpy as np
+
+EARTH_RADIUS = 6371.0 # km
+
+class Topology:
+    """
+    Neighbour table of a lattice or graph. shape is the shape of the integer
+    map that lives on it, coordinates the (x, y) position of every cell for
+    lattices.
+    """
+
+    def __init__(self, offsets, neighbours, shape, name="graph",
+                 coordinates=None):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.neighbours = np.asarray(neighbours, dtype=np.int64)
+        self.shape = tuple(shape)
+        self.name = name
+        self.coordinates = coordinates
+        self.size = len(self.offsets) - 1
+        self.degrees = np.diff(self.offsets)
+        #Source cell of every entry of the table, for vectorised counts
+        self.sources = np.repeat(np.arange(self.size), self.degrees)
+
+    @functools.cached_property
+    def offset_list(self):
+        """
+        The offsets as a plain list, faster than an array to index from the
+        serial loop. Only built when the loop first needs it.
+        """
+        return self.offsets.tolist()
+
+    @functools.cached_property
+    def neighbour_list(self):
+        """
+        The neighbours as a plain list, built on first use like offset_list.
+        """
+        return self.neighbours.tolist()
+
+    def __repr__(self):
+        return ("Topology(" + self.name + ", " + str(self.size) + " cells, "
+                + str(self.number_of_borders()) + " borders)")
+
+    def neighbours_of(self, cell):
+        """
+        Neighbours of a cell, as a list.
+        """
+        return self.neighbour_list[self.offset_list[cell]:
+                                   self.offset_list[cell+1]]
+
+    def random_neighbour(self, cell, rng):
+        """
+        A uniformly chosen neighbour of a cell. A cell without neighbours
+        talks to itself.
+        """
+        start = self.offset_list[cell]
+        degree = self.offset_list[cell+1] - start
+        if degree == 0:
+            return cell
+        return self.neighbour_list[start + int(rng.random()*degree)]
+
+    def number_of_borders(self):
+        """
+        Number of neighbour pairs, used to normalise the isogloss density.
+        """
+        return len(self.neighbours)//2
+
+    def unlike_borders(self, values):
+        """
+        Number of neighbour pairs whose values differ.
+        """
+        flat = np.asarray(values).reshape(-1)
+        return int(np.count_nonzero(flat[self.sources]
+                                    != flat[self.neighbours]))//2
+
+    def isogloss_density(self, values):
+        """
+        Fraction of neighbour pairs that disagree.
+        """
+        return self.unlike_borders(values)/self.number_of_borders()
+
+def from_pairs(sources, targets, size, shape, name, coordinates=None):
+    """
+    Builds the table from directed pairs, keeping the order in which the
+    pairs of each source are given.
+    """
+    order = np.argsort(sources, kind="stable")
+    counts = np.bincount(sources, minlength=size)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return Topology(offsets, targets[order], shape, name, coordinates)
+
+def stencil(grid_size, periodic, y_steps, x_steps, name):
+    """
+    Lattice where the neighbours of (y, x) are (y + dy, x + dx) for the given
+    steps. Steps may be arrays over the cells, for stencils that differ
+    between cells. Open boundaries drop the steps that leave the grid.
+    """
+    y, x = np.divmod(np.arange(grid_size*grid_size), grid_size)
+    sources = []
+    targets = []
+    for dy, dx in zip(y_steps, x_steps):
+        y_n = y + dy
+        x_n = x + dx
+        if periodic:
+            inside = np.ones(len(y), dtype=bool)
+        else:
+            inside = ((y_n >= 0) & (y_n < grid_size)
+                      & (x_n >= 0) & (x_n < grid_size))
+        sources.append(np.arange(len(y))[inside])
+        targets.append(((y_n % grid_size)*grid_size + x_n % grid_size)[inside])
+    coordinates = np.column_stack((x, y)).astype(float)
+    return from_pairs(np.concatenate(sources), np.concatenate(targets),
+                      grid_size*grid_size, (grid_size, grid_size), name,
+                      coordinates)
+
+def square(grid_size, periodic=True, moore=False):
+    """
+    Square lattice. The von Neumann neighbours come in the order of
+    horizontal_walk(): up, right, down, left. Moore adds the diagonals.
+    """
+    y_steps = [-1, 0, 1, 0]
+    x_steps = [0, 1, 0, -1]
+    name = "square"
+    if moore:
+        y_steps = y_steps + [-1, -1, 1, 1]
+        x_steps = x_steps + [-1, 1, 1, -1]
+        name = "moore"
+    if not periodic:
+        name = name + "_open"
+    return stencil(grid_size, periodic, y_steps, x_steps, name)
+
+def hexagonal(grid_size, periodic=True):
+    """
+    Hexagonal cells on a rhombus in axial coordinates, six neighbours each.
+    """
+    lattice = stencil(grid_size, periodic, [-1, -1, 0, 1, 1, 0],
+                      [0, 1, 1, 0, -1, -1],
+                      "hexagonal" if periodic else "hexagonal_open")
+    #Shear the rhombus so the plotted cells sit where the hexagons are
+    x, y = lattice.coordinates.T
+    lattice.coordinates = np.column_stack((x + y/2, y*np.sqrt(3)/2))
+    return lattice
+
+def triangular(grid_size, periodic=True):
+    """
+    Triangular cells, three neighbours each. Cell (y, x) points up when
+    x + y is even and down otherwise. Both have their left and right
+    neighbours, an up triangle also the one below and a down triangle the
+    one above. A periodic grid needs an even size for the pattern to close.
+    """
+    if periodic and grid_size % 2 == 1:
+        raise ValueError("A periodic triangular lattice needs an even size")
+    y, x = np.divmod(np.arange(grid_size*grid_size), grid_size)
+    vertical = np.where((x + y) % 2 == 0, 1, -1)
+    return stencil(grid_size, periodic, [0, 0, vertical], [-1, 1, 0],
+                   "triangular" if periodic else "triangular_open")
+
+def graph(edges, size=None, coordinates=None, name="graph"):
+    """
+    Undirected graph from an (m, 2) array of edges between cells 0 to size-1.
+    Self loops and repeated edges are dropped.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    if size is None:
+        size = int(edges.max()) + 1 if len(edges) else 0
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    sources = np.concatenate((edges[:, 0], edges[:, 1]))
+    targets = np.concatenate((edges[:, 1], edges[:, 0]))
+    return from_pairs(sources, targets, size, (size,), name, coordinates)
+
+def from_edge_list(filename, size=None, delimiter=None):
+    """
+    Graph from a text file with one edge, two cell numbers, per line.
+    """
+    edges = np.loadtxt(filename, dtype=np.int64, delimiter=delimiter,
+                       ndmin=2)
+    return graph(edges, size, name="edge_list")
+
+def unit_vectors(latitude, longitude):
+    """
+    Points given in degrees as vectors on the unit sphere. Their straight
+    line (chord) distances order pairs the same way as great circle ones.
+    """
+    latitude = np.radians(np.asarray(latitude, dtype=float))
+    longitude = np.radians(np.asarray(longitude, dtype=float))
+    return np.column_stack((np.cos(latitude)*np.cos(longitude),
+                            np.cos(latitude)*np.sin(longitude),
+                            np.sin(latitude)))
+
+def from_coordinates(latitude, longitude, radius=None, nearest=None):
+    """
+    Contact network of languages from their coordinates, like those in WALS:
+    languages are linked when they are at most radius km apart along the
+    Earth's surface, or to their nearest languages when nearest is given.
+    The pairs are found with a k-d tree, not by comparing all of them.
+    """
+    from scipy import spatial
+    if (radius is None) == (nearest is None):
+        raise ValueError("Give either a radius or a number of nearest "
+                         "neighbours")
+    points = unit_vectors(latitude, longitude)
+    tree = spatial.cKDTree(points)
+    if radius is not None:
+        chord = 2*np.sin(min(radius/(2*EARTH_RADIUS), np.pi/2))
+        edges = tree.query_pairs(chord, output_type="ndarray")
+    else:
+        nearest = min(nearest, len(points) - 1)
+        #The closest point found is the language itself
+        distance, targets = tree.query(points, nearest + 1)
+        targets = targets[:, 1:]
+        sources = np.repeat(np.arange(len(points)), targets.shape[1])
+        edges = np.column_stack((sources, targets.ravel()))
+    coordinates = np.column_stack((longitude, latitude)).astype(float)
+    return graph(edges, len(points), coordinates, "contact_network")
+
+@functools.lru_cache(maxsize=None)
+def square_torus(grid_size):
+    """
+    The von Neumann torus of a grid size, built once and reused.
+    """
+    return square(grid_size)
+
+@functools.lru_cache(maxsize=None)
+def open_square(grid_size):
+    """
+    The von Neumann square with open boundaries, built once and reused.
+    """
+    return square(grid_size, periodic=False)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch estimation of the linguistic temperature of WALS features.
+
+Reads a local WALS dump, either the CLDF export (a directory holding
+values.csv and languages.csv) or one csv file with the columns language,
+feature, value, latitude and longitude. Every feature is made binary, the
+chosen value against all others, and measured on a neighbourhood graph of
+the languages that code it, each linked to its nearest languages:
+
+    rho        fraction of languages with the value
+    isogloss   fraction of links between languages that disagree
+    H          isogloss/(2*rho*(1-rho))
+    tau        the temperature with that H(tau), from hash_tau
+
+Confidence intervals come from a bootstrap over languages, run for all
+features in parallel. The temperatures of all features and all bootstrap
+replicates are found in one vectorised call of tau_of_hash(). Features where
+H is not between 0 and 1 have no temperature and get NaN. With a seed the
+fitted table can be kept in a result_cache.ResultCache, keyed by the contents
+of the dump and the settings of the fit.
+@author: Qi Nohr Chen
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+import hash_tau
+import random_streams
+import result_cache
+import topology
+
+NEAREST = 10 # Languages every language is linked to
+REPLICATES = 1000 # Bootstrap replicates per feature
+
+def load_wals(path):
+    """
+    Long table of a WALS dump with one row per language and feature: the
+    columns language, feature, value, latitude and longitude.
+    """
+    if os.path.isdir(path):
+        values = pd.read_csv(os.path.join(path, "values.csv"))
+        languages = pd.read_csv(os.path.join(path, "languages.csv"))
+        table = values.merge(languages, left_on="Language_ID",
+                             right_on="ID")
+        table = table.rename(columns={"Language_ID": "language",
+                                      "Parameter_ID": "feature",
+                                      "Value": "value",
+                                      "Latitude": "latitude",
+                                      "Longitude": "longitude"})
+    else:
+        table = pd.read_csv(path)
+    table = table[["language", "feature", "value", "latitude", "longitude"]]
+    return table.dropna().drop_duplicates(["language", "feature"])
+
+def binary_values(values, present=None):
+    """
+    1 for the languages with the present value (or one of several), 0 for
+    the others. Without a value given the most common one is used. Returns
+    the 0/1 array and the values counted as present.
+    """
+    values = pd.Series(values).astype(str)
+    if present is None:
+        present = [values.value_counts().index[0]]
+    elif np.ndim(present) == 0:
+        present = [present]
+    present = [str(value) for value in present]
+    return values.isin(present).to_numpy(dtype=float), present
+
+def local_counts(latitude, longitude, values, nearest=NEAREST):
+    """
+    For every language the number of links on the neighbourhood graph and
+    how many of them lead to a language with the other value.
+    """
+    lattice = topology.from_coordinates(latitude, longitude, nearest=nearest)
+    unlike = np.bincount(lattice.sources,
+                         weights=values[lattice.sources]
+                         != values[lattice.neighbours],
+                         minlength=lattice.size)
+    return unlike, lattice.degrees.astype(float)
+
+def measure_feature(latitude, longitude, values, nearest=NEAREST,
+                    replicates=REPLICATES, seed=None):
+    """
+    rho and isogloss density of one binary feature with their bootstrap
+    replicates. Resampling languages resamples their links with them, so the
+    isogloss density of a replicate is its unlike links over its links.
+    This is the job handed to each worker process.
+    """
+    unlike, degrees = local_counts(latitude, longitude, values, nearest)
+    rng = np.random.default_rng(seed)
+    sample = rng.integers(0, len(values), size=(replicates, len(values)))
+    return {"rho": values.mean(),
+            "isogloss": unlike.sum()/degrees.sum(),
+            "rho_replicates": values[sample].mean(axis=1),
+            "isogloss_replicates": (unlike[sample].sum(axis=1)
+                                    / degrees[sample].sum(axis=1))}
+
+def hash_of_observables(rho, isogloss):
+    """
+    H(tau) implied by a frequency of features and isogloss density, the
+    inverse of 2*H*rho*(1-rho).
+    """
+    rho = np.asarray(rho, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.asarray(isogloss, dtype=float)/(2*rho*(1-rho))
+
+def temperatures(hash_d, grid_size=None):
+    """
+    tau for an array of H, NaN where H is outside (0, 1).
+    """
+    hash_d = np.asarray(hash_d, dtype=float)
+    tau = np.full(hash_d.shape, np.nan)
+    valid = (hash_d > 0) & (hash_d < 1)
+    if np.any(valid):
+        tau[valid] = hash_tau.tau_of_hash(hash_d[valid], grid_size)
+    return tau
+
+def fit_description(table, present, nearest, replicates, confidence,
+                    minimum_languages, seed):
+    """
+    Description of a fit for the result cache, with a hash of the rows of
+    the table in place of the table. seed is the seed as it was given.
+    """
+    columns = ["language", "feature", "value", "latitude", "longitude"]
+    rows = pd.util.hash_pandas_object(table[columns], index=False)
+    return {"kind": "wals_features", "engine": "wals",
+            "version": result_cache.VERSIONS["wals"],
+            "table": hashlib.sha256(rows.to_numpy().tobytes()).hexdigest(),
+            "present": {str(feature): sorted(str(value) for value in
+                                             np.atleast_1d(values))
+                        for feature, values in present.items()},
+            "nearest": int(nearest), "replicates": int(replicates),
+            "confidence": float(confidence),
+            "minimum_languages": int(minimum_languages),
+            "seed": result_cache.seed_key(seed)}
+
+def fit_features(table, present=None, nearest=NEAREST, replicates=REPLICATES,
+                 confidence=0.95, minimum_languages=2*NEAREST, seed=None,
+                 workers=None, filename=None, cache=None):
+    """
+    Estimates rho, isogloss density, H and tau with bootstrap confidence
+    intervals for every feature of a table from load_wals(). present maps
+    features to the value(s) counted as present, the most common value is
+    used for the others. Features coded for fewer than minimum_languages
+    languages are skipped. A fit found in the cache, if one is given, is
+    read instead of repeated. Returns a table with one row per feature and
+    writes it to a csv file if a filename is given.
+    """
+    if present is None:
+        present = {}
+    if workers is None:
+        workers = os.cpu_count()
+    seed_sequence = random_streams.seed_sequence(seed)
+    description = None
+    if cache is not None:
+        description = fit_description(table, present, nearest, replicates,
+                                      confidence, minimum_languages, seed)
+        stored = cache.get(description)
+        if stored is not None:
+            results = pd.DataFrame(stored)
+            results["seed"] = seed_sequence.entropy
+            if filename is not None:
+                results.to_csv(filename, index=False)
+            return results
+
+    features = []
+    jobs = []
+    for number, (feature, rows) in enumerate(table.groupby("feature",
+                                                           sort=True)):
+        if len(rows) < minimum_languages:
+            continue
+        values, chosen = binary_values(rows["value"], present.get(feature))
+        features.append({"feature": feature, "present": "|".join(chosen),
+                         "languages": len(rows)})
+        jobs.append((rows["latitude"].to_numpy(dtype=float),
+                     rows["longitude"].to_numpy(dtype=float), values,
+                     nearest, replicates,
+                     random_streams.substream(seed_sequence, number)))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(jobs)//(4*workers))
+        measured = list(executor.map(measure_feature, *zip(*jobs),
+                                     chunksize=chunksize))
+
+    results = pd.DataFrame(features)
+    if len(measured) == 0:
+        return results
+    rho = np.array([result["rho"] for result in measured])
+    isogloss = np.array([result["isogloss"] for result in measured])
+    rho_replicates = np.array([result["rho_replicates"]
+                               for result in measured])
+    isogloss_replicates = np.array([result["isogloss_replicates"]
+                                    for result in measured])
+
+    #Temperatures of all features and replicates in one call
+    hashes = hash_of_observables(np.concatenate((rho[:, None],
+                                                 rho_replicates), axis=1),
+                                 np.concatenate((isogloss[:, None],
+                                                 isogloss_replicates), axis=1))
+    taus = temperatures(hashes)
+
+    tail = (1 - confidence)/2*100
+    results["rho"] = rho
+    results["isogloss"] = isogloss
+    results["hash"] = hashes[:, 0]
+    results["tau"] = taus[:, 0]
+    for name, replicate_values in (("rho", rho_replicates),
+                                   ("isogloss", isogloss_replicates),
+                                   ("hash", hashes[:, 1:]),
+                                   ("tau", taus[:, 1:])):
+        with warnings.catch_warnings():
+            #Features without a temperature in any replicate stay NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            low, high = np.nanpercentile(replicate_values, [tail, 100 - tail],
+                                         axis=1)
+        results[name + "_low"] = low
+        results[name + "_high"] = high
+    results["tau_defined"] = np.mean(np.isfinite(taus[:, 1:]), axis=1)
+    results["nearest"] = nearest
+    results["replicates"] = replicates
+    results["seed"] = seed_sequence.entropy
+    if description is not None:
+        #Strings are stored as fixed width text, so no pickling is needed
+        cache.put(description,
+                  {name: (results[name].to_numpy()
+                          if pd.api.types.is_numeric_dtype(results[name])
+                          else results[name].to_numpy(dtype=str))
+                   for name in results.columns})
+    if filename is not None:
+        results.to_csv(filename, index=False)
+    return results
+
+if __name__ == "__main__":
+    fit_features(load_wals(sys.argv[1]), filename="wals_temperatures.csv")
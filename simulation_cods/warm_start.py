@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coarse to fine initialisation of large lattices.
+
+From uniform noise a large lattice at low tau spends most of its sweeps
+growing domains. coarse_to_fine() instead equilibrates a small lattice, then
+doubles it again and again, copying every cell into a 2x2 block and letting
+the finer structure relax at each size, until the target size is reached.
+
+A lattice f times coarser needs a higher tau to have domains of the right
+size once upsampled. The correlation length xi ~ 1/(2*sqrt(tau)) alone
+suggests tau*f**2, but cells only take the values 0 and 1, so the coarse
+lattice would then be too correlated by the ratio of P(0) on the two
+lattices, which grows like log(xi) in two dimensions. The long wavelength
+modes relax slowest, so coarse_tau() matches the structure factor at k = 0
+instead:
+
+    tau_c*P(0; tau_c) = f**2*tau*P(0; tau)
+
+with P(0) = 1/(H + tau) of the infinite lattice. The error rates are scaled
+to that tau with rho unchanged. The short wavelengths a coarse lattice gets
+wrong relax quickly at the next size. Each size runs level_sweeps*f sweeps,
+so all of them together cost less than 2*level_sweeps sweeps of the full
+lattice. Without errors (tau = 0) or without horizontal transmission (tau
+infinite) there are no domains of a size to match, and the start is plain
+noise.
+
+Equilibrated states can be kept in a result_cache.ResultCache and a run
+started from the stored state nearest in tau. compare_with_cold_start()
+checks that the stationary isogloss density after a warm start is the one
+reached from noise, and how much sooner it is reached. On a 256 by 256
+lattice at tau = 0.003 that was about 4.5 times sooner; larger lattices have
+not been measured.
+@author: Qi Nohr Chen
+"""
+import time
+import numpy as np
+import language_evolution_simulation as simulation
+import realizations
+import convergence
+import hash_tau
+import random_streams
+import result_cache
+
+COARSE_SIZE = 64 # Smallest lattice of the ladder
+COARSE_SWEEPS = 200 # Sweeps equilibrating the smallest lattice
+LEVEL_SWEEPS = 50 # Sweeps of relaxation after the last upsampling
+
+def theory(function, params):
+    """
+    simulation.tau or another function of the parameters, evaluated on numpy
+    floats so that dividing by zero gives inf or nan instead of raising: tau
+    is inf without horizontal transmission and nan when nothing happens.
+    """
+    params = {name: np.float64(value) for name, value in params.items()}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(function(params))
+
+def temperature(params):
+    return theory(simulation.tau, params)
+
+def warm_startable(tau):
+    """
+    Whether a coarse lattice can stand in for one at tau.
+    """
+    return bool(np.isfinite(tau) and tau > 0)
+
+def coarse_tau(tau, factor, iterations=80):
+    """
+    tau of a lattice factor times coarser whose structure factor at k = 0
+    matches, tau_c*P(0; tau_c) = factor**2*tau*P(0; tau), found by bisection
+    on log(tau_c) like hash_tau.tau_of_hash().
+    """
+    target = factor**2*tau/(hash_tau.hash_of_tau(tau) + tau)
+    if target >= 1:
+        return np.inf
+    lower = np.log(tau)
+    upper = np.log(1e12)
+    for _ in range(iterations):
+        middle = (lower + upper)/2
+        value = np.exp(middle)
+        if value/(hash_tau.hash_of_tau(value) + value) > target:
+            upper = middle
+        else:
+            lower = middle
+    return float(np.exp((lower + upper)/2))
+
+def scaled_parameters(params, tau):
+    """
+    Transmission probabilities with the error rates scaled by one number so
+    that the temperature becomes tau, which keeps rho. The scale is capped
+    where a probability would pass 1.
+    """
+    vertical = params["vertical"]
+    horizontal = 1 - vertical
+    p = params["egress_vert"] + params["ingress_vert"]
+    p_prime = params["egress_horizontal"] + params["ingress_horizontal"]
+    errors = vertical*p + horizontal*p_prime
+    if horizontal == 0 or errors == 0:
+        return dict(params)
+    if np.isinf(tau):
+        scale = np.inf
+    else:
+        #tau = errors*scale/(horizontal*(1 - p_prime*scale))
+        scale = tau*horizontal/(errors + tau*horizontal*p_prime)
+    scale = min(scale, 1/max(params["egress_vert"], params["ingress_vert"],
+                             params["egress_horizontal"],
+                             params["ingress_horizontal"]))
+    scaled = dict(params)
+    for name in ("egress_vert", "ingress_vert", "egress_horizontal",
+                 "ingress_horizontal"):
+        scaled[name] = params[name]*scale
+    return scaled
+
+def coarse_parameters(params, factor):
+    """
+    Transmission probabilities for a lattice factor times coarser, at the
+    tau of coarse_tau(). Parameters without a finite, positive tau are kept.
+    """
+    tau = temperature(params)
+    if factor == 1 or not warm_startable(tau):
+        return dict(params)
+    return scaled_parameters(params, coarse_tau(tau, factor))
+
+def upsample(integer_map, factor):
+    """
+    Lattice factor times larger with every cell copied into a factor by
+    factor block. Periodic maps stay periodic.
+    """
+    return np.repeat(np.repeat(integer_map, factor, axis=0), factor, axis=1)
+
+def level_sizes(grid_size, coarse_size=COARSE_SIZE):
+    """
+    Sizes of the ladder, smallest first: grid_size halved while it is even
+    and its half is at least coarse_size.
+    """
+    sizes = [grid_size]
+    while sizes[-1] % 2 == 0 and sizes[-1]//2 >= coarse_size:
+        sizes.append(sizes[-1]//2)
+    return sizes[::-1]
+
+def coarse_to_fine(grid_size, params, rng, coarse_size=COARSE_SIZE,
+                   coarse_sweeps=COARSE_SWEEPS, level_sweeps=LEVEL_SWEEPS,
+                   state=None, engine="serial", backend="auto"):
+    """
+    Warm started lattice of grid_size for the parameters, drawn from the
+    np.random.Generator rng. Without a state the smallest lattice of the
+    ladder is equilibrated from noise. A state, for example an equilibrated
+    lattice at a nearby tau, is taken as the start instead; its size has to
+    divide grid_size. Returns the map and the work spent, in sweeps of the
+    full lattice.
+    """
+    if state is None:
+        #Lattices so coarse that they would be uncorrelated are left out
+        tau = temperature(params)
+        sizes = [grid_size]
+        if warm_startable(tau):
+            sizes = [n for n in level_sizes(grid_size, coarse_size)
+                     if n == grid_size or np.isfinite(
+                         coarse_tau(tau, grid_size/n))]
+        size = sizes[0]
+        integer_map = simulation.change_elements(rng.random((size, size)))
+        if size == grid_size:
+            return integer_map, 0.0
+        realizations.run_engine(engine, integer_map, coarse_sweeps,
+                                coarse_parameters(params, grid_size/size),
+                                rng, backend)
+        work = coarse_sweeps*size**2
+    else:
+        integer_map = np.array(state, dtype=float)
+        size = len(integer_map)
+        if grid_size % size != 0:
+            raise ValueError("A state of size " + str(size)
+                             + " does not fit a grid of size "
+                             + str(grid_size))
+        work = 0
+    sizes = [n for n in level_sizes(grid_size, size)
+             if n > size and n % size == 0]
+    if state is not None and len(sizes) == 0:
+        #A state of the full size only needs to relax to the new tau
+        sizes = [grid_size]
+    for n in sizes:
+        integer_map = upsample(integer_map, n//len(integer_map))
+        #Sweeps of the coarser lattices are cheap, so they relax for longer
+        sweeps = level_sweeps*grid_size//n
+        realizations.run_engine(engine, integer_map, sweeps,
+                                coarse_parameters(params, grid_size/n),
+                                rng, backend)
+        work = work + sweeps*n**2
+    return integer_map, work/grid_size**2
+
+def save_state(cache, integer_map, params, seed, sweeps, engine="serial"):
+    """
+    Stores an equilibrated lattice in a result cache. Returns the key.
+    """
+    description = result_cache.describe("state", engine, params,
+                                        len(integer_map), sweeps, seed)
+    return cache.put(description,
+                     {"integer_map": np.asarray(integer_map, dtype=np.uint8)})
+
+def nearest_state(cache, params, grid_size, rho_tolerance=0.02):
+    """
+    The stored lattice closest in log(tau) to the parameters, among those
+    whose size divides grid_size and whose rho is within rho_tolerance. The
+    largest of equally close lattices is taken. Returns the map and its
+    description, or None.
+    """
+    with np.errstate(divide="ignore"):
+        target = np.log(temperature(params))
+    frequency = simulation.frequency_of_feature_in_stationary_distribution
+    rho = theory(frequency, params)
+    best = None
+    for description, stored in cache.entries(kind="state"):
+        size = description["grid_size"]
+        stored_params = description["params"]
+        if grid_size % size != 0 or not abs(
+                theory(frequency, stored_params) - rho) <= rho_tolerance:
+            continue
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = abs(np.log(temperature(stored_params)) - target)
+        if best is None or (distance, -size) < best[0]:
+            best = ((distance, -size), stored["integer_map"], description)
+    if best is None:
+        return None
+    return best[1].astype(float), best[2]
+
+def compare_with_cold_start(grid_size, params, sweeps, realization_count=4,
+                            seed=None, engine="serial", backend="auto",
+                            coarse_size=COARSE_SIZE,
+                            coarse_sweeps=COARSE_SWEEPS,
+                            level_sweeps=LEVEL_SWEEPS):
+    """
+    Runs lattices from noise and from warm starts for the same number of
+    sweeps. The end of the burn in of each is found with MSER-5 on the
+    isogloss density averaged over the realizations, and the stationary
+    isogloss densities after it are compared with each other and with
+    stationary_solver. The time to stationarity is the time of the warm
+    start plus that of the burn in. sweeps has to be at least twice the burn
+    in of the cold start for it to be found. At low tau the frequency of
+    features wanders for about 1/(vertical*p) sweeps, so several
+    realizations are needed to compare the means.
+    """
+    import stationary_solver
+    seed_sequence = random_streams.seed_sequence(seed)
+    results = {}
+    for number, start in enumerate(("cold", "warm")):
+        isogloss = np.empty((realization_count, sweeps))
+        initialisation = np.empty(realization_count)
+        running = np.empty(realization_count)
+        work = np.zeros(realization_count)
+        for realization in range(realization_count):
+            rng = np.random.default_rng(random_streams.substream(
+                seed_sequence, number, realization))
+            started = time.perf_counter()
+            if start == "cold":
+                integer_map = simulation.change_elements(
+                    rng.random((grid_size, grid_size)))
+            else:
+                integer_map, work[realization] = coarse_to_fine(
+                    grid_size, params, rng, coarse_size, coarse_sweeps,
+                    level_sweeps, engine=engine, backend=backend)
+            initialisation[realization] = time.perf_counter() - started
+            started = time.perf_counter()
+            frequency, isogloss[realization] = realizations.run_engine(
+                engine, integer_map, sweeps, params, rng, backend)
+            running[realization] = time.perf_counter() - started
+        burn_in = convergence.mser_truncation(isogloss.mean(axis=0))
+        stationary = isogloss[:, burn_in:].mean(axis=1)
+        if realization_count > 1:
+            error = stationary.std(ddof=1)/np.sqrt(realization_count)
+        else:
+            error = convergence.standard_error(isogloss[0, burn_in:])
+        seconds_per_sweep = running.mean()/sweeps
+        results[start] = {"burn_in": burn_in,
+                          "isogloss": float(stationary.mean()),
+                          "isogloss_error": float(error),
+                          "initialisation_seconds": initialisation.mean(),
+                          "initialisation_sweeps": work.mean(),
+                          "seconds_per_sweep": seconds_per_sweep,
+                          "seconds_to_stationarity": (
+                              initialisation.mean()
+                              + burn_in*seconds_per_sweep),
+                          "mean_isogloss": isogloss.mean(axis=0)}
+
+    cold = results["cold"]
+    warm = results["warm"]
+    theory = stationary_solver.solve([params], grid_size=grid_size)
+    difference = warm["isogloss"] - cold["isogloss"]
+    error = np.hypot(warm["isogloss_error"], cold["isogloss_error"])
+    consistent = bool(abs(difference) <= 3*error + 1e-12)
+    speed_up = (cold["seconds_to_stationarity"]
+                / max(warm["seconds_to_stationarity"], 1e-12))
+
+    print("Cold start burn in (sweeps), isogloss density:", cold["burn_in"],
+          cold["isogloss"], "+-", cold["isogloss_error"])
+    print("Warm start burn in (sweeps), isogloss density:", warm["burn_in"],
+          warm["isogloss"], "+-", warm["isogloss_error"])
+    print("Isogloss density theoretically is:", theory["isogloss"][0])
+    print("Seconds to stationarity, cold and warm:",
+          cold["seconds_to_stationarity"], warm["seconds_to_stationarity"])
+    print("Statistically equivalent:", consistent, "speed up:", speed_up)
+    return {"cold": cold, "warm": warm, "theory": float(theory["isogloss"][0]),
+            "difference": difference, "error": error,
+            "consistent": consistent, "speed_up": speed_up,
+            "seed": seed_sequence.entropy}
+
+if __name__ == "__main__":
+    import benchmark
+    compare_with_cold_start(
+        256, scaled_parameters(benchmark.BENCHMARK_PARAMS, 0.003), 2000)
@@ -0,0 +1,35 @@
+"""
+Shared set up of the tests. The simulation modules are imported from
+simulation_cods like the scripts there do.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "simulation_cods"))
+
+import language_evolution_simulation as simulation
+
+# A point with all kinds of events, tau = 0.3 and rho = 0.5
+PARAMS = {"vertical": 0.5, "egress_vert": 0.05, "ingress_vert": 0.05,
+          "egress_horizontal": 0.025, "ingress_horizontal": 0.025}
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    """
+    The simulation module on an 8 by 8 torus at PARAMS, headless, writing
+    into a temporary directory and without the result cache.
+    """
+    settings = {"GRID_SIZE": 8, "TRIALS": 8*8, "REALIZATION": 1,
+                "HEADLESS": True, "SEED": None, "RESULT_CACHE": None,
+                "OUTPUT_DIRECTORY": str(tmp_path),
+                "PROBABILITY_VERTICAL": PARAMS["vertical"],
+                "PROBABILITY_HORIZONTAL": 1 - PARAMS["vertical"],
+                "PROBABILITY_EGRESS_VERT": PARAMS["egress_vert"],
+                "PROBABILITY_INGRESS_VERT": PARAMS["ingress_vert"],
+                "PROBABILITY_EGRESS_HORIZONTAL": PARAMS["egress_horizontal"],
+                "PROBABILITY_INGRESS_HORIZONTAL": PARAMS["ingress_horizontal"]}
+    for name, value in settings.items():
+        monkeypatch.setattr(simulation, name, value)
+    return simulation
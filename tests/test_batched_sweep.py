@@ -0,0 +1,8 @@
+import batched_sweep
+
+def test_checkerboard_matches_serial_loop(model, monkeypatch):
+    monkeypatch.setattr(model, "GRID_SIZE", 16)
+    result = batched_sweep.compare_with_serial(sweeps=100, realizations=16,
+                                               burn_in=30, seed=12345)
+    assert result["consistent"]
+    assert result["error"][1] < 0.005
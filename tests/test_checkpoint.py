@@ -0,0 +1,105 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+import checkpoint
+import random_streams
+import realizations
+from streaming_recorder import SeriesRecorder, SeriesReader
+
+class Killed(Exception):
+    pass
+
+class DyingRecorder(SeriesRecorder):
+    """
+    Recorder that kills the run once it holds a given number of rows.
+    """
+    rows_before_kill = 13
+
+    def append(self, **values):
+        if self.length == self.rows_before_kill:
+            raise Killed
+        super().append(**values)
+
+def run(model, recorder, checkpoint_file):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return model.experiment(False, None, recorder, checkpoint_file, None,
+                                random_streams.generator(3, 0))
+
+def test_killed_experiment_resumes_bit_identical(model, monkeypatch,
+                                                 tmp_path):
+    monkeypatch.setattr(model, "TRIALS", 23*64)
+    monkeypatch.setattr(model, "CHECKPOINT_INTERVAL", 5)
+    recorder = SeriesRecorder(str(tmp_path/"whole"), chunk_size=4)
+    whole = run(model, recorder, str(tmp_path/"whole.npz"))
+    recorder.close()
+
+    recorder = DyingRecorder(str(tmp_path/"killed"), chunk_size=4)
+    with pytest.raises(Killed):
+        run(model, recorder, str(tmp_path/"killed.npz"))
+    recorder = SeriesRecorder(str(tmp_path/"killed"))
+    resumed = run(model, recorder, str(tmp_path/"killed.npz"))
+    recorder.close()
+
+    assert np.array_equal(whole[2], resumed[2])
+    series = SeriesReader(str(tmp_path/"whole"))
+    resumed_series = SeriesReader(str(tmp_path/"killed"))
+    assert len(series) == len(resumed_series) == 23
+    for field in ("time", "frequency", "isogloss"):
+        assert np.array_equal(series[field], resumed_series[field])
+
+def test_rerun_without_checkpoint_starts_a_fresh_series(model, monkeypatch,
+                                                        tmp_path):
+    monkeypatch.setattr(model, "TRIALS", 10*64)
+    for _ in range(2):
+        recorder = SeriesRecorder(str(tmp_path/"series"), chunk_size=4)
+        run(model, recorder, None)
+        recorder.close()
+    assert len(SeriesReader(str(tmp_path/"series"))) == 10
+
+def test_interrupted_engine_run_resumes_bit_identical(model, monkeypatch,
+                                                      tmp_path):
+    whole = checkpoint.run_with_checkpoints(str(tmp_path/"whole.npz"), 6,
+                                            grid_size=8, seed=5,
+                                            checkpoint_every=2)
+    run_engine = realizations.run_engine
+    calls = []
+
+    def dying_engine(*arguments):
+        calls.append(1)
+        if len(calls) == 2:
+            raise Killed
+        return run_engine(*arguments)
+
+    monkeypatch.setattr(realizations, "run_engine", dying_engine)
+    filename = str(tmp_path/"killed.npz")
+    with pytest.raises(Killed):
+        checkpoint.run_with_checkpoints(filename, 6, grid_size=8, seed=5,
+                                        checkpoint_every=2)
+    monkeypatch.setattr(realizations, "run_engine", run_engine)
+    resumed = checkpoint.run_with_checkpoints(filename, 6, grid_size=8,
+                                              seed=5, checkpoint_every=2)
+    for series, resumed_series in zip(whole, resumed):
+        assert np.array_equal(series, resumed_series)
+
+@pytest.mark.parametrize("name, value, field",
+                         [("GRID_SIZE", 16, "grid_size"),
+                          ("PROBABILITY_EGRESS_VERT", 0.1, "params"),
+                          ("TRIALS", 20*64, "trials")])
+def test_checkpoint_of_other_settings_is_not_resumed(model, monkeypatch,
+                                                     tmp_path, name, value,
+                                                     field):
+    monkeypatch.setattr(model, "TRIALS", 10*64)
+    filename = str(tmp_path/"run.npz")
+    run(model, None, filename)
+    monkeypatch.setattr(model, name, value)
+    with pytest.raises(ValueError, match=field):
+        run(model, None, filename)
+
+def test_engine_checkpoint_of_another_seed_is_not_resumed(model, tmp_path):
+    filename = str(tmp_path/"run.npz")
+    checkpoint.run_with_checkpoints(filename, 4, grid_size=8, seed=5,
+                                    checkpoint_every=2)
+    with pytest.raises(ValueError, match="seed"):
+        checkpoint.run_with_checkpoints(filename, 4, grid_size=8, seed=6,
+                                        checkpoint_every=2)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+import compiled_kernels
+from compact_lattice import CompactLattice
+from conftest import PARAMS
+
+@pytest.mark.parametrize("grid_size", [1, 2, 3, 8])
+def test_uint8_cells_run_in_place_like_the_table_kernel(grid_size):
+    lattice = CompactLattice.random(grid_size, 4, storage="uint8")
+    integer_map = lattice.to_array().astype(float)
+    cells = lattice.cells
+    in_place = lattice.run_sweeps(10, PARAMS, np.random.default_rng(5),
+                                  "python")
+    assert lattice.cells is cells
+    copied = compiled_kernels.run_sweeps(integer_map, 10, PARAMS,
+                                         np.random.default_rng(5), "python")
+    assert np.array_equal(lattice.cells, integer_map)
+    for series, copied_series in zip(in_place, copied):
+        assert np.array_equal(series, copied_series)
+
+@pytest.mark.parametrize("storage", ["uint8", "packed"])
+@pytest.mark.parametrize("periodic", [True, False])
+def test_counts_match_isogloss_calculator(model, storage, periodic):
+    lattice = CompactLattice.random(13, 2, storage=storage, block_rows=4)
+    integer_map = lattice.to_array()
+    count, border_list = model.isogloss_calculator(integer_map, periodic)
+    assert lattice.unlike_borders(periodic, block_rows=4) == count
+    assert lattice.frequency() == np.count_nonzero(integer_map == 0)/13**2
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import compiled_kernels
+import event_driven
+import topology
+from conftest import PARAMS
+
+pytestmark = pytest.mark.skipif("numba" not in compiled_kernels.BACKENDS,
+                                reason="numba is not installed")
+
+def run_both(run, integer_map):
+    """
+    Runs a function of a map and a backend once per backend from the same
+    seed. Returns the final maps and the results.
+    """
+    outputs = []
+    for backend in ("python", "numba"):
+        evolved = integer_map.copy()
+        outputs.append((evolved, run(evolved, backend)))
+    return outputs
+
+@pytest.mark.parametrize("lattice, dtype",
+                         [(None, float), (None, np.uint8),
+                          (topology.square(8, periodic=False), float),
+                          (topology.hexagonal(8), float)],
+                         ids=["torus", "torus_uint8", "square_open",
+                              "hexagonal"])
+def test_serial_backends_are_identical(lattice, dtype):
+    integer_map = (np.random.default_rng(1).random((8, 8)) > 0.5).astype(dtype)
+    (python_map, python_result), (numba_map, numba_result) = run_both(
+        lambda evolved, backend: compiled_kernels.run_sweeps(
+            evolved, 30, PARAMS, np.random.default_rng(7), backend, lattice),
+        integer_map)
+    assert np.array_equal(python_map, numba_map)
+    for python_series, numba_series in zip(python_result, numba_result):
+        assert np.array_equal(python_series, numba_series)
+
+def test_event_backends_are_identical():
+    integer_map = (np.random.default_rng(2).random((8, 8)) > 0.5).astype(float)
+    (python_map, python_result), (numba_map, numba_result) = run_both(
+        lambda evolved, backend: event_driven.run_sweeps(
+            evolved, 30, PARAMS, np.random.default_rng(7), backend),
+        integer_map)
+    assert np.array_equal(python_map, numba_map)
+    for python_series, numba_series in zip(python_result, numba_result):
+        assert np.array_equal(python_series, numba_series)
@@ -0,0 +1,22 @@
+import numpy as np
+import realizations
+import result_cache
+from conftest import PARAMS
+
+def test_realizations_stop_once_converged(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path))
+    arguments = (2, 5000, PARAMS, 8)
+    result = realizations.run_realizations(*arguments, seed=4, workers=1,
+                                           backend="python", cache=cache,
+                                           tolerance=0.02)
+    assert np.all(result["converged"])
+    assert np.all(result["sweeps_run"] < 5000)
+    assert np.all(result["frequency_error"] < 0.02)
+    assert np.all(result["isogloss_error"] < 0.02)
+    assert result["frequency_mean"] == result["frequency"].mean()
+    again = realizations.run_realizations(*arguments, seed=4, workers=1,
+                                          backend="python", cache=cache,
+                                          tolerance=0.02)
+    assert len(cache.files()) == 2
+    for name in ("frequency", "isogloss", "sweeps_run"):
+        assert np.array_equal(result[name], again[name])
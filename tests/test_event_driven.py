@@ -0,0 +1,66 @@
+import numpy as np
+import topology
+import event_driven
+import realizations
+from conftest import PARAMS
+
+# Large error rates, so every class of cells flips often
+NOISY = {"vertical": 0.5, "egress_vert": 0.3, "ingress_vert": 0.2,
+         "egress_horizontal": 0.15, "ingress_horizontal": 0.1}
+
+def test_flip_rates_match_serial_updates(model, monkeypatch):
+    """
+    Counts how often the serial update flips a cell of every (s, k) class of
+    a frozen random map, per sweep, and compares it with flip_rates().
+    """
+    for name, value in (("PROBABILITY_VERTICAL", NOISY["vertical"]),
+                        ("PROBABILITY_HORIZONTAL", 1 - NOISY["vertical"]),
+                        ("PROBABILITY_EGRESS_VERT", NOISY["egress_vert"]),
+                        ("PROBABILITY_INGRESS_VERT", NOISY["ingress_vert"]),
+                        ("PROBABILITY_EGRESS_HORIZONTAL",
+                         NOISY["egress_horizontal"]),
+                        ("PROBABILITY_INGRESS_HORIZONTAL",
+                         NOISY["ingress_horizontal"])):
+        monkeypatch.setattr(model, name, value)
+    lattice = topology.square_torus(8)
+    rng = np.random.default_rng(11)
+    integer_map = (rng.random((8, 8)) > 0.5).astype(float)
+    cells = integer_map.reshape(-1)
+    unlike = np.bincount(lattice.sources,
+                         weights=cells[lattice.sources]
+                         != cells[lattice.neighbours], minlength=64)
+    classes = (cells*5 + unlike).astype(int)
+    steps = 200000
+    flips = np.zeros(10)
+    for _ in range(steps):
+        cell, previous = model.monte_carlo_step(integer_map, rng, None,
+                                                lattice)
+        if cells[cell] != previous:
+            flips[classes[cell]] += 1
+            cells[cell] = previous
+    exposure = np.bincount(classes, minlength=10)*steps/64
+    present = exposure > 0
+    measured = flips[present]/exposure[present]
+    expected = event_driven.flip_rates(NOISY).ravel()[present]
+    error = np.sqrt(expected/exposure[present])
+    assert np.all(np.abs(measured - expected) < 5*error)
+
+def test_event_engine_matches_serial_observables():
+    sweeps, burn_in, runs = 150, 30, 12
+    means = {}
+    for engine in ("serial", "event"):
+        rng = np.random.default_rng(2024)
+        samples = []
+        for _ in range(runs):
+            integer_map = (rng.random((16, 16)) > 0.5).astype(float)
+            frequency, isogloss = realizations.run_engine(
+                engine, integer_map, sweeps, PARAMS, rng, "python")
+            samples.append((frequency[burn_in:].mean(),
+                            isogloss[burn_in:].mean()))
+        samples = np.array(samples)
+        means[engine] = (samples.mean(axis=0),
+                         samples.std(axis=0, ddof=1)/np.sqrt(runs))
+    (serial, serial_error), (event, event_error) = means["serial"], \
+        means["event"]
+    assert np.all(np.abs(serial - event)
+                  < 4*np.hypot(serial_error, event_error))
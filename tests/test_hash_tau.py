@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+import hash_tau
+
+@pytest.mark.parametrize("grid_size", [None, 16])
+def test_tau_of_hash_inverts_hash_of_tau(grid_size):
+    tau = np.logspace(-3, 2, 12)
+    hash_d = hash_tau.hash_of_tau(tau, grid_size)
+    assert np.all((hash_d > 0) & (hash_d < 1))
+    np.testing.assert_allclose(hash_tau.tau_of_hash(hash_d, grid_size), tau,
+                               rtol=1e-8)
+
+def test_scalar_and_array_agree():
+    tau = np.array([0.01, 0.3, 5.0])
+    hashes = hash_tau.hash_of_tau(tau)
+    for value, hash_d in zip(tau, hashes):
+        assert hash_tau.hash_of_tau(value) == pytest.approx(hash_d, rel=1e-12)
+
+def test_tau_of_hash_rejects_values_outside_unit_interval():
+    with pytest.raises(ValueError):
+        hash_tau.tau_of_hash([0.5, 1.0])
@@ -0,0 +1,37 @@
+import numpy as np
+import multi_feature
+import parameter_sweep
+import stationary_solver
+
+# Eight features at different temperatures and frequencies
+POINTS = [(0.5, 0.1, 0.05, 0.5), (0.8, 0.05, 0.02, 0.3), (0.3, 0.2, 0.1, 0.7),
+          (0.9, 0.02, 0.01, 0.5), (0.6, 0.1, 0.1, 0.2), (0.4, 0.3, 0.05, 0.6),
+          (0.7, 0.05, 0.05, 0.4), (0.5, 0.15, 0.0, 0.5)]
+
+def batch_error(series, batches=10):
+    """
+    Standard error of the time average of every column from batch means.
+    """
+    means = series.reshape(batches, -1, series.shape[1]).mean(axis=1)
+    return means.std(axis=0, ddof=1)/np.sqrt(batches)
+
+def test_features_reach_the_stationary_solution():
+    parameter_sets = [parameter_sweep.model_point(*point) for point in POINTS]
+    solution = stationary_solver.solve(parameter_sets, grid_size=32)
+    rng = np.random.default_rng(1)
+    lattice = multi_feature.random_lattice(len(POINTS), 32, rng)
+    frequency, isogloss = multi_feature.run_sweeps(
+        lattice, 600, multi_feature.feature_parameters(parameter_sets), rng)
+    for series, expected in ((frequency[100:], solution["rho"]),
+                             (isogloss[100:], solution["isogloss"])):
+        assert np.all(np.abs(series.mean(axis=0) - expected)
+                      < 5*batch_error(series))
+
+def test_outcome_codes_without_errors_copy_the_source():
+    params = multi_feature.feature_parameters(
+        [parameter_sweep.model_point(0.5, 0.0, 0.0)])
+    uniforms = np.linspace(0, 1, 101, endpoint=False)[:, None]
+    codes = multi_feature.outcome_codes(params, uniforms)
+    horizontal = uniforms >= 0.5
+    assert np.array_equal(codes & 3, np.full(codes.shape, 2, np.uint8))
+    assert np.array_equal(codes >> 2, horizontal.astype(np.uint8))
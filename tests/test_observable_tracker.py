@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import topology
+from observable_tracker import ObservableTracker
+
+LATTICES = [topology.square(2), topology.square(8),
+            topology.square(8, periodic=False), topology.hexagonal(6),
+            topology.triangular(6)]
+
+@pytest.mark.parametrize("lattice", LATTICES,
+                         ids=lambda lattice: lattice.name + "_"
+                         + str(lattice.size))
+def test_tracked_counts_match_full_recount(model, lattice):
+    rng = np.random.default_rng(7)
+    integer_map = (rng.random(lattice.shape) > 0.5).astype(float)
+    tracker = ObservableTracker(integer_map, lattice=lattice)
+    for step in range(20*lattice.size):
+        cell, previous = model.monte_carlo_step(integer_map, rng, None,
+                                                lattice)
+        tracker.cell_changed(cell, previous)
+        if step % lattice.size == 0:
+            assert tracker.verify()
+    assert tracker.verify()
+    zeros = np.count_nonzero(integer_map == 0)
+    assert tracker.frequency() == zeros/lattice.size
+
+def test_tracker_agrees_with_isogloss_calculator(model):
+    rng = np.random.default_rng(3)
+    integer_map = (rng.random((8, 8)) > 0.5).astype(float)
+    tracker = ObservableTracker(integer_map)
+    for cell in rng.integers(0, 64, size=200):
+        tracker.write(cell, 1 - integer_map.reshape(-1)[cell])
+    count, borders = model.isogloss_calculator(integer_map)
+    assert tracker.borders == count
+    assert tracker.isogloss_density() == count/model.number_of_borders(8)
+
+@pytest.mark.parametrize("grid_size", [1, 2, 3, 8])
+@pytest.mark.parametrize("periodic", [True, False])
+def test_square_isogloss_matches_neighbour_table(model, grid_size, periodic):
+    rng = np.random.default_rng(grid_size)
+    integer_map = (rng.random((grid_size, grid_size)) > 0.5).astype(float)
+    lattice = topology.square(grid_size, periodic=periodic)
+    count, border_list = model.isogloss_calculator(integer_map, periodic)
+    assert count == lattice.unlike_borders(integer_map) == len(border_list)
+    assert (model.number_of_borders(grid_size, periodic)
+            == lattice.number_of_borders())
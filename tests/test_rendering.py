@@ -0,0 +1,16 @@
+import numpy as np
+import rendering
+
+def test_new_buffer_replaces_the_frames_of_an_older_run(tmp_path):
+    directory = str(tmp_path/"frames")
+    old = rendering.FrameBuffer(directory)
+    for sweep in range(5):
+        old.record(sweep, np.zeros((4, 4)))
+    kept = rendering.FrameBuffer(directory)
+    kept.record(5, np.ones((4, 4)))
+    assert len(rendering.FrameBuffer.from_directory(directory)) == 6
+    new = rendering.FrameBuffer(directory, clear=True)
+    new.record(0, np.ones((4, 4)))
+    frames = rendering.FrameBuffer.from_directory(directory)
+    assert frames.sweeps == [0]
+    assert np.array_equal(frames.frame(0), np.ones((4, 4)))
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import random_streams
+import realizations
+import result_cache
+from conftest import PARAMS
+
+def description(seed, sweeps=10):
+    return result_cache.describe("realization", "serial", PARAMS, 8, sweeps,
+                                 seed)
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path))
+    result = {"frequency": np.linspace(0, 1, 10),
+              "isogloss": np.arange(10, dtype=float)}
+    cache.put(description(1), result)
+    found = cache.get(description(1))
+    assert sorted(found) == ["frequency", "isogloss"]
+    for name in result:
+        assert np.array_equal(found[name], result[name])
+    assert cache.get(description(2)) is None
+    assert cache.get(description(1, sweeps=11)) is None
+    [(stored_description, stored)] = cache.entries(kind="realization")
+    assert stored_description == description(1)
+
+def test_seeded_realizations_are_read_back(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path))
+    arguments = (3, 12, PARAMS, 8)
+    first = realizations.run_realizations(*arguments, seed=9, workers=1,
+                                          backend="python", cache=cache)
+    assert len(cache.files()) == 3
+    again = realizations.run_realizations(*arguments, seed=9, workers=1,
+                                          backend="python", cache=cache)
+    assert len(cache.files()) == 3
+    for name in ("frequency", "isogloss"):
+        assert np.array_equal(first[name], again[name])
+
+def test_unseeded_realizations_are_not_cached(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path))
+    realizations.run_realizations(2, 5, PARAMS, 8, workers=1,
+                                  backend="python", cache=cache)
+    assert cache.files() == []
+
+def test_eviction_keeps_the_cache_under_its_size(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path))
+    result = {"frequency": np.zeros(1000)}
+    first = cache.put(description(0), result)
+    cache.max_bytes = 3*os.path.getsize(cache.path(first))
+    os.utime(cache.path(first), (0, 0))
+    for seed in range(1, 5):
+        cache.put(description(seed), result)
+    assert cache.size() <= cache.max_bytes
+    assert cache.estimated_bytes == cache.size()
+    assert cache.get(description(0)) is None
+    assert cache.get(description(4)) is not None
+
+def test_descriptions_of_a_fresh_seed_are_neither_stored_nor_found(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path))
+    fresh = description(None)
+    assert fresh["seed"] is None
+    assert cache.put(fresh, {"frequency": np.zeros(3)}) is None
+    assert cache.get(fresh) is None
+    assert cache.files() == []
+
+def test_substream_keys_match_the_seeds_of_the_realizations():
+    seeds = random_streams.seed_sequence(9)
+    stream = random_streams.substream(seeds, 2)
+    assert (result_cache.describe("realization", "serial", PARAMS, 8, 10, 9,
+                                  (2,))
+            == description(stream))
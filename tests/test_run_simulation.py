@@ -0,0 +1,16 @@
+import pytest
+import run_simulation
+
+@pytest.mark.parametrize("changes", [
+    {"backend": "fortran"},
+    {"engine": "loop", "plotting": {"gif": True, "enabled": True}},
+    {"engine": "serial", "plotting": {"gif": True, "enabled": False}},
+])
+def test_configs_that_cannot_run_are_rejected(model, changes):
+    with pytest.raises(ValueError):
+        run_simulation.resolve_config(changes)
+
+def test_gif_of_a_headless_loop_run_is_accepted(model):
+    config = run_simulation.resolve_config(
+        {"engine": "loop", "plotting": {"gif": True, "enabled": False}})
+    assert config["plotting"]["gif"]